@@ -7,28 +7,55 @@
 # Calculate gradient generater shape
 # Draw from calculate result
 import adsk.core, adsk.fusion, adsk.cam, traceback
+import itertools, os, time
+from .gradlib import cache, drc, emit, flow, instancing, layout, parametric, params, polygon, preview, profiling, rebuild, wafer
 # Globals
 _app = adsk.core.Application.cast(None)
 _ui = adsk.core.UserInterface.cast(None)
 _handlers = []
 
+# Rapid edits only refresh the flow report once per interval
+_debouncer = preview.Debouncer(0.05)
+
+# Stage geometry computed by earlier runs, kept beside the script
+_geometry_cache = cache.GeometryCache(path=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'geometry_cache.bin'))
+
+# Design rule reports by GradParams. The check takes 0.1 s or more, so it only runs when the
+# Check design rules button is pressed, edits show the report again when it is known.
+_design_rules = {}
+
+# Flow reports of networks above FLOW_LIVE_NODES by GradParams. Those take 0.2 s or more to
+# solve (9 s at 256 outputs), so edits do not solve them, Check design rules does.
+FLOW_LIVE_NODES = 2500
+_flow_reports = {}
+
+# Build timing, profiling.NULL unless the dialog switches it on for an execute
+_profiler = profiling.NULL
+_profile_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'build_profile.json')
+
 # Setting
 # Global variables are used to share input value between call back functions
-_input_num = adsk.core.ValueInput.cast(None)
-_output_num = adsk.core.ValueInput.cast(None)
-_channel_width = adsk.core.ValueInput.cast(None)
-_channel_height = adsk.core.ValueInput.cast(None)
-_resistor_width = adsk.core.ValueInput.cast(None)
-_resistor_num = adsk.core.ValueInput.cast(None)
-_resistor_radius = adsk.core.ValueInput.cast(None)
-_ladder_distance = adsk.core.ValueInput.cast(None)
-_ladder_width = adsk.core.ValueInput.cast(None)
+# Parameter inputs by gradlib.params field name
+_param_inputs = {}
+_build_mode = adsk.core.DropDownCommandInput.cast(None)
+_flow_report = adsk.core.TextBoxCommandInput.cast(None)
+_profile_build = adsk.core.BoolValueCommandInput.cast(None)
+_wafer_file = adsk.core.StringValueCommandInput.cast(None)
+_rebuild = adsk.core.BoolValueCommandInput.cast(None)
+_check_rules = adsk.core.BoolValueCommandInput.cast(None)
+
+# Build modes
+BUILD_PATTERN = 'Pattern per stage'
+BUILD_INSTANCED = 'Instanced channel'
+BUILD_MERGED = 'Merged outline'
+BUILD_PARAMETRIC = 'Parametric (user parameters)'
 
 def run(context):
     try:
         global _app, _ui
         _app = adsk.core.Application.get()
         _ui  = _app.userInterface
+        _geometry_cache.load()
 
         cmdDef = _ui.commandDefinitions.itemById('GradPythonScript')
         if not cmdDef:
@@ -79,18 +106,23 @@ class GradCommandCreateHandler(adsk.core.CommandCreatedEventHandler):
             cmd.isExecutedWhenPreEmpted = False
             inputs = cmd.commandInputs
 
-            global _input_num, _output_num, _channel_height, _channel_width, _resistor_width, _resistor_radius, _resistor_num, _ladder_distance, _ladder_width
+            global _build_mode, _flow_report, _profile_build, _wafer_file, _rebuild, _check_rules
 
             numTeeth = inputs.addStringValueInput('numTeeth', 'Number of Teeth', '0')
-            _input_num = inputs.addStringValueInput('input_num', 'Number of inputs', '2')
-            _output_num = inputs.addStringValueInput('output_num', 'Number of outputs', '5')
-            _channel_width = inputs.addStringValueInput('channel_width', 'Width of the channel (um)', '200')
-            _channel_height = inputs.addStringValueInput('channel_height', 'Height of the channel (um)', '200')
-            _resistor_width = inputs.addStringValueInput('resistor_width', 'Width of resistor structure (um)', '500')
-            _resistor_num = inputs.addStringValueInput('resistor_num', 'Number of resistor structure', '2')
-            _resistor_radius = inputs.addStringValueInput('resistor_radius', 'Radius of resistor structure (um)', '200')
-            _ladder_distance = inputs.addStringValueInput('ladder_distance', 'Distance between ladder steps', '1000')
-            _ladder_width = inputs.addStringValueInput('ladder_width', 'Width of ladder', '500')         
+            defaults = params.GradParams()
+            for name, label, unit, default, low, high in params.FIELDS:
+                _param_inputs[name] = inputs.addStringValueInput(name, label, str(getattr(defaults, name)))
+            _build_mode = inputs.addDropDownCommandInput('build_mode', 'Build mode', adsk.core.DropDownStyles.TextListDropDownStyle)
+            _build_mode.listItems.add(BUILD_PATTERN, True)
+            _build_mode.listItems.add(BUILD_INSTANCED, False)
+            _build_mode.listItems.add(BUILD_MERGED, False)
+            _build_mode.listItems.add(BUILD_PARAMETRIC, False)
+            _wafer_file = inputs.addStringValueInput('wafer_file', 'Wafer layout file (optional)', '')
+            _profile_build = inputs.addBoolValueInput('profile_build', 'Report build timing', True, '', False)
+            _rebuild = inputs.addBoolValueInput('rebuild', 'Update the last generator (changed stages only)', True, '', False)
+            _check_rules = inputs.addBoolValueInput('check_rules', 'Check design rules', False, '', False)
+            _flow_report = inputs.addTextBoxCommandInput('flow_report', 'Expected gradient', '', 4, True)
+            update_flow_report()
             
              # Connect to the command related events.
             onExecute = GradCommandExecuteHandler()
@@ -101,6 +133,10 @@ class GradCommandCreateHandler(adsk.core.CommandCreatedEventHandler):
             cmd.inputChanged.add(onInputChanged)
             _handlers.append(onInputChanged)     
             
+            onExecutePreview = GradCommandExecutePreviewHandler()
+            cmd.executePreview.add(onExecutePreview)
+            _handlers.append(onExecutePreview)
+
             onValidateInputs = GradCommandValidateInputsHandler()
             cmd.validateInputs.add(onValidateInputs)
             _handlers.append(onValidateInputs)
@@ -118,21 +154,34 @@ class GradCommandExecuteHandler(adsk.core.CommandEventHandler):
     def __init__(self):
         super().__init__()
     def notify(self, args):
+        global _profiler
         try:
             event_args = adsk.core.CommandEventArgs.cast(args)
             # Obtain design
             des = adsk.fusion.Design.cast(_app.activeProduct)
             
-            rad = int(_resistor_radius.value) / 10000
-            resistor_num = int(_resistor_num.value)
-            channel_width = int(_channel_width.value) / 10000
-            channel_height = int(_channel_height.value) / 10000
-            grad_gen = draw_grad_generator(des, int(_input_num.value), int(_output_num.value), rad,
-                                            resistor_num, channel_width, channel_height)
+            if _profile_build.value:
+                _profiler = profiling.Profiler()
+
+            if _wafer_file.value.strip():
+                draw_wafer(des, _wafer_file.value.strip(), _build_mode.selectedItem.name)
+            elif _rebuild.value:
+                grad_gen = draw_grad_generator(des, read_inputs(), _build_mode.selectedItem.name,
+                                               find_generator(des))
+            else:
+                grad_gen = draw_grad_generator(des, read_inputs(), _build_mode.selectedItem.name)
+            _geometry_cache.save()
+
+            if _profiler.enabled:
+                _log(_profiler.report())
+                _profiler.write_json(_profile_path)
+                _log('Build profile written to {}'.format(_profile_path))
 
         except:
             if _ui:
                 _ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
+        finally:
+            _profiler = profiling.NULL
 
 # Event handler for the inputChanged event.
 class GradCommandInputChangedHandler(adsk.core.InputChangedEventHandler):
@@ -140,7 +189,11 @@ class GradCommandInputChangedHandler(adsk.core.InputChangedEventHandler):
         super().__init__()
     def notify(self, args):
         try:
-            pass
+            event_args = adsk.core.InputChangedEventArgs.cast(args)
+            if event_args.input.id == 'check_rules':
+                check_design_rules()
+            elif event_args.input.id != 'flow_report' and _debouncer.ready():
+                update_flow_report()
         except:
             if _ui:
                 _ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
@@ -153,280 +206,492 @@ class GradCommandValidateInputsHandler(adsk.core.ValidateInputsEventHandler):
     def notify(self, args):
         try:
             eventArgs = adsk.core.ValidateInputsEventArgs.cast(args)
-            
-            
+            errors = validate_inputs()
+            eventArgs.areInputsValid = not errors
+            if errors:
+                _flow_report.text = '\n'.join(errors)
+        except:
+            if _ui:
+                _ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
+
+# Event handler for the executePreview event.
+class GradCommandExecutePreviewHandler(adsk.core.CommandEventHandler):
+    def __init__(self):
+        super().__init__()
+    def notify(self, args):
+        try:
+            start = time.perf_counter()
+            if _debouncer.flush():
+                update_flow_report()
+            values = read_inputs()
+            draw_preview(adsk.fusion.Design.cast(_app.activeProduct), values)
+            _flow_report.text += '\nPreview in {:.0f} ms'.format((time.perf_counter() - start) * 1000)
         except:
             if _ui:
                 _ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
 
-def draw_grad_generator(design, input_num: int, output_num: int, resistor_rad: float, resistor_numm: float,
-                        channel_width: float, channel_height: float):
+def read_inputs() -> params.GradParams:
+    # Dialog values as parameters. Raises ValueError for non-numeric input.
+    return params.GradParams.from_dict({name: inp.value for name, inp in _param_inputs.items()})
+
+def validate_inputs():
+    # Reasons the current inputs cannot be built, empty if they can
+    try:
+        values = read_inputs()
+    except ValueError as e:
+        return [str(e)]
+    return values.check()
+
+def draw_preview(design, values: params.GradParams):
+    # Centerline outline of the generator in a single sketch, rolled back by Fusion after the preview
+    table = preview.generator_outline(*values.layout_args())
+    root = design.rootComponent
+    emitter = emit.SketchEmitter(adsk.core.Point3D.create)
+    emitter.emit(root.sketches.add(root.xYConstructionPlane), table)
+
+def update_flow_report(solve_large: bool = False):
+    # Solve the channel network of the current inputs and show the outlet gradient. Networks above
+    # FLOW_LIVE_NODES are only solved with solve_large.
+    errors = validate_inputs()
+    if errors:
+        _flow_report.text = '\n'.join(errors)
+        return
+    values = read_inputs()
+    report = _flow_reports.get(values)
+    if report is None:
+        network = flow.build_network(values.input_num, values.output_num, values.resistor_radius_cm,
+                                     values.resistor_num, values.channel_width_cm, values.channel_height_cm,
+                                     values.ladder_width_cm, values.ladder_distance_cm, values.resistor_width_cm)
+        if network.node_count <= FLOW_LIVE_NODES:
+            report = flow.report(flow.solve(network))
+        elif solve_large:
+            report = _flow_reports[values] = flow.report(flow.solve(network))
+        else:
+            report = 'Flow: not solved, {} nodes (Check design rules solves it)'.format(network.node_count)
+    rules = _design_rules.get(values, 'Design rules: not checked')
+    _flow_report.text = report + '\n' + rules
+
+def check_design_rules():
+    # Run the design rule check of the current inputs once and show it with the flow report,
+    # solved whatever the size of the network
+    if validate_inputs():
+        return
+    values = read_inputs()
+    if values not in _design_rules:
+        _design_rules[values] = design_rule_report(values)
+    update_flow_report(solve_large=True)
+
+def design_rule_report(values: params.GradParams):
+    # Walls, channel widths and overlaps of the current inputs, see gradlib.drc
+    violations = drc.check(values.stages(cache=_geometry_cache))
+    if not violations:
+        return 'Design rules: ok'
+    return '\n'.join(['Design rules: {} violations'.format(len(violations))] + drc.summary(violations))
+
+def draw_grad_generator(design, values: params.GradParams, build_mode: str = BUILD_PATTERN, generator=None):
+    # Build a generator, or update generator (an occurrence built earlier, see find_generator):
+    # its stages whose spec did not change are kept, the others deleted and the missing ones built.
     try:
+        channel_height = values.channel_height_cm
+
         # Create a new component by creating an occurrence.
-        occs = design.rootComponent.occurrences
-        mat = adsk.core.Matrix3D.create()
-        newOcc = occs.addNewComponent(mat)        
-        newComp = adsk.fusion.Component.cast(newOcc.component)
-        
-        # Create a new sketch.
-        sketches = newComp.sketches
-        xyPlane = newComp.xYConstructionPlane
-        baseSketch = sketches.add(xyPlane)
-        baseSketch.isComputeDeferred = True
-        # Draw a circle for the base.
-        original_point = adsk.core.Point3D.create(0, 0, 0)
-        for i in range(input_num+1, output_num+1):
-            original_point = draw_grad_stage(sketches, xyPlane, occs, original_point, i, 0.5, 0.5, channel_width, channel_height, resistor_numm, resistor_rad, 0.3)
-
-        baseSketch.isComputeDeferred = False
+        if generator is None:
+            with _profiler.span('component'):
+                occs = design.rootComponent.occurrences
+                mat = adsk.core.Matrix3D.create()
+                newOcc = occs.addNewComponent(mat)
+                newComp = adsk.fusion.Component.cast(newOcc.component)
+
+            # Create a new sketch.
+            sketches = newComp.sketches
+            xyPlane = newComp.xYConstructionPlane
+            baseSketch = sketches.add(xyPlane)
+            baseSketch.isComputeDeferred = True
+            _profiler.count('features')
+        else:
+            newOcc = generator
+            newComp = adsk.fusion.Component.cast(newOcc.component)
+            baseSketch = None
+        newOcc.attributes.add(rebuild.GROUP, rebuild.GENERATOR, rebuild.generator_spec(values, build_mode))
+        # Stages are occurrences of the generator component
+        occs = newComp.occurrences
+
+        # Calculate the whole generator first, then draw it stage by stage
+        with _profiler.span('layout'):
+            stages = values.stages(cache=_geometry_cache)
+        _log('Geometry cache: {}'.format(_geometry_cache.stats))
+
+        # Stages that are already there, only when updating
+        specs = [rebuild.stage_spec(values, stage, build_mode) for stage in stages]
+        diff = rebuild.diff_stages(stage_occurrences(newComp), specs)
+        with _profiler.span('delete'):
+            for stageOcc in diff.delete:
+                stageOcc.deleteMe()
+        if generator is not None:
+            _log('Rebuild: {} stages kept, {} deleted, {} built'.format(len(diff.keep), len(diff.delete),
+                                                                        len(diff.build)))
+        build = set(diff.build)
+
+        emitter = emit.SketchEmitter(adsk.core.Point3D.create)
+        if build_mode == BUILD_INSTANCED and stages:
+            # Sketch and extrude the serpentine channel once, place it everywhere else
+            template_table = instancing.channel_template(stages)
+            placements = itertools.groupby(instancing.channel_placements(stages), lambda p: p.unit_num)
+            # An update places the template of a kept stage, a stage of the same spec has the same channel
+            template = find_template(stageOcc for stageOcc, index in diff.keep)
+            reused = template is not None
+            for index, (stage, (unit_num, stage_placements)) in enumerate(zip(stages, placements)):
+                if index not in build:
+                    continue
+                with _profiler.span('stage', stage.unit_num):
+                    stageOcc, template = draw_instanced_stage(occs, stage, channel_height, emitter,
+                                                              template_table, list(stage_placements), template)
+                tag_stage(stageOcc, specs[index])
+            built = [stages[index] for index in sorted(build)]
+            _log('Instanced channel: {} features saved'.format(instancing.features_saved(built, not reused)))
+        elif build_mode == BUILD_MERGED:
+            for index, stage in enumerate(stages):
+                if index in build:
+                    with _profiler.span('stage', stage.unit_num):
+                        tag_stage(draw_merged_stage(occs, stage, channel_height, emitter), specs[index])
+        elif build_mode == BUILD_PARAMETRIC:
+            # Stages like the pattern mode, with the extrudes and patterns driven by user parameters
+            parameters = parameter_set(design, newOcc)
+            set_user_parameters(design, values, parameters)
+            for index, stage in enumerate(stages):
+                if index in build:
+                    with _profiler.span('stage', stage.unit_num):
+                        tag_stage(draw_grad_stage(occs, stage, channel_height, emitter, parameters), specs[index])
+        else:
+            for index, stage in enumerate(stages):
+                if index in build:
+                    with _profiler.span('stage', stage.unit_num):
+                        tag_stage(draw_grad_stage(occs, stage, channel_height, emitter), specs[index])
+
+        if baseSketch:
+            with _profiler.span('solve'):
+                baseSketch.isComputeDeferred = False
+        _log('Sketch emission: {}'.format(emitter.stats))
+        return newOcc
     except:
         if _ui:
             _ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
 
-def draw_grad_stage(sketches, plane, occs,
-                     original_point, unit_num: int,
-                     connect_width: float, height: float,
-                     channel_width: float, channel_height: float,
-                     curve_num: int, curve_rad: float, resistor_width: float):
+def find_generator(design):
+    # Last generator occurrence of the design, None if there is none
+    occs = design.rootComponent.occurrences
+    for i in reversed(range(occs.count)):
+        occ = occs.item(i)
+        if occ.attributes.itemByName(rebuild.GROUP, rebuild.GENERATOR):
+            return occ
+    return None
+
+def stage_occurrences(comp):
+    # (occurrence, stage spec) of the tagged stages of a generator component
+    found = []
+    for i in range(comp.occurrences.count):
+        occ = comp.occurrences.item(i)
+        attribute = occ.attributes.itemByName(rebuild.GROUP, rebuild.STAGE)
+        if attribute:
+            found.append((occ, attribute.value))
+    return found
+
+def tag_stage(occ, spec: str):
+    occ.attributes.add(rebuild.GROUP, rebuild.STAGE, spec)
+
+def find_template(stage_occs):
+    # Channel template component placed in one of the stage occurrences, None if there is none
+    for stageOcc in stage_occs:
+        occs = adsk.fusion.Component.cast(stageOcc.component).occurrences
+        for i in range(occs.count):
+            channel = adsk.fusion.Component.cast(occs.item(i).component)
+            if channel.attributes.itemByName(rebuild.GROUP, rebuild.TEMPLATE):
+                return channel
+    return None
+
+def draw_wafer(design, path: str, build_mode: str = BUILD_PATTERN):
+    # Every distinct chip of the wafer file (see gradlib/wafer.py) is built once at its first
+    # position, the other chips with the same parameters are occurrences of its component.
+    # The layouts are computed here through the geometry cache, python -m gradlib.wafer computes
+    # them in a process pool instead, which Fusion's embedded Python cannot start.
+    chips = wafer.read_wafer(path, read_inputs())
+    specs = wafer.unique_specs(chips)
+    errors = wafer.check_specs(specs)
+    if errors:
+        _ui.messageBox('Cannot build the wafer:\n{}'.format('\n'.join(errors)))
+        return
+    occs = design.rootComponent.occurrences
+    for spec, positions in specs.items():
+        with _profiler.span('chip'):
+            chipOcc = draw_grad_generator(design, spec, build_mode)
+        if chipOcc is None:
+            return
+        x, y = positions[0]
+        chipOcc.transform = translation(x, y)
+        with _profiler.span('occurrence'):
+            for x, y in positions[1:]:
+                occs.addExistingComponent(chipOcc.component, translation(x, y))
+    _log('Wafer: {} chips from {} designs'.format(len(chips), len(specs)))
+
+def translation(x: float, y: float):
+    mat = adsk.core.Matrix3D.create()
+    mat.translation = adsk.core.Vector3D.create(x, y, 0)
+    return mat
+
+def draw_grad_stage(occs, stage: layout.StageLayout, channel_height: float, emitter: emit.SketchEmitter,
+                    parameters: int = None):
+    # parameters is the number of the user parameters that drive the extrudes, the pattern and the
+    # connecting channel (see set_user_parameters), None builds with plain values
 
     # Draw connecting channel
-    mat = adsk.core.Matrix3D.create()
-    newOcc = occs.addNewComponent(mat)        
-    comp = adsk.fusion.Component.cast(newOcc.component)
+    with _profiler.span('component'):
+        mat = adsk.core.Matrix3D.create()
+        newOcc = occs.addNewComponent(mat)        
+        comp = adsk.fusion.Component.cast(newOcc.component)
     sketches = comp.sketches
     plane = comp.xYConstructionPlane
-    
-    left_end = adsk.core.Point3D.create(original_point.x - (unit_num - 1) * connect_width/2, original_point.y, original_point.z)
-    right_end = adsk.core.Point3D.create(original_point.x - (unit_num - 2) * connect_width/2, original_point.y + channel_width, original_point.z)
-    #connecting.addTwoPointRectangle(left_end, right_end)
 
-    sketch = draw_single_grad(sketches, plane, comp, left_end,
-                     connect_width, height,
-                     channel_width, curve_num,
-                     curve_rad, resistor_width)
+    # Serpentine channel and connecting channel, each in its own deferred sketch
+    with _profiler.span('sketch'):
+        stage_sketches = emit_counted(emitter, lambda: emitter.emit_grouped(lambda: sketches.add(plane), stage.template),
+                                      stage.template)
+    sketch = stage_sketches[emit.SKETCH_OF_PROFILE[layout.PROFILE_RESISTOR]]
 
     extrudes = comp.features.extrudeFeatures
     
-    prof = sketch.profiles.item(0)
-    ext_input = extrudes.createInput(prof, adsk.fusion.FeatureOperations.NewBodyFeatureOperation)
-    distance = adsk.core.ValueInput.createByReal(channel_height)
-    ext_input.setDistanceExtent(False, distance)
-    channel_extrude = extrudes.add(ext_input)
-
-    prof = sketch.profiles.item(1)
-    ext_input = extrudes.createInput(prof, adsk.fusion.FeatureOperations.NewBodyFeatureOperation)
-    distance = adsk.core.ValueInput.createByReal(channel_height)
-    ext_input.setDistanceExtent(False, distance)
-    channel_extrude = extrudes.add(ext_input)
-
-    prof = sketch.profiles.item(2)
-    ext_input = extrudes.createInput(prof, adsk.fusion.FeatureOperations.NewBodyFeatureOperation)
-    distance = adsk.core.ValueInput.createByReal(channel_height)
-    ext_input.setDistanceExtent(False, distance)
-    channel_extrude = extrudes.add(ext_input)
-
-    # Create input entities for ractangular pattern
-    input_entities = adsk.core.ObjectCollection.create()
-
-    # Get the body created by extrusion
-    for i in range(extrudes.count):
-
-        body = extrudes.item(i)
-
-        input_entities.add(body)
-
-    x_axis = comp.xConstructionAxis
-    y_axis = comp.yConstructionAxis
-
-    # Quantity and distance for rect pattern
+    with _profiler.span('extrude'):
+        prof = sketch.profiles.item(0)
+        ext_input = extrudes.createInput(prof, adsk.fusion.FeatureOperations.NewBodyFeatureOperation)
+        distance = extrude_distance(channel_height, parameters)
+        ext_input.setDistanceExtent(False, distance)
+        channel_extrude = extrudes.add(ext_input)
+
+        prof = sketch.profiles.item(1)
+        ext_input = extrudes.createInput(prof, adsk.fusion.FeatureOperations.NewBodyFeatureOperation)
+        distance = extrude_distance(channel_height, parameters)
+        ext_input.setDistanceExtent(False, distance)
+        channel_extrude = extrudes.add(ext_input)
+
+        prof = sketch.profiles.item(2)
+        ext_input = extrudes.createInput(prof, adsk.fusion.FeatureOperations.NewBodyFeatureOperation)
+        distance = extrude_distance(channel_height, parameters)
+        ext_input.setDistanceExtent(False, distance)
+        channel_extrude = extrudes.add(ext_input)
+    _profiler.count('profiles', 3)
+
+    with _profiler.span('pattern'):
+        # Create input entities for ractangular pattern
+        input_entities = adsk.core.ObjectCollection.create()
+
+        # Get the body created by extrusion
+        for i in range(extrudes.count):
+
+            body = extrudes.item(i)
+
+            input_entities.add(body)
+
+        x_axis = comp.xConstructionAxis
+        y_axis = comp.yConstructionAxis
+
+        # Quantity and distance for rect pattern
+
+        quantity_one = adsk.core.ValueInput.createByString('{}'.format(stage.copies))
+        if parameters is not None:
+            distance_one = adsk.core.ValueInput.createByString(
+                parametric.parameter_name(parametric.PATTERN_SPACING, parameters))
+        else:
+            distance_one = adsk.core.ValueInput.createByReal(stage.pitch)
+        quantity_two = adsk.core.ValueInput.createByString('{}'.format(1))
+        distance_two = adsk.core.ValueInput.createByReal(0)
+
+        # Create the input for rectangular pattern
+        rectangular_pattern = comp.features.rectangularPatternFeatures
+        rectangular_pattern_input = rectangular_pattern.createInput(input_entities, x_axis, quantity_one, distance_one,
+                                                                    adsk.fusion.PatternDistanceType.SpacingPatternDistanceType)
+        
+        # Set the data for second direction
+        rectangular_pattern_input.setDirectionTwo(y_axis, quantity_two, distance_two)
+
+        #Create the rectangular pattern
+        rectangula_feature = rectangular_pattern.add(rectangular_pattern_input)
+
+    sketch = stage_sketches[emit.SKETCH_OF_PROFILE[layout.PROFILE_CONNECT]]
+    if parameters is not None:
+        with _profiler.span('dimension'):
+            dimension_connect(sketch, stage.unit_num, parameters)
+    with _profiler.span('extrude'):
+        prof = sketch.profiles.item(0)
+        ext_input = extrudes.createInput(prof, adsk.fusion.FeatureOperations.NewBodyFeatureOperation)
+        distance = extrude_distance(channel_height, parameters)
+        ext_input.setDistanceExtent(False, distance)
+        channel_extrude = extrudes.add(ext_input)
+    _profiler.count('profiles')
+    if parameters is not None:
+        with _profiler.span('move'):
+            centre_stage(comp, stage, parameters)
+    count_features(comp)
+
+    return newOcc
+
+def draw_instanced_stage(occs, stage: layout.StageLayout, channel_height: float, emitter: emit.SketchEmitter,
+                         template_table: layout.PrimitiveTable, placements, template=None):
+    # Stage whose serpentine channels are occurrences of one shared template component.
+    # The template is created at the first placement if it does not exist yet.
+    with _profiler.span('component'):
+        mat = adsk.core.Matrix3D.create()
+        newOcc = occs.addNewComponent(mat)
+        comp = adsk.fusion.Component.cast(newOcc.component)
+    sketches = comp.sketches
+    plane = comp.xYConstructionPlane
 
-    quantity_one = adsk.core.ValueInput.createByString('{}'.format(unit_num))
-    distance_one = adsk.core.ValueInput.createByReal(connect_width)
-    quantity_two = adsk.core.ValueInput.createByString('{}'.format(1))
-    distance_two = adsk.core.ValueInput.createByReal(0)
+    for placement in placements:
+        mat = adsk.core.Matrix3D.create()
+        mat.translation = adsk.core.Vector3D.create(placement.dx, placement.dy, 0)
+        if template is None:
+            with _profiler.span('component'):
+                channelOcc = comp.occurrences.addNewComponent(mat)
+                template = adsk.fusion.Component.cast(channelOcc.component)
+                template.attributes.add(rebuild.GROUP, rebuild.TEMPLATE, 'channel')
+            draw_channel_template(template, template_table, channel_height, emitter)
+        else:
+            with _profiler.span('occurrence'):
+                comp.occurrences.addExistingComponent(template, mat)
+            _profiler.count('occurrences')
+
+    # Connecting channel
+    table = stage.template.select((layout.PROFILE_CONNECT,))
+    with _profiler.span('sketch'):
+        sketch = emit_counted(emitter, lambda: emitter.emit(sketches.add(plane), table), table)
+    with _profiler.span('extrude'):
+        extrude_profile(comp.features.extrudeFeatures, sketch.profiles.item(0), channel_height)
+    _profiler.count('profiles')
+    count_features(comp)
+
+    return newOcc, template
+
+def draw_merged_stage(occs, stage: layout.StageLayout, channel_height: float, emitter: emit.SketchEmitter):
+    # Stage drawn as its merged channel region (computed by gradlib.polygon) and extruded once.
+    # Arcs are tessellated, see polygon.DEFAULT_TOLERANCE.
+    with _profiler.span('component'):
+        mat = adsk.core.Matrix3D.create()
+        newOcc = occs.addNewComponent(mat)
+        comp = adsk.fusion.Component.cast(newOcc.component)
+
+    with _profiler.span('union'):
+        loops = polygon.stage_outline(stage)
+        table = polygon.outline_table(loops, stage.unit_num)
+    with _profiler.span('sketch'):
+        sketch = emit_counted(emitter, lambda: emitter.emit(comp.sketches.add(comp.xYConstructionPlane), table), table)
+
+    # Pick the profiles by their extent instead of their index, holes are left out
+    with _profiler.span('profiles'):
+        regions = polygon.outer_bounds(loops)
+        profiles = adsk.core.ObjectCollection.create()
+        for prof in sketch.profiles:
+            box = prof.boundingBox
+            extent = (box.minPoint.x, box.minPoint.y, box.maxPoint.x, box.maxPoint.y)
+            if any(all(abs(a - b) < 1e-6 for a, b in zip(extent, region)) for region in regions):
+                profiles.add(prof)
+    _profiler.count('profiles', profiles.count)
+    with _profiler.span('extrude'):
+        extrude_profile(comp.features.extrudeFeatures, profiles, channel_height)
+    count_features(comp)
+    return newOcc
+
+def draw_channel_template(comp, table: layout.PrimitiveTable, channel_height: float, emitter: emit.SketchEmitter):
+    # Inlet, resistor and outlet of a single serpentine channel, extruded in comp
+    with _profiler.span('sketch'):
+        sketch = emit_counted(emitter, lambda: emitter.emit(comp.sketches.add(comp.xYConstructionPlane), table), table)
+    extrudes = comp.features.extrudeFeatures
+    with _profiler.span('extrude'):
+        for i in range(len(layout.CHANNEL_PROFILES)):
+            extrude_profile(extrudes, sketch.profiles.item(i), channel_height)
+    _profiler.count('profiles', len(layout.CHANNEL_PROFILES))
+    count_features(comp)
 
-    # Create the input for rectangular pattern
-    rectangular_pattern = comp.features.rectangularPatternFeatures
-    rectangular_pattern_input = rectangular_pattern.createInput(input_entities, x_axis, quantity_one, distance_one,
-                                                                adsk.fusion.PatternDistanceType.SpacingPatternDistanceType)
-    
-    # Set the data for second direction
-    rectangular_pattern_input.setDirectionTwo(y_axis, quantity_two, distance_two)
-
-    #Create the rectangular pattern
-    rectangula_feature = rectangular_pattern.add(rectangular_pattern_input)
-    rectangular_pattern.itemByName
-    for i in range(1, unit_num-1):
-        #left_end = adsk.core.Point3D.create(original_point.x - (unit_num  - 2 * i) * connect_width/2, original_point.y, original_point.z)
-        right_end = adsk.core.Point3D.create(original_point.x - (unit_num - 2 * (i + 1)) * connect_width/2, original_point.y + channel_width, original_point.z)
-        #connecting.addTwoPointRectangle(left_end, right_end)
-        single_original = adsk.core.Point3D.create(left_end.x + connect_width/2, left_end.y, left_end.z)
-    
-    #left_end = adsk.core.Point3D.create(original_point.x + (unit_num -2) * connect_width/2, original_point.y , original_point.z)
-    sketch = sketches.add(plane)
-    connecting = sketch.sketchCurves.sketchLines
-    right_end = adsk.core.Point3D.create(original_point.x + (unit_num - 1) * connect_width/2, original_point.y + channel_width, original_point.z)
-    connecting.addTwoPointRectangle(left_end, right_end)
-    prof = sketch.profiles.item(0)
+def extrude_profile(extrudes, prof, channel_height: float):
     ext_input = extrudes.createInput(prof, adsk.fusion.FeatureOperations.NewBodyFeatureOperation)
     distance = adsk.core.ValueInput.createByReal(channel_height)
     ext_input.setDistanceExtent(False, distance)
-    channel_extrude = extrudes.add(ext_input)
-
-    return adsk.core.Point3D.create(original_point.x, original_point.y + height, original_point.z)
-
-def draw_single_grad(sketches, plane,
-                     comp, original_point,
-                     connect_width: float, height: float,
-                     channel_width: float, curve_num: int,
-                     curve_rad: float, resistor_width: float):
-    
-
-    # Draw connecting channel
-    sketch = sketches.add(plane)
-    
-    # Draw resistor part
-    # - Straight part
-    channel = sketch.sketchCurves
-    straight_len = (height - (curve_rad * 4 * curve_num))/2
-    top_left = adsk.core.Point3D.create(original_point.x - channel_width/2, original_point.y, original_point.z)
-    bottom_right = adsk.core.Point3D.create(original_point.x + channel_width/2, original_point.y + straight_len, original_point.z)
-    channel.sketchLines.addTwoPointRectangle(top_left, bottom_right)
-
-    resistor_org = adsk.core.Point3D.create(original_point.x,
-                                            original_point.y + straight_len,
-                                            original_point.z)
-
-    start_top = adsk.core.Point3D.create(original_point.x - channel_width/2, original_point.y+straight_len, original_point.z)
-    start_bottom = adsk.core.Point3D.create(original_point.x - channel_width/2, original_point.y+straight_len+channel_width, original_point.z)
-    channel.sketchLines.addByTwoPoints(start_top, start_bottom)
-
-    for i in range(0, curve_num):
-        resistor_org = gen_resistor_part(channel, resistor_org, channel_width, curve_num,
-                      curve_rad, resistor_width)
-    end_top = adsk.core.Point3D.create(resistor_org.x-channel_width/2, resistor_org.y, original_point.z)
-    end_bottom = adsk.core.Point3D.create(resistor_org.x-channel_width/2, resistor_org.y+channel_width, original_point.z)
-    channel.sketchLines.addByTwoPoints(end_top, end_bottom)
-    
-    top_left = adsk.core.Point3D.create(resistor_org.x - channel_width/2,
-                                        resistor_org.y,
-                                        original_point.z)
-    bottom_right = adsk.core.Point3D.create(resistor_org.x + channel_width/2,
-                                            resistor_org.y + straight_len,
-                                            original_point.z)
-    channel.sketchLines.addTwoPointRectangle(top_left, bottom_right)
-
-    return sketch
-
-def gen_resistor_part(channel, original_point,
-                      channel_width: float, curve_num: int,
-                      curve_rad: float, resistor_width: float) -> adsk.core.Point3D:
-    
-
-    # - Curve part
-    top_left = adsk.core.Point3D.create(original_point.x - channel_width/2, 
-                                        original_point.y, 
-                                        original_point.z)
-
-    top_right = adsk.core.Point3D.create(original_point.x + resistor_width/2, 
-                                        original_point.y, 
-                                        original_point.z)
-    
-    bottom_left = adsk.core.Point3D.create(original_point.x - channel_width/2,
-                                            original_point.y + channel_width, 
-                                            original_point.z)
-
-    bottom_right = adsk.core.Point3D.create(original_point.x + resistor_width/2,
-                                            original_point.y + channel_width, 
-                                            original_point.z)
-
-    channel.sketchLines.addByTwoPoints(top_left, top_right)
-    channel.sketchLines.addByTwoPoints(bottom_left, bottom_right)
-    
-
-    #channel.sketchLines.addTwoPointRectangle(top_left, bottom_right)
-
-    # -- Outer arc
-    curve_start = adsk.core.Point3D.create(bottom_right.x, top_left.y, top_left.z)
-    midPoint = adsk.core.Point3D.create(bottom_right.x + curve_rad + channel_width /2,
-                                        top_left.y + channel_width/2 + curve_rad, 
-                                        bottom_right.z)
-    curve_end = adsk.core.Point3D.create(bottom_right.x, 
-                                         top_left.y + curve_rad * 2 + channel_width, 
-                                         top_left.z)
-    channel.sketchArcs.addByThreePoints(curve_start, midPoint, curve_end)
-
-    # -- Inner arc
-    curve_start = adsk.core.Point3D.create(bottom_right.x,
-                                           top_left.y + channel_width,
-                                           top_left.z)
-    midPoint = adsk.core.Point3D.create(bottom_right.x + curve_rad - channel_width /2,
-                                        top_left.y + channel_width/2 + curve_rad,
-                                        bottom_right.z)
-    curve_end = adsk.core.Point3D.create(bottom_right.x, 
-                                         top_left.y + curve_rad  * 2,
-                                         top_left.z)
-    channel.sketchArcs.addByThreePoints(curve_start, midPoint, curve_end)
-
-    bottom_left = adsk.core.Point3D.create(curve_end.x-resistor_width, 
-                                        curve_end.y, 
-                                        original_point.z)
-    
-    top_left = adsk.core.Point3D.create(curve_end.x - resistor_width, 
-                                        curve_end.y + channel_width, 
-                                        original_point.z)
-
-    top_right = adsk.core.Point3D.create(curve_end.x, 
-                                        curve_end.y + channel_width, 
-                                        original_point.z)
-    
-    channel.sketchLines.addByTwoPoints(top_left, top_right)
-    channel.sketchLines.addByTwoPoints(curve_end, bottom_left)
-    #channel.sketchLines.addTwoPointRectangle(top_left, curve_end)
-
-    # -- Outer arc
-    curve_start = adsk.core.Point3D.create(top_left.x,
-                                           top_left.y - channel_width,
-                                           top_left.z)
-    midPoint = adsk.core.Point3D.create(top_left.x - curve_rad - channel_width/2,
-                                        top_left.y + curve_rad - channel_width/2, 
-                                        top_left.z)
-    curve_end = adsk.core.Point3D.create(top_left.x, top_left.y + curve_rad*2)
-    channel.sketchArcs.addByThreePoints(curve_start, midPoint, curve_end)
-
-    # -- Inner arc
-    curve_start = adsk.core.Point3D.create(top_left.x,
-                                           top_left.y,
-                                           top_left.z)
-    midPoint = adsk.core.Point3D.create(top_left.x - curve_rad + channel_width/2,
-                                        top_left.y + curve_rad - channel_width/2, 
-                                        top_left.z)
-    curve_end = adsk.core.Point3D.create(top_left.x, top_left.y + curve_rad*2 - channel_width)
-    channel.sketchArcs.addByThreePoints(curve_start, midPoint, curve_end)
-
-    bottom_right = adsk.core.Point3D.create(curve_end.x + resistor_width/2-channel_width/2,
-                                            curve_end.y, 
-                                            original_point.z)
-    
-    bottom_left = adsk.core.Point3D.create(curve_end.x,
-                                        curve_end.y, 
-                                        original_point.z)
-
-
-    top_right = adsk.core.Point3D.create(curve_end.x + resistor_width/2-channel_width/2, 
-                                        curve_end.y + channel_width, 
-                                        original_point.z) 
-
-    
-    
-    top_left = adsk.core.Point3D.create(curve_end.x, 
-                                        curve_end.y + channel_width, 
-                                        original_point.z)
-
-    channel.sketchLines.addByTwoPoints(top_left, top_right)
-    channel.sketchLines.addByTwoPoints(bottom_right, bottom_left)    
-    #channel.sketchLines.addTwoPointRectangle(top_left, bottom_right)
-    new_org = bottom_right = adsk.core.Point3D.create(curve_end.x + resistor_width/2,
-                                            curve_end.y, 
-                                            original_point.z)
-    return new_org
+    return extrudes.add(ext_input)
+
+def extrude_distance(channel_height: float, parameters: int = None):
+    if parameters is not None:
+        return adsk.core.ValueInput.createByString(parametric.parameter_name(parametric.EXTRUDE_DISTANCE, parameters))
+    return adsk.core.ValueInput.createByReal(channel_height)
+
+def parameter_set(design, occ):
+    # Number of the user parameters of generator occurrence occ, a free one if it has none yet
+    attribute = occ.attributes.itemByName(rebuild.GROUP, rebuild.PARAMETERS)
+    if attribute:
+        return int(attribute.value)
+    user_params = design.userParameters
+    parameters = parametric.free_generator(lambda name: user_params.itemByName(name) is not None)
+    occ.attributes.add(rebuild.GROUP, rebuild.PARAMETERS, str(parameters))
+    return parameters
+
+def set_user_parameters(design, values: params.GradParams, parameters: int):
+    # Create the user parameters of a parametric generator, or update them if they exist
+    user_params = design.userParameters
+    for name, expression, unit, comment in parametric.user_parameters(values, parameters):
+        param = user_params.itemByName(name)
+        if param:
+            # Every edit recomputes what uses the parameter, even without a change
+            if param.expression != expression:
+                param.expression = expression
+        else:
+            user_params.add(name, adsk.core.ValueInput.createByString(expression), unit, comment)
+
+def dimension_connect(sketch, unit_num: int, parameters: int):
+    # Keep the connecting channel a rectangle anchored at its left end and drive its length by
+    # the ladder width, so it follows the pattern spacing of the serpentine channels. centre_stage
+    # moves it back to the centre of the stage.
+    lines = sketch.sketchCurves.sketchLines
+    bottom, right, top, left = (lines.item(i) for i in range(4))
+    constraints = sketch.geometricConstraints
+    constraints.addHorizontal(bottom)
+    constraints.addHorizontal(top)
+    constraints.addVertical(right)
+    left.startSketchPoint.isFixed = True
+    left.endSketchPoint.isFixed = True
+    start, end = bottom.startSketchPoint, bottom.endSketchPoint
+    text_point = adsk.core.Point3D.create((start.geometry.x + end.geometry.x) / 2, start.geometry.y - 0.05, 0)
+    dimension = sketch.sketchDimensions.addDistanceDimension(
+        start, end, adsk.fusion.DimensionOrientations.HorizontalDimensionOrientation, text_point)
+    dimension.parameter.expression = parametric.connect_length(unit_num, parameters)
+
+def centre_stage(comp, stage: layout.StageLayout, parameters: int):
+    # Move every body of the stage so that it stays centred when the ladder width is edited,
+    # a translation of zero at the ladder width it was built with
+    bodies = adsk.core.ObjectCollection.create()
+    for i in range(comp.bRepBodies.count):
+        bodies.add(comp.bRepBodies.item(i))
+    ladder_width = round(stage.pitch * params.UM_PER_CM, 3)
+    moves = comp.features.moveFeatures
+    move_input = moves.createInput2(bodies)
+    move_input.defineAsTranslateXYZ(
+        adsk.core.ValueInput.createByString(parametric.centre_shift(stage.unit_num, ladder_width, parameters)),
+        adsk.core.ValueInput.createByReal(0), adsk.core.ValueInput.createByReal(0), True)
+    moves.add(move_input)
+
+def emit_counted(emitter: emit.SketchEmitter, draw, table: layout.PrimitiveTable):
+    # Run draw (an emit call of emitter) and count the sketch entities it made
+    result = draw()
+    _profiler.count('sketch_entities', len(table))
+    return result
+
+def count_features(comp):
+    # Count the timeline features (sketches, extrudes, patterns) and bodies of a finished component
+    if _profiler.enabled:
+        features = comp.features
+        _profiler.count('features', comp.sketches.count + features.extrudeFeatures.count +
+                        features.rectangularPatternFeatures.count + features.moveFeatures.count)
+        _profiler.count('bodies', comp.bRepBodies.count)
+
+def _log(text: str):
+    # Write a line to the Text Commands palette, if it is available
+    if not _ui:
+        return
+    palette = _ui.palettes.itemById('TextCommands')
+    if palette:
+        palette.writeText(text)
@@ -0,0 +1,2 @@
+# Pure-python helpers for the gradient generator script.
+# Nothing in this package imports adsk, so it can be used (and tested) outside Fusion 360.
@@ -0,0 +1,88 @@
+# Circular arcs as center, radius, start angle and signed sweep.
+# The layout stores arcs by three points, which is what Fusion's addByThreePoints takes. Everything
+# else (exporters, polygon union, channel lengths) works on Arc. Tessellation only depends on
+# radius, sweep and tolerance, and a generator only has a few distinct radii (curve_rad and
+# curve_rad +- channel_width / 2), so the rotations are memoized and a tessellated turn only costs
+# one rotation and scaling per point.
+import math
+from functools import lru_cache
+
+# Radius (cm) and sweep (radians) are rounded to this many decimals for the memo key
+KEY_DIGITS = 9
+
+
+class Arc:
+    __slots__ = ('cx', 'cy', 'radius', 'start', 'sweep')
+
+    def __init__(self, cx: float, cy: float, radius: float, start: float, sweep: float):
+        # Angles in radians, sweep is positive for counter clockwise arcs
+        self.cx = cx
+        self.cy = cy
+        self.radius = radius
+        self.start = start
+        self.sweep = sweep
+
+    @classmethod
+    def from_points(cls, x0: float, y0: float, xm: float, ym: float, x1: float, y1: float):
+        # Arc from (x0, y0) through (xm, ym) to (x1, y1)
+        # Solved relative to the start point, which keeps the center exact to the size of the arc
+        # instead of its distance from the origin
+        ax, ay = xm - x0, ym - y0
+        bx, by = x1 - x0, y1 - y0
+        d = 2 * (ax * by - ay * bx)
+        if d == 0:
+            raise ValueError('Arc points are collinear')
+        sa = ax * ax + ay * ay
+        sb = bx * bx + by * by
+        cx = x0 + (by * sa - ay * sb) / d
+        cy = y0 + (ax * sb - bx * sa) / d
+        start = math.atan2(y0 - cy, x0 - cx)
+        end = math.atan2(y1 - cy, x1 - cx)
+        ccw = (xm - x0) * (y1 - y0) - (ym - y0) * (x1 - x0) > 0
+        sweep = (end - start) % (2 * math.pi)
+        if not ccw:
+            sweep -= 2 * math.pi
+        return cls(cx, cy, math.hypot(x0 - cx, y0 - cy), start, sweep)
+
+    @property
+    def end(self) -> float:
+        return self.start + self.sweep
+
+    @property
+    def length(self) -> float:
+        return arc_length(self.radius, self.sweep)
+
+    def point(self, angle: float):
+        return self.cx + self.radius * math.cos(angle), self.cy + self.radius * math.sin(angle)
+
+    def tessellate(self, tolerance: float):
+        # Points along the arc, start excluded and end included, no chord further than tolerance from the arc
+        cx, cy, r = self.cx, self.cy, self.radius
+        cos_start, sin_start = math.cos(self.start), math.sin(self.start)
+        x = r * cos_start
+        y = r * sin_start
+        return [(cx + x * c - y * s, cy + x * s + y * c)
+                for c, s in rotations(round(r, KEY_DIGITS), round(self.sweep, KEY_DIGITS), tolerance)]
+
+    def __repr__(self):
+        return 'Arc({}, {}, {}, {}, {})'.format(self.cx, self.cy, self.radius, self.start, self.sweep)
+
+
+def arc_length(radius: float, sweep: float) -> float:
+    return abs(sweep) * radius
+
+
+def segment_count(radius: float, sweep: float, tolerance: float) -> int:
+    # Chords needed so that none is further than tolerance from the arc, at least 2
+    if tolerance >= radius:
+        step = math.pi / 2
+    else:
+        step = 2 * math.acos(1 - tolerance / radius)
+    return max(2, int(math.ceil(abs(sweep) / step)))
+
+
+@lru_cache(maxsize=1024)
+def rotations(radius: float, sweep: float, tolerance: float):
+    # (cos, sin) of the angle of every tessellation point past the start, see Arc.tessellate
+    count = segment_count(radius, sweep, tolerance)
+    return tuple((math.cos(sweep * i / count), math.sin(sweep * i / count)) for i in range(1, count + 1))
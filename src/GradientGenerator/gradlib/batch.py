@@ -0,0 +1,167 @@
+# Headless design space sweep.
+# Computes the layout of every combination of a parameter grid in a process pool and writes the
+# derived metrics (metrics.csv) and the geometry (geometry-NNNNN.bin) to an output directory,
+# one chunk of variants at a time so memory use does not grow with the size of the grid.
+#
+# Usage, from the GradientGenerator directory:
+#   python -m gradlib.batch grid.json -o sweep_out
+#
+# grid.json is either an object mapping parameter names to a value or a list of values (the
+# cartesian product of all lists is swept), or a list of objects (one variant each).
+# A CSV file has one variant per row with parameter names in the header.
+# Parameters use the same units as the dialog (um), missing ones take the dialog defaults.
+# With --drc every variant is also checked against the design rules of gradlib.drc, and
+# drc_violations counts the violations (empty without --drc).
+# Variants that params.GradParams.check rejects get the reasons in error and no geometry.
+import argparse
+import csv
+import functools
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from . import drc, layout, params
+
+METRICS = ['variant'] + list(params.NAMES) + ['stages', 'primitives', 'lines', 'arcs',
+                                              'width_um', 'height_um', 'footprint_mm2', 'channel_length_mm',
+                                              'drc_violations', 'error']
+
+GEOMETRY_MAGIC = b'GGGEOM1'
+
+
+def read_grid(path: str):
+    # Yield one GradParams per variant, lazily for grids given as lists of values
+    if path.lower().endswith('.csv'):
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                yield read_variant({k: v for k, v in row.items() if v not in (None, '')})
+        return
+    with open(path) as f:
+        grid = json.load(f)
+    if isinstance(grid, list):
+        for variant in grid:
+            yield read_variant(variant)
+        return
+    names = list(grid)
+    values = [v if isinstance(v, list) else [v] for v in grid.values()]
+    for combination in itertools.product(*values):
+        yield read_variant(dict(zip(names, combination)))
+
+
+def read_variant(values: dict) -> params.GradParams:
+    # Complete a variant with the dialog defaults
+    return params.GradParams.from_dict(values)
+
+
+def compute_variant(variant: params.GradParams, design_rules: bool = False):
+    # Layout and metrics of one variant. Runs in a worker process, returns picklable data only.
+    # The table is None for variants that fail their check, metrics then only hold the error.
+    metrics = variant.as_dict()
+    errors = variant.check()
+    if errors:
+        metrics['error'] = '; '.join(errors)
+        return metrics, None
+    stages = variant.stages()
+    table = layout.generator_table(stages)
+    metrics['stages'] = len(stages)
+    metrics['primitives'] = len(table)
+    metrics['arcs'] = table.kind.count(layout.ARC)
+    metrics['lines'] = len(table) - metrics['arcs']
+    bounds = table.bounds()
+    if bounds:
+        width = bounds[2] - bounds[0]
+        height = bounds[3] - bounds[1]
+    else:
+        width = height = 0.0
+    metrics['width_um'] = round(width * 10000, 3)
+    metrics['height_um'] = round(height * 10000, 3)
+    metrics['footprint_mm2'] = round(width * height * 100, 6)
+    length = layout.channel_length(stages, variant.ladder_distance_cm, variant.resistor_num,
+                                   variant.resistor_radius_cm, variant.resistor_width_cm)
+    metrics['channel_length_mm'] = round(length * 10, 6)
+    if design_rules:
+        metrics['drc_violations'] = len(drc.check(stages))
+    return metrics, table
+
+
+def _chunks(iterable, size: int):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run(variants, out_dir: str, workers: int = None, chunk_size: int = 256, geometry: bool = True,
+        executor=None, design_rules: bool = False) -> int:
+    # Sweep variants, returns the number of variants written
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    done = 0
+    try:
+        with open(os.path.join(out_dir, 'metrics.csv'), 'w', newline='') as metrics_file:
+            writer = csv.DictWriter(metrics_file, METRICS)
+            writer.writeheader()
+            for index, chunk in enumerate(_chunks(variants, chunk_size)):
+                results = executor.map(functools.partial(compute_variant, design_rules=design_rules), chunk,
+                                       chunksize=max(1, len(chunk) // (workers * 4)))
+                geometry_file = None
+                if geometry:
+                    geometry_file = open(os.path.join(out_dir, 'geometry-{:05d}.bin'.format(index)), 'wb')
+                    geometry_file.write(GEOMETRY_MAGIC + layout.BYTEORDER[sys.byteorder])
+                try:
+                    for metrics, table in results:
+                        metrics['variant'] = done
+                        writer.writerow(metrics)
+                        if geometry_file and table is not None:
+                            geometry_file.write(done.to_bytes(4, 'little'))
+                            table.write(geometry_file)
+                        done += 1
+                finally:
+                    if geometry_file:
+                        geometry_file.close()
+    finally:
+        if own_executor:
+            executor.shutdown()
+    return done
+
+
+def read_geometry(path: str):
+    # Yield (variant, PrimitiveTable) from a geometry-NNNNN.bin file
+    with open(path, 'rb') as f:
+        header = f.read(len(GEOMETRY_MAGIC) + 1)
+        if header[:len(GEOMETRY_MAGIC)] != GEOMETRY_MAGIC:
+            raise ValueError('Not a geometry file: {}'.format(path))
+        swap = header[len(GEOMETRY_MAGIC):] != layout.BYTEORDER[sys.byteorder]
+        while True:
+            data = f.read(4)
+            if not data:
+                return
+            yield int.from_bytes(data, 'little'), layout.PrimitiveTable.read(f, swap)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compute gradient generator layouts for a parameter grid.')
+    parser.add_argument('grid', help='parameter grid (.json or .csv)')
+    parser.add_argument('-o', '--out', default='sweep_out', help='output directory')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--chunk', type=int, default=256, help='variants per chunk')
+    parser.add_argument('--no-geometry', action='store_true', help='only write metrics.csv')
+    parser.add_argument('--drc', action='store_true', help='count design rule violations (drc_violations)')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    count = run(read_grid(args.grid), args.out, args.workers, args.chunk, not args.no_geometry,
+                design_rules=args.drc)
+    print('{} variants in {:.2f} s -> {}'.format(count, time.perf_counter() - start, args.out))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+# Build cost benchmark.
+# Runs draw_grad_generator of the script against the recording stand-in of the Fusion API
+# (gradlib.fake_adsk) over a parameter grid and records how layout time, API calls, sketch solves,
+# simulated Fusion time and timeline features scale with output_num, resistor_num and input_num.
+# The parametric mode also records edit_<parameter>_s, the simulated time Fusion needs to recompute
+# the timeline after an edit of each user parameter in parametric.EDITABLE. Compare it with
+# simulated_s, the cost of the full regeneration the other modes need for the same edit.
+# rebuild_s is the simulated time of updating a generator built with output_num - 1 outputs to
+# output_num (see gradlib.rebuild), against simulated_s for building it from scratch.
+# Results are written to JSON, --compare prints the change against an earlier result file.
+#
+# Usage, from the GradientGenerator directory:
+#   python -m gradlib.bench -o bench.json
+#   python -m gradlib.bench -o bench-new.json --compare bench.json
+import argparse
+import itertools
+import json
+import platform
+import subprocess
+import sys
+import time
+
+from . import fake_adsk, parametric, params
+
+MODES = {'pattern': 'BUILD_PATTERN', 'instanced': 'BUILD_INSTANCED', 'merged': 'BUILD_MERGED',
+         'parametric': 'BUILD_PARAMETRIC'}
+# Values compared by --compare, larger is worse for all of them
+COMPARED = ['layout_ms', 'build_ms', 'api_calls', 'solves', 'simulated_s', 'features']
+
+
+def measure(script, mode: str, input_num: int, output_num: int, resistor_num: int, repeats: int = 3,
+            latency: dict = None) -> dict:
+    # One point of the grid, times are the best of repeats
+    variant = params.GradParams(input_num=input_num, output_num=output_num, resistor_num=resistor_num)
+    result = {'mode': mode, 'input_num': input_num, 'output_num': output_num, 'resistor_num': resistor_num}
+    errors = variant.check()
+    if errors:
+        result['error'] = '; '.join(errors)
+        return result
+
+    layout_time = min(_timed(variant.stages)[0] for i in range(repeats))
+    build_time = None
+    for i in range(repeats):
+        script._geometry_cache.clear()
+        recorder = fake_adsk.reset(latency)
+        design = fake_adsk.Design()
+        seconds, _ = _timed(lambda: script.draw_grad_generator(design, variant, getattr(script, MODES[mode])))
+        build_time = seconds if build_time is None else min(build_time, seconds)
+
+    result.update({
+        'layout_ms': layout_time * 1000,
+        'build_ms': build_time * 1000,
+        'api_calls': recorder.total,
+        'solves': recorder.calls['Sketch.compute'],
+        'solved_curves': recorder.solved_curves,
+        'simulated_s': recorder.simulated,
+        'features': recorder.features,
+        'bodies': recorder.bodies,
+        'components': len(recorder.components),
+    })
+    if mode == 'parametric':
+        # The design holds one generator, so its user parameters are number 1
+        for name in parametric.EDITABLE:
+            result['edit_{}_s'.format(name)] = edit_cost(design, recorder, parametric.parameter_name(name, 1))
+    if output_num - 1 > input_num:
+        result['rebuild_s'] = rebuild_cost(script, mode, variant, latency)
+    return result
+
+
+def rebuild_cost(script, mode: str, variant: params.GradParams, latency: dict = None) -> float:
+    # Simulated seconds of updating a generator with one output less to variant
+    recorder = fake_adsk.reset(latency)
+    design = fake_adsk.Design()
+    build_mode = getattr(script, MODES[mode])
+    script.draw_grad_generator(design, variant.replace(output_num=variant.output_num - 1), build_mode)
+    before = recorder.simulated
+    script.draw_grad_generator(design, variant, build_mode, script.find_generator(design))
+    return recorder.simulated - before
+
+
+def edit_cost(design, recorder, name: str) -> float:
+    # Simulated seconds of the recompute after setting user parameter name to a new value
+    parameter = design.userParameters.itemByName(name)
+    before = recorder.simulated
+    parameter.expression = '{} * 1.1'.format(parameter.expression)
+    return recorder.simulated - before
+
+
+def run(modes, input_nums, output_nums, resistor_nums, repeats: int = 3, latency: dict = None,
+        progress=None) -> dict:
+    script = fake_adsk.load_script()
+    results = []
+    for mode, input_num, output_num, resistor_num in itertools.product(modes, input_nums, output_nums, resistor_nums):
+        if output_num <= input_num:
+            continue
+        result = measure(script, mode, input_num, output_num, resistor_num, repeats, latency)
+        results.append(result)
+        if progress:
+            progress(result)
+    return {'meta': _meta(repeats, latency), 'results': results}
+
+
+def compare(current: dict, previous: dict, threshold: float = 1.1):
+    # Yields (key, name, before, after) for every compared value that grew by more than threshold
+    def keyed(data):
+        return {(r['mode'], r['input_num'], r['output_num'], r['resistor_num']): r
+                for r in data['results'] if 'error' not in r}
+
+    before = keyed(previous)
+    for key, result in sorted(keyed(current).items()):
+        if key not in before:
+            continue
+        for name in COMPARED + [k for k in result if k.startswith(('edit_', 'rebuild_'))]:
+            old, new = before[key].get(name), result.get(name)
+            if old is None or new is None:
+                continue
+            if new > old * threshold and new - old > 1e-9:
+                yield key, name, old, new
+
+
+def _timed(function):
+    start = time.perf_counter()
+    value = function()
+    return time.perf_counter() - start, value
+
+
+def _meta(repeats: int, latency: dict) -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ''
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeats': repeats,
+        'latency': latency if latency is not None else fake_adsk.DEFAULT_LATENCY,
+    }
+
+
+def _print_result(result: dict):
+    if 'error' in result:
+        print('{mode:>10} in={input_num} out={output_num:>3} res={resistor_num}: {error}'.format(**result))
+        return
+    print('{mode:>10} in={input_num} out={output_num:>3} res={resistor_num}: layout {layout_ms:8.2f} ms  '
+          'build {build_ms:8.1f} ms  calls {api_calls:7d}  solves {solves:5d}  features {features:5d}  '
+          'fusion ~{simulated_s:7.2f} s'.format(**result)
+          + ''.join('  {} ~{:.2f} s'.format(k[5:-2], v) for k, v in result.items() if k.startswith('edit_'))
+          + ('  rebuild ~{:.2f} s'.format(result['rebuild_s']) if 'rebuild_s' in result else ''))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the gradient generator build against a fake Fusion API.')
+    parser.add_argument('-o', '--out', default='bench.json', help='result file (JSON)')
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    parser.add_argument('--input-num', nargs='+', type=int, default=[2])
+    parser.add_argument('--output-num', nargs='+', type=int, default=[4, 8, 16])
+    parser.add_argument('--resistor-num', nargs='+', type=int, default=[1, 2, 4])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--latency', help='JSON file with seconds per call, see fake_adsk.DEFAULT_LATENCY')
+    parser.add_argument('--compare', help='earlier result file, exits with 1 if anything got worse')
+    parser.add_argument('--threshold', type=float, default=1.1, help='ratio that counts as worse (default 1.1)')
+    args = parser.parse_args(argv)
+
+    latency = None
+    if args.latency:
+        with open(args.latency) as f:
+            latency = json.load(f)
+
+    data = run(args.modes, args.input_num, args.output_num, args.resistor_num, args.repeats, latency, _print_result)
+    with open(args.out, 'w') as f:
+        json.dump(data, f, indent=1)
+    print('{} results -> {}'.format(len(data['results']), args.out))
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        worse = list(compare(data, previous, args.threshold))
+        for (mode, input_num, output_num, resistor_num), name, old, new in worse:
+            print('worse: {} in={} out={} res={} {}: {:.4g} -> {:.4g}'.format(
+                mode, input_num, output_num, resistor_num, name, old, new))
+        if worse:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+# LRU cache of computed stage geometry.
+# Stages are keyed on the normalized layout parameters plus unit_num and stored at the origin,
+# so a generator with different output_num (or a different position) reuses every stage it shares
+# with an earlier run. The cache can be saved to and loaded from a compact binary file.
+# Cache files carry a digest of the modules that compute stage geometry, a file written before any
+# change to them is ignored on load and replaced by the next save.
+import hashlib
+import json
+import os
+import struct
+import sys
+from collections import OrderedDict
+
+from . import arcs, layout
+
+_MAGIC = b'GGCACHE2'
+_SCALARS = struct.Struct('<dddddi')
+
+
+def _source_digest(*modules) -> bytes:
+    digest = hashlib.sha1()
+    for module in modules:
+        with open(module.__file__, 'rb') as f:
+            digest.update(f.read())
+    return digest.digest()[:8]
+
+
+# Version of the stage geometry, changes with every edit of the layout code
+LAYOUT_VERSION = _source_digest(layout, arcs)
+
+
+def normalize(params) -> tuple:
+    # Round floats so parameters that went through different unit conversions share a key
+    return tuple(round(v, 9) if isinstance(v, float) else v for v in params)
+
+
+class CacheStats:
+    __slots__ = ('hits', 'misses', 'evictions')
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __repr__(self):
+        return 'CacheStats(hits={}, misses={}, evictions={}, hit_rate={:.0%})'.format(
+            self.hits, self.misses, self.evictions, self.hit_rate)
+
+
+class GeometryCache:
+    def __init__(self, maxsize: int = 512, path: str = None):
+        self.maxsize = maxsize
+        self.path = path
+        self.stats = CacheStats()
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def clear(self):
+        self._entries.clear()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return entry
+
+    def put(self, key, stage: layout.StageLayout):
+        self._entries[key] = stage
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def stage(self, params, unit_num: int, compute) -> layout.StageLayout:
+        # Stage geometry at the origin for params and unit_num, computed by compute() on a miss
+        key = (normalize(params), unit_num)
+        stage = self.get(key)
+        if stage is None:
+            stage = compute()
+            self.put(key, stage)
+        return stage
+
+    # Persistence
+
+    def load(self, path: str = None) -> int:
+        # Add the entries of a cache file, returns the number of entries read.
+        # A missing, unreadable or outdated file (see LAYOUT_VERSION) leaves the cache as it is.
+        path = path or self.path
+        if not path or not os.path.exists(path):
+            return 0
+        try:
+            with open(path, 'rb') as f:
+                entries = list(_read_entries(f))
+        except (OSError, ValueError, struct.error, EOFError):
+            return 0
+        for key, stage in entries:
+            self.put(key, stage)
+        return len(entries)
+
+    def save(self, path: str = None):
+        path = path or self.path
+        if not path:
+            return
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(_MAGIC + layout.BYTEORDER[sys.byteorder] + LAYOUT_VERSION)
+            f.write(struct.pack('<I', len(self._entries)))
+            for key, stage in self._entries.items():
+                _write_entry(f, key, stage)
+        os.replace(tmp, path)
+
+
+def _write_entry(f, key, stage: layout.StageLayout):
+    params, unit_num = key
+    encoded = json.dumps([list(params), unit_num]).encode('utf-8')
+    f.write(struct.pack('<I', len(encoded)))
+    f.write(encoded)
+    f.write(_SCALARS.pack(stage.origin[0], stage.origin[1], stage.pitch,
+                          stage.next_origin[0], stage.next_origin[1], stage.copies))
+    stage.template.write(f)
+
+
+def _read_entries(f):
+    header = f.read(len(_MAGIC) + 1)
+    if header[:len(_MAGIC)] != _MAGIC:
+        raise ValueError('Not a geometry cache file')
+    swap = header[len(_MAGIC):] != layout.BYTEORDER[sys.byteorder]
+    if _read(f, len(LAYOUT_VERSION)) != LAYOUT_VERSION:
+        raise ValueError('Geometry cache file of another layout version')
+    count, = struct.unpack('<I', _read(f, 4))
+    for i in range(count):
+        size, = struct.unpack('<I', _read(f, 4))
+        params, unit_num = json.loads(_read(f, size).decode('utf-8'))
+        ox, oy, pitch, nx, ny, copies = _SCALARS.unpack(_read(f, _SCALARS.size))
+        table = layout.PrimitiveTable.read(f, swap)
+        stage = layout.StageLayout(unit_num, table, (ox, oy), pitch, copies, (nx, ny))
+        yield (tuple(params), unit_num), stage
+
+
+def _read(f, size: int) -> bytes:
+    data = f.read(size)
+    if len(data) != size:
+        raise EOFError('Truncated geometry cache file')
+    return data
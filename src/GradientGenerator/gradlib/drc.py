@@ -0,0 +1,449 @@
+# Design rule check of a generator layout.
+# Reports three rules, with coordinates and values in um:
+#   overlap  channels that touch or cross although the layout does not connect them, e.g. serpentine
+#            turns of neighbouring copies when the ladder width is smaller than
+#            resistor_width + 2 * resistor_radius + channel_width
+#   spacing  walls between channels thinner than min_spacing, e.g. between a serpentine turn and
+#            the ladder step below it
+#   width    channels narrower than min_width
+#
+# The merged outline of every distinct serpentine is computed once (polygon.union) and placed at
+# every copy, the connecting channels are rectangles. Edges that lie inside the channel they open
+# into are clipped away, so only walls are measured. All edges go into a uniform grid and only
+# pairs from nearby cells are compared, which keeps the check linear in the number of primitives.
+# Two edges measure a spacing when their outward normals face each other across the gap and a
+# width when their inward normals do. Arcs are tessellated to tolerance, so distances are exact
+# to that.
+#
+# Usage, from the GradientGenerator directory:
+#   python -m gradlib.drc variant.json --min-spacing 100 --min-width 50
+# exits with 1 if any rule is violated.
+import argparse
+import json
+import math
+import sys
+import time
+from collections import defaultdict, namedtuple
+
+from . import layout, params, polygon
+
+MIN_SPACING = 100  # um
+MIN_WIDTH = 50  # um
+DEFAULT_TOLERANCE = polygon.DEFAULT_TOLERANCE
+
+OVERLAP = 'overlap'
+SPACING = 'spacing'
+WIDTH = 'width'
+
+# x, y, value and limit in um, value is the measured distance (0 for overlaps)
+Violation = namedtuple('Violation', ['rule', 'x', 'y', 'value', 'limit'])
+
+# Points closer than this (cm) count as touching
+_EPSILON = 1e-9
+# Sine of the largest angle between a gap and an edge normal that still counts as perpendicular
+_PERPENDICULAR = 1e-6
+
+
+class GridIndex:
+    # Uniform grid over axis aligned boxes (min x, min y, max x, max y), cell size in cm
+    def __init__(self, cell: float):
+        self.cell = cell
+        self._cells = defaultdict(list)
+        # Range of occupied cells, queries are clamped to it
+        self._low = [math.inf, math.inf]
+        self._high = [-math.inf, -math.inf]
+
+    def _range(self, box):
+        cell = self.cell
+        return (int(math.floor(box[0] / cell)), int(math.floor(box[1] / cell)),
+                int(math.floor(box[2] / cell)), int(math.floor(box[3] / cell)))
+
+    def insert(self, item, box):
+        i0, j0, i1, j1 = self._range(box)
+        self._low = [min(self._low[0], i0), min(self._low[1], j0)]
+        self._high = [max(self._high[0], i1), max(self._high[1], j1)]
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                self._cells[(i, j)].append(item)
+
+    def query(self, box) -> set:
+        # Items whose cells overlap box
+        i0, j0, i1, j1 = self._range(box)
+        found = set()
+        if not self._cells:
+            return found
+        for i in range(max(i0, self._low[0]), min(i1, self._high[0]) + 1):
+            for j in range(max(j0, self._low[1]), min(j1, self._high[1]) + 1):
+                found.update(self._cells.get((i, j), ()))
+        return found
+
+
+# A placed region: serpentine copy or connecting channel.
+# edges are ((x0, y0), (x1, y1)) relative to (dx, dy) with the channel on their left, copies of a
+# serpentine share the same list. joins are the ids of the shapes it opens into and mouths the boxes
+# where it does, the only places where those may touch it. box and mouths are absolute.
+_Shape = namedtuple('_Shape', ['edges', 'dx', 'dy', 'box', 'joins', 'mouths'])
+
+
+def check(stages, min_spacing: float = MIN_SPACING, min_width: float = MIN_WIDTH,
+          tolerance: float = DEFAULT_TOLERANCE):
+    # Violations of a layout (list of StageLayout), rules in um, tolerance in cm
+    rules = (min_spacing / params.UM_PER_CM, min_width / params.UM_PER_CM)
+    reach = max(rules)
+    shapes = _shapes(stages, tolerance)
+    if not shapes:
+        return []
+    violations = []
+
+    # Within a shape, once per distinct edge list
+    indexes = {}
+    internal = {}
+    for shape in shapes:
+        key = id(shape.edges)
+        if key not in internal:
+            indexes[key] = _EdgeIndex(shape.edges, reach)
+            internal[key] = [found for a, b, c, d in indexes[key].pairs(shape.edges, reach, True)
+                             for found in [_measure(a, b, c, d, True, rules)] if found]
+        for rule, p, q, value, limit in internal[key]:
+            violations.append(_violation(rule, _offset(p, shape), _offset(q, shape), value, limit))
+
+    # Between shapes, only the edges within reach of the other shape
+    grid = GridIndex(max(2 * reach, min(shape.box[2] - shape.box[0] for shape in shapes)))
+    for k, shape in enumerate(shapes):
+        grid.insert(k, shape.box)
+    for k, shape in enumerate(shapes):
+        for m in sorted(grid.query(_grow(shape.box, reach))):
+            other = shapes[m]
+            if m <= k or _gap(shape.box, other.box) >= reach:
+                continue
+            near = _near(shape, other.box, reach, indexes[id(shape.edges)])
+            other_near = _near(other, shape.box, reach, indexes[id(other.edges)])
+            for a, b, c, d in _EdgeIndex(other_near, reach).pairs(near, reach):
+                distance, p, q = _segment_distance(a, b, c, d)
+                if distance > _EPSILON:
+                    found = _measure(a, b, c, d, False, rules, distance, p, q)
+                    if found:
+                        violations.append(_violation(*found))
+                elif not _joined(shape, m, p):
+                    violations.append(_violation(OVERLAP, p, q, 0.0, 0.0))
+    return merge(violations, reach * params.UM_PER_CM)
+
+
+class _EdgeIndex:
+    # Edges ((x0, y0), (x1, y1)) in a GridIndex sized to their median length
+    def __init__(self, edges, reach: float):
+        self.edges = edges
+        self.boxes = [_box(a, b) for a, b in edges]
+        lengths = sorted(max(box[2] - box[0], box[3] - box[1]) for box in self.boxes) or [0.0]
+        self.grid = GridIndex(max(2 * reach, lengths[len(lengths) // 2]))
+        for m, box in enumerate(self.boxes):
+            self.grid.insert(m, box)
+
+    def near(self, box, reach: float):
+        # Indices of the edges whose boxes are closer than reach to box
+        return [m for m in self.grid.query(_grow(box, reach)) if _gap(box, self.boxes[m]) < reach]
+
+    def pairs(self, edges, reach: float, within: bool = False):
+        # Pairs of an edge of edges and an indexed edge closer than reach (boxes only).
+        # within: edges are the indexed edges, every pair once and edges sharing an end point skipped.
+        for k, (a, b) in enumerate(edges):
+            for m in self.near(_box(a, b), reach):
+                if within and m <= k:
+                    continue
+                c, d = self.edges[m]
+                if within and (a == c or a == d or b == c or b == d):
+                    continue
+                yield a, b, c, d
+
+
+def _measure(a, b, c, d, same: bool, rules, distance=None, p=None, q=None):
+    # (rule, p, q, distance, limit) if a-b and c-d are a wall or channel narrower than rules
+    # (spacing, width), None otherwise. Touching edges are left to the overlap check.
+    if distance is None:
+        distance, p, q = _segment_distance(a, b, c, d)
+    spacing, width = rules
+    if distance <= _EPSILON or distance >= max(rules):
+        return None
+    facing = _facing(a, b, c, d, p, q, distance, same)
+    if facing > 0 and distance < spacing:
+        return SPACING, p, q, distance, spacing
+    if facing < 0 and distance < width:
+        return WIDTH, p, q, distance, width
+    return None
+
+
+def _near(shape: _Shape, box, reach: float, index: _EdgeIndex):
+    # Absolute edges of shape within reach of box
+    dx, dy = shape.dx, shape.dy
+    return [_move(*shape.edges[m], dx, dy) for m in sorted(index.near(_move_box(box, -dx, -dy), reach))]
+
+
+def _joined(shape: _Shape, other_id: int, p) -> bool:
+    # Whether shapes touching at p are meant to, at a mouth of one into the other
+    return other_id in shape.joins and any(_inside(p, mouth) for mouth in shape.mouths)
+
+
+def merge(violations, radius: float):
+    # Worst violation of every rule per radius (um) sized cell, in a stable order
+    worst = {}
+    for v in violations:
+        key = (v.rule, int(math.floor(v.x / radius)), int(math.floor(v.y / radius)))
+        if key not in worst or v.value < worst[key].value:
+            worst[key] = v
+    return sorted(worst.values(), key=lambda v: (v.rule, v.y, v.x))
+
+
+def describe(violation: Violation) -> str:
+    if violation.rule == OVERLAP:
+        return 'Channels overlap at ({:.1f}, {:.1f}) um'.format(violation.x, violation.y)
+    return '{} {:.1f} um below {:.0f} um at ({:.1f}, {:.1f}) um'.format(
+        'Wall' if violation.rule == SPACING else 'Channel width', violation.value, violation.limit,
+        violation.x, violation.y)
+
+
+def summary(violations, limit: int = 5):
+    # Lines for the dialog: the first violations and a count of the rest
+    lines = [describe(v) for v in violations[:limit]]
+    if len(violations) > limit:
+        lines.append('... {} more design rule violations'.format(len(violations) - limit))
+    return lines
+
+
+def _shapes(stages, tolerance: float):
+    # Serpentine copies followed by the connecting channel of every stage
+    outlines = {}
+    clipped = {}
+    connects = [stage.template.select((layout.PROFILE_CONNECT,)).bounds() for stage in stages]
+    first_connect = sum(stage.copies for stage in stages)
+    serpentines = []
+    connect_joins = defaultdict(set)
+    connect_mouths = defaultdict(list)
+    for s, stage in enumerate(stages):
+        ox, oy = stage.origin
+        key = _template_key(stage)
+        if key not in outlines:
+            outlines[key] = _serpentine(stage, tolerance)
+        outline, inlet, outlet = outlines[key]
+        for i in range(stage.copies):
+            # Serpentine copies open into the connecting channel of their stage and of the next one
+            dx = ox + i * stage.pitch
+            ends = [(s, inlet)]
+            if s + 1 < len(stages):
+                ends.append((s + 1, outlet))
+            mouths = [_intersection(_move_box(end, dx, oy), connects[c]) for c, end in ends]
+            for (c, end), mouth in zip(ends, mouths):
+                connect_joins[c].add(len(serpentines))
+                connect_mouths[c].append(mouth)
+            # Mouths are at the same place for every copy, so copies share their clipped edges
+            local = tuple(_move_box(mouth, -dx, -oy) for mouth in mouths)
+            clip_key = (key, tuple(round(v, 9) for mouth in local for v in mouth))
+            if clip_key not in clipped:
+                clipped[clip_key] = _clip(outline, local)
+            edges = clipped[clip_key]
+            serpentines.append(_Shape(edges, dx, oy, _move_box(_bounds(edges), dx, oy),
+                                      {first_connect + c for c, end in ends}, mouths))
+    shapes = serpentines
+    for c, box in enumerate(connects):
+        edges = _clip(_rectangle(box), connect_mouths[c])
+        shapes.append(_Shape(edges, 0.0, 0.0, box, connect_joins[c], connect_mouths[c]))
+    return shapes
+
+
+def _template_key(stage: layout.StageLayout):
+    # Geometry of the serpentine relative to the stage origin, equal for stages with equal templates
+    ox, oy = stage.origin
+    table = stage.template.select(layout.CHANNEL_PROFILES)
+    return tuple(round(v - o, 9) for row in table.rows() for v, o in zip(row[1:7], (ox, oy) * 3)) + tuple(table.kind)
+
+
+def _serpentine(stage: layout.StageLayout, tolerance: float):
+    # Merged outline edges of one serpentine at the origin, with its inlet and outlet boxes
+    ox, oy = stage.origin
+    template = stage.template.translated(-ox, -oy)
+    loops = polygon.union(polygon.table_polygons(template.select(layout.CHANNEL_PROFILES), tolerance))
+    edges = [(a, b) for loop in loops for a, b in zip(loop, loop[1:] + loop[:1])]
+    inlet = template.select((layout.PROFILE_INLET,)).bounds()
+    outlet = template.select((layout.PROFILE_OUTLET,)).bounds()
+    return edges, inlet, outlet
+
+
+def _rectangle(box):
+    x0, y0, x1, y1 = box
+    points = [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+    return list(zip(points, points[1:] + points[:1]))
+
+
+def _move(a, b, dx: float, dy: float):
+    return (a[0] + dx, a[1] + dy), (b[0] + dx, b[1] + dy)
+
+
+def _move_box(box, dx: float, dy: float):
+    return box[0] + dx, box[1] + dy, box[2] + dx, box[3] + dy
+
+
+def _intersection(box, other):
+    return max(box[0], other[0]), max(box[1], other[1]), min(box[2], other[2]), min(box[3], other[3])
+
+
+def _bounds(edges):
+    xs = [v for a, b in edges for v in (a[0], b[0])]
+    ys = [v for a, b in edges for v in (a[1], b[1])]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _gap(box, other) -> float:
+    # Largest of the x and y gaps between two boxes, 0 if they overlap
+    return max(other[0] - box[2], box[0] - other[2], other[1] - box[3], box[1] - other[3], 0.0)
+
+
+def _grow(box, margin: float):
+    return box[0] - margin, box[1] - margin, box[2] + margin, box[3] + margin
+
+
+def _offset(p, shape: _Shape):
+    return p[0] + shape.dx, p[1] + shape.dy
+
+
+def _inside(p, box) -> bool:
+    return (box[0] - _EPSILON <= p[0] <= box[2] + _EPSILON) and (box[1] - _EPSILON <= p[1] <= box[3] + _EPSILON)
+
+
+def _box(a, b):
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[0], b[0]), max(a[1], b[1])
+
+
+def _clip(edges, boxes):
+    # Edges with the parts inside or on any of boxes removed
+    for box in boxes:
+        box = _grow(box, _EPSILON)
+        pieces = []
+        for a, b in edges:
+            pieces.extend(_outside(a, b, box))
+        edges = pieces
+    return edges
+
+
+def _outside(a, b, box):
+    # Parts of a-b outside box (Liang-Barsky)
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    low, high = 0.0, 1.0
+    for p, q in ((-dx, a[0] - box[0]), (dx, box[2] - a[0]), (-dy, a[1] - box[1]), (dy, box[3] - a[1])):
+        if p == 0:
+            if q < 0:
+                return [(a, b)]
+            continue
+        t = q / p
+        if p < 0:
+            low = max(low, t)
+        else:
+            high = min(high, t)
+        if low > high:
+            return [(a, b)]
+    parts = []
+    if low > 0:
+        parts.append((a, (a[0] + dx * low, a[1] + dy * low)))
+    if high < 1:
+        parts.append(((a[0] + dx * high, a[1] + dy * high), b))
+    return parts
+
+
+def _segment_distance(a, b, c, d):
+    # (distance, closest point on a-b, closest point on c-d)
+    ax, ay = a
+    cx, cy = c
+    ux, uy = b[0] - ax, b[1] - ay
+    vx, vy = d[0] - cx, d[1] - cy
+    wx, wy = cx - ax, cy - ay
+    denominator = ux * vy - uy * vx
+    if denominator != 0:
+        t = (wx * vy - wy * vx) / denominator
+        s = (wx * uy - wy * ux) / denominator
+        if 0 <= t <= 1 and 0 <= s <= 1:
+            p = (ax + ux * t, ay + uy * t)
+            return 0.0, p, p
+    # Otherwise one of the four end points is closest to the other segment
+    best = None
+    for p, o, ex, ey, first in ((a, c, vx, vy, False), (b, c, vx, vy, False), (c, a, ux, uy, True),
+                                (d, a, ux, uy, True)):
+        length2 = ex * ex + ey * ey
+        t = 0.0
+        if length2:
+            t = max(0.0, min(1.0, ((p[0] - o[0]) * ex + (p[1] - o[1]) * ey) / length2))
+        q = (o[0] + ex * t, o[1] + ey * t)
+        distance = math.hypot(q[0] - p[0], q[1] - p[1])
+        if best is None or distance < best[0]:
+            best = (distance, q, p) if first else (distance, p, q)
+    return best
+
+
+def _facing(a, b, c, d, p, q, distance: float, same: bool) -> int:
+    # 1 if a-b and c-d face each other across a gap, -1 across the channel, 0 otherwise.
+    # Within one shape the gap has to be perpendicular to one of the edges, so the inside of a
+    # turn is measured across the turn and not between neighbouring chords of its arc.
+    na = _left_normal(a, b)
+    nc = _left_normal(c, d)
+    if na[0] * nc[0] + na[1] * nc[1] >= 0:
+        return 0
+    vx, vy = (q[0] - p[0]) / distance, (q[1] - p[1]) / distance
+    if same and abs(vx * na[1] - vy * na[0]) > _PERPENDICULAR and abs(vx * nc[1] - vy * nc[0]) > _PERPENDICULAR:
+        return 0
+    # The channel is on the left of an edge, so its outward normal is the negated left normal
+    ahead_a = vx * na[0] + vy * na[1]
+    ahead_c = -(vx * nc[0] + vy * nc[1])
+    if ahead_a < -_EPSILON and ahead_c < -_EPSILON:
+        return 1
+    if ahead_a > _EPSILON and ahead_c > _EPSILON:
+        return -1
+    return 0
+
+
+def _left_normal(a, b):
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    length = math.hypot(dx, dy)
+    return -dy / length, dx / length
+
+
+def _violation(rule: str, p, q, value: float, limit: float) -> Violation:
+    return Violation(rule, round((p[0] + q[0]) / 2 * params.UM_PER_CM, 3),
+                     round((p[1] + q[1]) / 2 * params.UM_PER_CM, 3),
+                     round(value * params.UM_PER_CM, 3), round(limit * params.UM_PER_CM, 3))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the design rules of a gradient generator layout.')
+    parser.add_argument('variants', nargs='+', help='JSON objects with dialog parameters (um), as used by gradlib.batch')
+    parser.add_argument('--min-spacing', type=float, default=MIN_SPACING, help='thinnest wall (um)')
+    parser.add_argument('--min-width', type=float, default=MIN_WIDTH, help='narrowest channel (um)')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE * params.UM_PER_CM,
+                        help='arc chord tolerance (um)')
+    parser.add_argument('--json', help='write the violations of every variant to this file')
+    parser.add_argument('--max-lines', type=int, default=20, help='violations printed per variant')
+    args = parser.parse_args(argv)
+
+    results = {}
+    failed = False
+    for path in args.variants:
+        with open(path) as f:
+            variant = params.GradParams.from_dict(json.load(f))
+        errors = variant.check()
+        if errors:
+            print('{}: {}'.format(path, '; '.join(errors)))
+            failed = True
+            continue
+        start = time.perf_counter()
+        violations = check(variant.stages(), args.min_spacing, args.min_width, args.tolerance / params.UM_PER_CM)
+        print('{}: {} violations in {:.2f} s'.format(path, len(violations), time.perf_counter() - start))
+        for line in summary(violations, args.max_lines):
+            print('  ' + line)
+        results[path] = [v._asdict() for v in violations]
+        failed = failed or bool(violations)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# Batched replay of a PrimitiveTable into Fusion sketches.
+# The sketch stays deferred while drawing, every distinct point is created once and shared by
+# all curves ending there, and each sketch is recomputed exactly once when it is released.
+# The Fusion objects are only used through duck typing, so a fake sketch works as well.
+from . import geometry, layout
+
+# Which sketch a profile is drawn in. The serpentine channel and the connecting channel of a
+# stage live in different sketches so the channel can be patterned on its own.
+SKETCH_OF_PROFILE = {
+    layout.PROFILE_INLET: 0,
+    layout.PROFILE_RESISTOR: 0,
+    layout.PROFILE_OUTLET: 0,
+    layout.PROFILE_CONNECT: 1,
+}
+
+
+class EmitStats:
+    __slots__ = ('recomputes', 'sketches', 'points', 'curves')
+
+    def __init__(self):
+        self.recomputes = 0
+        self.sketches = 0
+        self.points = 0
+        self.curves = 0
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return 'EmitStats({})'.format(', '.join('{}={}'.format(k, v) for k, v in self.as_dict().items()))
+
+
+class SketchEmitter:
+    def __init__(self, point_create, stats: EmitStats = None):
+        # point_create is adsk.core.Point3D.create (or a stand-in with the same signature)
+        self._point_create = point_create
+        self.stats = stats if stats is not None else EmitStats()
+
+    def emit(self, sketch, table: layout.PrimitiveTable):
+        # Draw every row of table into sketch with a single recompute at the end
+        stats = self.stats
+        was_deferred = sketch.isComputeDeferred
+        sketch.isComputeDeferred = True
+        curves = sketch.sketchCurves
+        lines = curves.sketchLines
+        arcs = curves.sketchArcs
+        stats.sketches += 1
+
+        # Maps a rounded coordinate to the Point3D created for it, and then to the sketch point
+        # of the first curve that used it, so connected curves share their end points.
+        points = {}
+        scale = 1 / geometry.POINT_RESOLUTION
+
+        def point(x, y):
+            key = (round(x * scale), round(y * scale))
+            p = points.get(key)
+            if p is None:
+                p = points[key] = self._point_create(x, y, 0)
+                stats.points += 1
+            return key, p
+
+        for kind, x0, y0, xm, ym, x1, y1, stage, profile in table.rows():
+            start_key, start = point(x0, y0)
+            end_key, end = point(x1, y1)
+            if kind == layout.ARC:
+                mid = self._point_create(xm, ym, 0)
+                curve = arcs.addByThreePoints(start, mid, end)
+                sketch_start, sketch_end = curve.startSketchPoint, curve.endSketchPoint
+                # Sketch arcs are always counter clockwise, so the start point may be our end point
+                if _closer_to_end(sketch_start, x0, y0, x1, y1):
+                    sketch_start, sketch_end = sketch_end, sketch_start
+            else:
+                curve = lines.addByTwoPoints(start, end)
+                sketch_start, sketch_end = curve.startSketchPoint, curve.endSketchPoint
+            points[start_key] = sketch_start
+            points[end_key] = sketch_end
+            stats.curves += 1
+
+        if not was_deferred:
+            sketch.isComputeDeferred = False
+            stats.recomputes += 1
+        return sketch
+
+    def emit_grouped(self, sketch_factory, table: layout.PrimitiveTable):
+        # Split table per sketch (see SKETCH_OF_PROFILE) and emit each group into a sketch
+        # obtained from sketch_factory(). Returns {sketch key: sketch}.
+        groups = {}
+        for key in sorted(set(SKETCH_OF_PROFILE[p] for p in set(table.profile))):
+            profiles = tuple(p for p, k in SKETCH_OF_PROFILE.items() if k == key)
+            sketch = sketch_factory()
+            groups[key] = self.emit(sketch, table.select(profiles))
+        return groups
+
+
+def _closer_to_end(sketch_point, x0, y0, x1, y1):
+    geometry = sketch_point.geometry
+    x, y = geometry.x, geometry.y
+    return (x - x1) ** 2 + (y - y1) ** 2 < (x - x0) ** 2 + (y - y0) ** 2
@@ -0,0 +1,237 @@
+# Mask export straight from the layout, without building Fusion bodies.
+# A mask is a set of designs (name -> PrimitiveTable) and placements (name, dx, dy). Every design is
+# written once (DXF block, SVG symbol, GDSII structure) and placed by reference, and all records are
+# produced by generators and written through a large buffer, so memory does not grow with the
+# number of placements. Output coordinates are in um.
+#
+# Usage, from the GradientGenerator directory:
+#   python -m gradlib.export variant.json mask.gds --array 10x10 --pitch 20000
+import argparse
+import json
+import math
+import struct
+import sys
+import time
+
+from . import arcs, batch, geometry, layout, params
+
+BUFFER_SIZE = 1 << 20
+DEFAULT_TOLERANCE = 0.1  # um, largest chord error of tessellated arcs in GDSII
+GDS_MAX_POINTS = 8191
+
+
+def export(path: str, designs: dict, placements, tolerance: float = DEFAULT_TOLERANCE, layer: int = 1,
+           view_box=None):
+    # Write a mask, the format follows the file extension (.dxf, .svg or .gds).
+    # view_box only applies to SVG, see svg_records.
+    extension = path.lower().rsplit('.', 1)[-1]
+    if extension == 'dxf':
+        with open(path, 'w', buffering=BUFFER_SIZE) as f:
+            f.writelines(dxf_records(designs, placements, layer))
+    elif extension == 'svg':
+        with open(path, 'w', buffering=BUFFER_SIZE) as f:
+            f.writelines(svg_records(designs, placements, view_box))
+    elif extension in ('gds', 'gds2', 'gdsii'):
+        with open(path, 'wb', buffering=BUFFER_SIZE) as f:
+            f.writelines(gds_records(designs, placements, tolerance, layer))
+    else:
+        raise ValueError('Unknown mask format: {}'.format(path))
+
+
+# DXF (R12, LINE and ARC entities in blocks, placed with INSERT)
+
+def dxf_records(designs: dict, placements, layer: int = 1):
+    layer = str(layer)
+    yield '0\nSECTION\n2\nBLOCKS\n'
+    for name, table in designs.items():
+        yield '0\nBLOCK\n8\n0\n2\n{0}\n70\n0\n10\n0.0\n20\n0.0\n30\n0.0\n3\n{0}\n'.format(name)
+        for kind, x0, y0, xm, ym, x1, y1, stage, profile in table.rows():
+            if kind == layout.ARC:
+                arc = arcs.Arc.from_points(x0, y0, xm, ym, x1, y1)
+                start, end = arc.start, arc.end
+                if arc.sweep < 0:
+                    start, end = end, start
+                yield '0\nARC\n8\n{}\n10\n{:.6f}\n20\n{:.6f}\n30\n0.0\n40\n{:.6f}\n50\n{:.6f}\n51\n{:.6f}\n'.format(
+                    layer, arc.cx * params.UM_PER_CM, arc.cy * params.UM_PER_CM, arc.radius * params.UM_PER_CM,
+                    math.degrees(start) % 360, math.degrees(end) % 360)
+            else:
+                yield '0\nLINE\n8\n{}\n10\n{:.6f}\n20\n{:.6f}\n30\n0.0\n11\n{:.6f}\n21\n{:.6f}\n31\n0.0\n'.format(
+                    layer, x0 * params.UM_PER_CM, y0 * params.UM_PER_CM, x1 * params.UM_PER_CM, y1 * params.UM_PER_CM)
+        yield '0\nENDBLK\n8\n0\n'
+    yield '0\nENDSEC\n0\nSECTION\n2\nENTITIES\n'
+    for name, dx, dy in placements:
+        yield '0\nINSERT\n8\n{}\n2\n{}\n10\n{:.6f}\n20\n{:.6f}\n30\n0.0\n'.format(
+            layer, name, dx * params.UM_PER_CM, dy * params.UM_PER_CM)
+    yield '0\nENDSEC\n0\nEOF\n'
+
+
+# SVG (one filled path per closed profile, y pointing up)
+
+def svg_records(designs: dict, placements, view_box=None):
+    # view_box is (min x, min y, max x, max y) in cm, the bounds of the designs at the origin when omitted
+    if view_box is None:
+        view_box = _union_bounds(table.bounds() for table in designs.values() if len(table))
+    x0, y0, x1, y1 = (v * params.UM_PER_CM for v in view_box)
+    yield ('<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+           'viewBox="{:.3f} {:.3f} {:.3f} {:.3f}">\n'.format(x0, -y1, x1 - x0, y1 - y0))
+    yield '<defs>\n'
+    for name, table in designs.items():
+        yield '<g id="{}">\n'.format(name)
+        for closed, chain in geometry.profile_loops(table):
+            yield '<path d="{}"/>\n'.format(_svg_path(closed, chain))
+        yield '</g>\n'
+    yield '</defs>\n<g transform="scale(1,-1)" fill="black" stroke="none">\n'
+    for name, dx, dy in placements:
+        yield '<use xlink:href="#{}" x="{:.3f}" y="{:.3f}"/>\n'.format(name, dx * params.UM_PER_CM,
+                                                                      dy * params.UM_PER_CM)
+    yield '</g>\n</svg>\n'
+
+
+def _svg_path(closed: bool, chain) -> str:
+    parts = ['M{:.3f} {:.3f}'.format(chain[0][1] * params.UM_PER_CM, chain[0][2] * params.UM_PER_CM)]
+    for kind, x0, y0, xm, ym, x1, y1 in chain:
+        if kind == layout.ARC:
+            # Half circles take the small arc flag, whatever rounding did to their sweep
+            arc = arcs.Arc.from_points(x0, y0, xm, ym, x1, y1)
+            parts.append('A{0:.3f} {0:.3f} 0 {1} {2} {3:.3f} {4:.3f}'.format(
+                arc.radius * params.UM_PER_CM, int(abs(arc.sweep) > math.pi + 1e-9), int(arc.sweep > 0),
+                x1 * params.UM_PER_CM, y1 * params.UM_PER_CM))
+        else:
+            parts.append('L{:.3f} {:.3f}'.format(x1 * params.UM_PER_CM, y1 * params.UM_PER_CM))
+    if closed:
+        parts.append('Z')
+    return ' '.join(parts)
+
+
+def _union_bounds(bounds):
+    bounds = list(bounds)
+    if not bounds:
+        return (0.0, 0.0, 0.0, 0.0)
+    return (min(b[0] for b in bounds), min(b[1] for b in bounds),
+            max(b[2] for b in bounds), max(b[3] for b in bounds))
+
+
+# GDSII (one structure per design with a BOUNDARY per closed profile, a top structure of SREFs)
+# Database unit 1 nm, user unit 1 um.
+
+def gds_records(designs: dict, placements, tolerance: float = DEFAULT_TOLERANCE, layer: int = 1,
+                top: str = 'TOP'):
+    stamp = _gds_timestamp()
+    yield _gds_record(0x00, 0x02, struct.pack('>h', 600))
+    yield _gds_record(0x01, 0x02, stamp + stamp)
+    yield _gds_record(0x02, 0x06, _gds_string('GRADGEN'))
+    yield _gds_record(0x03, 0x05, _gds_real(1e-3) + _gds_real(1e-9))
+    for name, table in designs.items():
+        yield _gds_record(0x05, 0x02, stamp + stamp)
+        yield _gds_record(0x06, 0x06, _gds_string(name))
+        for closed, chain in geometry.profile_loops(table):
+            if closed:
+                yield _gds_boundary(geometry.chain_polygon(chain, tolerance / params.UM_PER_CM), layer)
+        yield _gds_record(0x07, 0x00)
+    yield _gds_record(0x05, 0x02, stamp + stamp)
+    yield _gds_record(0x06, 0x06, _gds_string(top))
+    for name, dx, dy in placements:
+        yield _gds_record(0x0A, 0x00)
+        yield _gds_record(0x12, 0x06, _gds_string(name))
+        yield _gds_record(0x10, 0x03, struct.pack('>ii', _nm(dx), _nm(dy)))
+        yield _gds_record(0x11, 0x00)
+    yield _gds_record(0x07, 0x00)
+    yield _gds_record(0x04, 0x00)
+
+
+def _nm(value: float) -> int:
+    # cm to database units
+    return int(round(value * 1e7))
+
+
+def _gds_boundary(points, layer: int) -> bytes:
+    if len(points) + 1 > GDS_MAX_POINTS:
+        raise ValueError('Polygon with {} points exceeds the GDSII limit, use a larger tolerance'.format(len(points)))
+    xy = [v for x, y in points for v in (_nm(x), _nm(y))]
+    xy += xy[:2]
+    return b''.join([
+        _gds_record(0x08, 0x00),
+        _gds_record(0x0D, 0x02, struct.pack('>h', layer)),
+        _gds_record(0x0E, 0x02, struct.pack('>h', 0)),
+        _gds_record(0x10, 0x03, struct.pack('>{}i'.format(len(xy)), *xy)),
+        _gds_record(0x11, 0x00),
+    ])
+
+
+def _gds_record(record_type: int, data_type: int, data: bytes = b'') -> bytes:
+    return struct.pack('>HBB', len(data) + 4, record_type, data_type) + data
+
+
+def _gds_string(text: str) -> bytes:
+    data = text.encode('ascii')
+    return data + b'\0' if len(data) % 2 else data
+
+
+def _gds_real(value: float) -> bytes:
+    # 8 byte excess-64 base-16 floating point
+    if value == 0:
+        return bytes(8)
+    sign = 0x80 if value < 0 else 0
+    value = abs(value)
+    exponent = 64
+    while value >= 1:
+        value /= 16
+        exponent += 1
+    while value < 1 / 16:
+        value *= 16
+        exponent -= 1
+    mantissa = int(round(value * (1 << 56)))
+    if mantissa >= 1 << 56:
+        mantissa >>= 4
+        exponent += 1
+    return bytes([sign | exponent]) + mantissa.to_bytes(7, 'big')
+
+
+def _gds_timestamp() -> bytes:
+    now = time.localtime()
+    return struct.pack('>6h', now.tm_year, now.tm_mon, now.tm_mday, now.tm_hour, now.tm_min, now.tm_sec)
+
+
+def grid_placements(name: str, columns: int, rows: int, pitch_x: float, pitch_y: float):
+    # Placements of one design on a columns x rows grid, pitches in cm
+    for row in range(rows):
+        for column in range(columns):
+            yield name, column * pitch_x, row * pitch_y
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export a gradient generator mask as DXF, SVG or GDSII.')
+    parser.add_argument('variant', help='JSON object with dialog parameters (um), as used by gradlib.batch')
+    parser.add_argument('out', help='output file (.dxf, .svg or .gds)')
+    parser.add_argument('--array', default='1x1', help='columns x rows of generators, e.g. 10x10')
+    parser.add_argument('--pitch', type=float, default=None, help='array pitch (um), footprint plus margin by default')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='arc chord tolerance (um), GDSII only')
+    parser.add_argument('--layer', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    with open(args.variant) as f:
+        variant = batch.read_variant(json.load(f))
+    errors = variant.check()
+    if errors:
+        print('{}: {}'.format(args.variant, '; '.join(errors)))
+        sys.exit(1)
+    metrics, table = batch.compute_variant(variant)
+    columns, rows = (int(v) for v in args.array.lower().split('x'))
+    if args.pitch is None:
+        margin = 1000
+        pitch_x = (metrics['width_um'] + margin) / params.UM_PER_CM
+        pitch_y = (metrics['height_um'] + margin) / params.UM_PER_CM
+    else:
+        pitch_x = pitch_y = args.pitch / params.UM_PER_CM
+
+    bounds = table.bounds()
+    view_box = (bounds[0], bounds[1], bounds[2] + (columns - 1) * pitch_x, bounds[3] + (rows - 1) * pitch_y)
+
+    start = time.perf_counter()
+    export(args.out, {'GRADGEN': table}, grid_placements('GRADGEN', columns, rows, pitch_x, pitch_y),
+           args.tolerance, args.layer, view_box)
+    print('{} generators in {:.2f} s -> {}'.format(columns * rows, time.perf_counter() - start, args.out))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,940 @@
+# Recording stand-in for the parts of the Fusion API the script uses.
+# Every call is counted on a Recorder together with a simulated latency, sketches count how often
+# they would be solved, and components count the timeline features built in them. install() puts
+# the stand-in into sys.modules as adsk, adsk.core, adsk.fusion and adsk.cam, so the script itself
+# can run on a machine without Fusion 360 (see load_script).
+#
+# The latencies are rough guesses of what the calls cost in Fusion; pass measured ones to
+# Recorder/reset to get absolute numbers. Profiles are approximated: a sketch has one profile per
+# independent cycle of its curve graph, with the extent of the closed loops found in it.
+# Editing a user parameter recomputes every feature whose expressions use it and every feature
+# built on one of those (extrudes on their sketch, patterns on their input features).
+# Deleting the last occurrence of a component removes its features from the timeline.
+import importlib
+import os
+import re
+import sys
+import time
+import types
+from collections import Counter
+
+from . import geometry, layout
+
+# Seconds per call, 'call' applies to every call without an own entry
+DEFAULT_LATENCY = {
+    'call': 2e-5,
+    'solve_per_curve': 2e-5,
+    'ExtrudeFeatures.add': 5e-2,
+    'RectangularPatternFeatures.add': 2e-2,
+    'MoveFeatures.add': 1e-2,
+    'Occurrences.addNewComponent': 1e-2,
+    'Occurrences.addExistingComponent': 2e-3,
+    'Occurrence.deleteMe': 5e-3,
+}
+
+
+class FusionError(RuntimeError):
+    pass
+
+
+class Recorder:
+    def __init__(self, latency: dict = None, sleep: bool = False):
+        self.calls = Counter()
+        self.latency = dict(DEFAULT_LATENCY if latency is None else latency)
+        self.sleep = sleep
+        self.simulated = 0.0
+        self.solved_curves = 0
+        self.components = []
+        self.timeline = []
+
+    def record(self, name: str, weight: float = 1):
+        self.calls[name] += 1
+        self._spend(self.latency.get(name, self.latency.get('call', 0.0)) * weight)
+
+    def solve(self, curves: int):
+        # A sketch solve, its cost grows with the number of curves in the sketch
+        self.calls['Sketch.compute'] += 1
+        self.solved_curves += curves
+        self._spend(self.latency.get('solve_per_curve', 0.0) * curves)
+
+    def recompute(self, name: str) -> float:
+        # Recompute after an edit of user parameter name, returns the simulated seconds it took
+        uses = re.compile(r'\b{}\b'.format(re.escape(name)))
+        dirty = set()
+        seconds = 0.0
+        for item in self.timeline:
+            if any(uses.search(e) for e in item.expressions()) or any(id(i) in dirty for i in item.inputs()):
+                dirty.add(id(item))
+                seconds += item.cost()
+        if dirty:
+            self.calls['Timeline.recompute'] += 1
+            self._spend(seconds)
+        return seconds
+
+    def _spend(self, seconds: float):
+        self.simulated += seconds
+        if self.sleep and seconds > 0:
+            time.sleep(seconds)
+
+    @property
+    def total(self):
+        return sum(v for k, v in self.calls.items() if k not in ('Sketch.compute', 'Timeline.recompute'))
+
+    @property
+    def features(self):
+        # Timeline features (sketches, extrudes, patterns, moves) of every component
+        return sum(c.sketches.count + c.features.extrudeFeatures.count + c.features.rectangularPatternFeatures.count
+                   + c.features.moveFeatures.count for c in self.components)
+
+    @property
+    def bodies(self):
+        return sum(c.bRepBodies.count for c in self.components)
+
+
+recorder = Recorder()
+
+
+def reset(latency: dict = None, sleep: bool = False) -> Recorder:
+    # Start a new recording, returns it
+    global recorder
+    recorder = Recorder(latency, sleep)
+    return recorder
+
+
+class _Object:
+    @staticmethod
+    def cast(obj):
+        return obj
+
+
+class _TimelineItem:
+    # A feature as seen by Recorder.recompute: what it costs, which expressions it uses and which
+    # items it is built on
+    def __init__(self, cost, expressions, inputs=list):
+        self.cost = cost
+        self.expressions = expressions
+        self.inputs = inputs
+
+
+def _items(entities):
+    # Timeline items of profiles or features, single or in an ObjectCollection
+    entities = entities if isinstance(entities, ObjectCollection) else [entities]
+    return [e.timeline_item for e in entities if getattr(e, 'timeline_item', None) is not None]
+
+
+def _expressions(*values):
+    return [v.stringValue for v in values if isinstance(v, ValueInput) and v.stringValue is not None]
+
+
+# adsk.core
+
+class Point3D(_Object):
+    __slots__ = ('x', 'y', 'z')
+
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x = x
+        self.y = y
+        self.z = z
+
+    @staticmethod
+    def create(x=0.0, y=0.0, z=0.0):
+        recorder.record('Point3D.create')
+        return Point3D(x, y, z)
+
+    def __repr__(self):
+        return 'Point3D({}, {}, {})'.format(self.x, self.y, self.z)
+
+
+class Vector3D(_Object):
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x = x
+        self.y = y
+        self.z = z
+
+    @staticmethod
+    def create(x=0.0, y=0.0, z=0.0):
+        recorder.record('Vector3D.create')
+        return Vector3D(x, y, z)
+
+
+class Matrix3D(_Object):
+    def __init__(self):
+        self._translation = Vector3D()
+
+    @staticmethod
+    def create():
+        recorder.record('Matrix3D.create')
+        return Matrix3D()
+
+    @property
+    def translation(self):
+        return self._translation
+
+    @translation.setter
+    def translation(self, value):
+        recorder.record('Matrix3D.translation')
+        self._translation = value
+
+
+class ValueInput(_Object):
+    def __init__(self, real=None, text=None):
+        self.realValue = real
+        self.stringValue = text
+
+    @staticmethod
+    def createByReal(value):
+        recorder.record('ValueInput.createByReal')
+        return ValueInput(real=value)
+
+    @staticmethod
+    def createByString(text):
+        recorder.record('ValueInput.createByString')
+        return ValueInput(text=text)
+
+    def as_number(self) -> float:
+        if self.realValue is not None:
+            return self.realValue
+        try:
+            return float(self.stringValue)
+        except ValueError:
+            return 1.0
+
+
+class ObjectCollection(_Object):
+    def __init__(self):
+        self._items = []
+
+    @staticmethod
+    def create():
+        recorder.record('ObjectCollection.create')
+        return ObjectCollection()
+
+    def add(self, item):
+        recorder.record('ObjectCollection.add')
+        self._items.append(item)
+        return True
+
+    @property
+    def count(self):
+        return len(self._items)
+
+    def item(self, index):
+        return self._items[index]
+
+    def __iter__(self):
+        return iter(list(self._items))
+
+
+class BoundingBox3D(_Object):
+    def __init__(self, min_x, min_y, max_x, max_y):
+        self.minPoint = Point3D(min_x, min_y, 0)
+        self.maxPoint = Point3D(max_x, max_y, 0)
+
+
+class Palette(_Object):
+    def __init__(self):
+        self.lines = []
+
+    def writeText(self, text):
+        self.lines.append(text)
+
+
+class Palettes(_Object):
+    def __init__(self):
+        self._text_commands = Palette()
+
+    def itemById(self, id):
+        return self._text_commands if id == 'TextCommands' else None
+
+
+class UserInterface(_Object):
+    def __init__(self, raise_on_message: bool = True):
+        self.messages = []
+        self.raise_on_message = raise_on_message
+        self.palettes = Palettes()
+
+    def messageBox(self, text, *args):
+        self.messages.append(text)
+        if self.raise_on_message:
+            raise FusionError(text)
+
+
+class Application(_Object):
+    _instance = None
+
+    def __init__(self):
+        self.userInterface = UserInterface()
+        self.activeProduct = Design()
+
+    @staticmethod
+    def get():
+        if Application._instance is None:
+            Application._instance = Application()
+        return Application._instance
+
+
+class DropDownStyles:
+    TextListDropDownStyle = 0
+
+
+class _Handler(_Object):
+    def __init__(self):
+        pass
+
+
+class CommandEventHandler(_Handler):
+    pass
+
+
+class CommandCreatedEventHandler(_Handler):
+    pass
+
+
+class InputChangedEventHandler(_Handler):
+    pass
+
+
+class ValidateInputsEventHandler(_Handler):
+    pass
+
+
+# adsk.fusion
+
+class DimensionOrientations:
+    AlignedDimensionOrientation = 0
+    HorizontalDimensionOrientation = 1
+    VerticalDimensionOrientation = 2
+
+
+class FeatureOperations:
+    JoinFeatureOperation = 0
+    CutFeatureOperation = 1
+    IntersectFeatureOperation = 2
+    NewBodyFeatureOperation = 3
+    NewComponentFeatureOperation = 4
+
+
+class PatternDistanceType:
+    ExtentPatternDistanceType = 0
+    SpacingPatternDistanceType = 1
+
+
+class SketchPoint(_Object):
+    __slots__ = ('geometry', 'isFixed')
+
+    def __init__(self, geometry: Point3D):
+        self.geometry = geometry
+        self.isFixed = False
+
+
+class SketchLine(_Object):
+    def __init__(self, start: SketchPoint, end: SketchPoint):
+        self.startSketchPoint = start
+        self.endSketchPoint = end
+
+
+class SketchArc(_Object):
+    def __init__(self, start: SketchPoint, mid: Point3D, end: SketchPoint):
+        # Like Fusion, arcs are stored counter clockwise
+        a, b = start.geometry, end.geometry
+        cross = (mid.x - a.x) * (b.y - a.y) - (mid.y - a.y) * (b.x - a.x)
+        if cross < 0:
+            start, end = end, start
+        self.startSketchPoint = start
+        self.endSketchPoint = end
+        self.midPoint = mid
+
+
+class SketchLines(_Object):
+    def __init__(self, sketch):
+        self._sketch = sketch
+        self.items = []
+
+    @property
+    def count(self):
+        return len(self.items)
+
+    def item(self, index):
+        return self.items[index]
+
+    def addByTwoPoints(self, start, end):
+        sketch = self._sketch
+        sketch.recorder.record('SketchLines.addByTwoPoints')
+        line = SketchLine(sketch._sketch_point(start), sketch._sketch_point(end))
+        self.items.append(line)
+        sketch._changed()
+        return line
+
+    def addTwoPointRectangle(self, corner, opposite):
+        sketch = self._sketch
+        sketch.recorder.record('SketchLines.addTwoPointRectangle')
+        a = sketch._sketch_point(corner)
+        c = sketch._sketch_point(opposite)
+        b = sketch._sketch_point(Point3D(c.geometry.x, a.geometry.y, 0))
+        d = sketch._sketch_point(Point3D(a.geometry.x, c.geometry.y, 0))
+        lines = [SketchLine(a, b), SketchLine(b, c), SketchLine(c, d), SketchLine(d, a)]
+        self.items.extend(lines)
+        sketch._changed()
+        return lines
+
+
+class SketchArcs(_Object):
+    def __init__(self, sketch):
+        self._sketch = sketch
+        self.items = []
+
+    @property
+    def count(self):
+        return len(self.items)
+
+    def item(self, index):
+        return self.items[index]
+
+    def addByThreePoints(self, start, mid, end):
+        sketch = self._sketch
+        sketch.recorder.record('SketchArcs.addByThreePoints')
+        arc = SketchArc(sketch._sketch_point(start), mid, sketch._sketch_point(end))
+        self.items.append(arc)
+        sketch._changed()
+        return arc
+
+
+class SketchCurves(_Object):
+    def __init__(self, sketch):
+        self.sketchLines = SketchLines(sketch)
+        self.sketchArcs = SketchArcs(sketch)
+
+    @property
+    def count(self):
+        return self.sketchLines.count + self.sketchArcs.count
+
+
+class BRepBodies(_Object):
+    def __init__(self):
+        self._items = []
+
+    def extend(self, bodies):
+        self._items.extend(bodies)
+
+    @property
+    def count(self):
+        return len(self._items)
+
+    def item(self, index):
+        return self._items[index]
+
+
+class GeometricConstraints(_Object):
+    def __init__(self):
+        self.items = []
+
+    def addHorizontal(self, line):
+        recorder.record('GeometricConstraints.addHorizontal')
+        self.items.append(('horizontal', line))
+        return self.items[-1]
+
+    def addVertical(self, line):
+        recorder.record('GeometricConstraints.addVertical')
+        self.items.append(('vertical', line))
+        return self.items[-1]
+
+    @property
+    def count(self):
+        return len(self.items)
+
+
+class ModelParameter(_Object):
+    def __init__(self, expression: str):
+        self._expression = expression
+
+    @property
+    def expression(self):
+        return self._expression
+
+    @expression.setter
+    def expression(self, value):
+        recorder.record('ModelParameter.expression')
+        self._expression = value
+
+
+class SketchDimension(_Object):
+    def __init__(self, start, end, value: float):
+        self.start = start
+        self.end = end
+        self.parameter = ModelParameter('{} cm'.format(value))
+
+
+class SketchDimensions(_Object):
+    def __init__(self):
+        self.items = []
+
+    def addDistanceDimension(self, start, end, orientation, textPoint):
+        recorder.record('SketchDimensions.addDistanceDimension')
+        a, b = start.geometry, end.geometry
+        if orientation == DimensionOrientations.HorizontalDimensionOrientation:
+            value = abs(b.x - a.x)
+        elif orientation == DimensionOrientations.VerticalDimensionOrientation:
+            value = abs(b.y - a.y)
+        else:
+            value = ((b.x - a.x) ** 2 + (b.y - a.y) ** 2) ** 0.5
+        dimension = SketchDimension(start, end, value)
+        self.items.append(dimension)
+        return dimension
+
+    @property
+    def count(self):
+        return len(self.items)
+
+
+class Profile(_Object):
+    def __init__(self, bounds, timeline_item=None):
+        self.boundingBox = BoundingBox3D(*bounds)
+        self.timeline_item = timeline_item
+
+
+class Profiles(_Object):
+    def __init__(self, profiles):
+        self._profiles = profiles
+
+    @property
+    def count(self):
+        return len(self._profiles)
+
+    def item(self, index):
+        return self._profiles[index]
+
+    def __iter__(self):
+        return iter(self._profiles)
+
+
+class Sketch(_Object):
+    def __init__(self, recorder: Recorder = None):
+        self.recorder = recorder if recorder is not None else globals()['recorder']
+        self.sketchCurves = SketchCurves(self)
+        self.sketchPoints = []
+        self.geometricConstraints = GeometricConstraints()
+        self.sketchDimensions = SketchDimensions()
+        self.recomputes = 0
+        self.timeline_item = None
+        self._deferred = False
+
+    @property
+    def isComputeDeferred(self):
+        return self._deferred
+
+    @isComputeDeferred.setter
+    def isComputeDeferred(self, value):
+        if self._deferred and not value:
+            self._solve()
+        self._deferred = value
+
+    @property
+    def profiles(self):
+        self.recorder.record('Sketch.profiles')
+        rows = []
+        for line in self.sketchCurves.sketchLines.items:
+            a, b = line.startSketchPoint.geometry, line.endSketchPoint.geometry
+            rows.append((layout.LINE, a.x, a.y, (a.x + b.x) / 2, (a.y + b.y) / 2, b.x, b.y))
+        for arc in self.sketchCurves.sketchArcs.items:
+            a, b, m = arc.startSketchPoint.geometry, arc.endSketchPoint.geometry, arc.midPoint
+            rows.append((layout.ARC, a.x, a.y, m.x, m.y, b.x, b.y))
+        profiles = []
+        for closed, chain in geometry.chain_loops(rows):
+            if closed:
+                xs = [v for row in chain for v in (row[1], row[3], row[5])]
+                ys = [v for row in chain for v in (row[2], row[4], row[6])]
+                profiles.append(Profile((min(xs), min(ys), max(xs), max(ys)), self.timeline_item))
+        # Regions of a planar graph: edges - vertices + connected parts
+        regions = len(rows) - len(self.sketchPoints) + self._parts()
+        if rows and len(profiles) < regions:
+            xs = [v for row in rows for v in (row[1], row[5])]
+            ys = [v for row in rows for v in (row[2], row[6])]
+            profiles += [Profile((min(xs), min(ys), max(xs), max(ys)), self.timeline_item)] * (regions - len(profiles))
+        return Profiles(profiles)
+
+    def _parts(self):
+        parent = {id(p): id(p) for p in self.sketchPoints}
+
+        def find(k):
+            while parent[k] != k:
+                parent[k] = parent[parent[k]]
+                k = parent[k]
+            return k
+
+        for curve in self.sketchCurves.sketchLines.items + self.sketchCurves.sketchArcs.items:
+            parent[find(id(curve.startSketchPoint))] = find(id(curve.endSketchPoint))
+        return len(set(find(k) for k in parent))
+
+    def _sketch_point(self, point):
+        if isinstance(point, SketchPoint):
+            return point
+        sketch_point = SketchPoint(point)
+        self.sketchPoints.append(sketch_point)
+        return sketch_point
+
+    def _changed(self):
+        # Every edit of a sketch that is not deferred triggers a solve
+        if not self._deferred:
+            self._solve()
+
+    def _solve(self):
+        self.recomputes += 1
+        self.recorder.solve(self.sketchCurves.count)
+
+
+class Sketches(_Object):
+    def __init__(self):
+        self._items = []
+
+    def add(self, plane):
+        recorder.record('Sketches.add')
+        sketch = Sketch()
+        self._items.append(sketch)
+        sketch.timeline_item = _TimelineItem(
+            lambda: sketch.recorder.latency.get('solve_per_curve', 0.0) * sketch.sketchCurves.count,
+            lambda: [d.parameter.expression for d in sketch.sketchDimensions.items])
+        recorder.timeline.append(sketch.timeline_item)
+        return sketch
+
+    @property
+    def count(self):
+        return len(self._items)
+
+    def item(self, index):
+        return self._items[index]
+
+
+class ExtrudeFeatureInput(_Object):
+    def __init__(self, profiles, operation):
+        self.profiles = profiles
+        self.operation = operation
+        self.distance = None
+
+    def setDistanceExtent(self, isSymmetric, distance):
+        recorder.record('ExtrudeFeatureInput.setDistanceExtent')
+        self.distance = distance
+        return True
+
+
+class ExtrudeFeature(_Object):
+    def __init__(self, input):
+        self.input = input
+        self.timeline_item = None
+
+
+class ExtrudeFeatures(_Object):
+    def __init__(self, component):
+        self._component = component
+        self._items = []
+
+    def createInput(self, profiles, operation):
+        recorder.record('ExtrudeFeatures.createInput')
+        return ExtrudeFeatureInput(profiles, operation)
+
+    def add(self, input):
+        recorder.record('ExtrudeFeatures.add')
+        feature = ExtrudeFeature(input)
+        cost = recorder.latency.get('ExtrudeFeatures.add', 0.0)
+        feature.timeline_item = _TimelineItem(lambda: cost, lambda: _expressions(input.distance),
+                                              lambda: _items(input.profiles))
+        recorder.timeline.append(feature.timeline_item)
+        self._items.append(feature)
+        regions = input.profiles.count if isinstance(input.profiles, ObjectCollection) else 1
+        self._component.bRepBodies.extend([feature] * regions)
+        return feature
+
+    @property
+    def count(self):
+        return len(self._items)
+
+    def item(self, index):
+        return self._items[index]
+
+
+class RectangularPatternFeatureInput(_Object):
+    def __init__(self, entities, axis, quantity, distance, distance_type):
+        self.entities = entities
+        self.quantity_one = quantity
+        self.distance_one = distance
+        self.quantity_two = ValueInput(real=1)
+        self.distance_two = None
+
+    def setDirectionTwo(self, axis, quantity, distance):
+        recorder.record('RectangularPatternFeatureInput.setDirectionTwo')
+        self.quantity_two = quantity
+        self.distance_two = distance
+        return True
+
+
+class RectangularPatternFeatures(_Object):
+    def __init__(self, component):
+        self._component = component
+        self._items = []
+
+    def createInput(self, entities, axis, quantity, distance, distance_type):
+        recorder.record('RectangularPatternFeatures.createInput')
+        return RectangularPatternFeatureInput(entities, axis, quantity, distance, distance_type)
+
+    def add(self, input):
+        # Cost grows with the number of patterned instances
+        copies = int(input.quantity_one.as_number() * input.quantity_two.as_number())
+        weight = copies * input.entities.count
+        recorder.record('RectangularPatternFeatures.add', weight)
+        cost = recorder.latency.get('RectangularPatternFeatures.add', 0.0) * weight
+        input.timeline_item = _TimelineItem(lambda: cost, lambda: _expressions(
+            input.quantity_one, input.distance_one, input.quantity_two, input.distance_two),
+            lambda: _items(input.entities))
+        recorder.timeline.append(input.timeline_item)
+        self._items.append(input)
+        self._component.bRepBodies.extend([input] * ((copies - 1) * input.entities.count))
+        return input
+
+    @property
+    def count(self):
+        return len(self._items)
+
+    def item(self, index):
+        return self._items[index]
+
+
+class MoveFeatureInput(_Object):
+    def __init__(self, entities):
+        self.entities = entities
+        self.distances = ()
+
+    def defineAsTranslateXYZ(self, xDistance, yDistance, zDistance, isDataInModelSpace):
+        recorder.record('MoveFeatureInput.defineAsTranslateXYZ')
+        self.distances = (xDistance, yDistance, zDistance)
+        return True
+
+
+class MoveFeatures(_Object):
+    def __init__(self, component):
+        self._component = component
+        self._items = []
+
+    def createInput2(self, entities):
+        recorder.record('MoveFeatures.createInput2')
+        return MoveFeatureInput(entities)
+
+    def add(self, input):
+        # Moves the bodies in place, it makes none
+        recorder.record('MoveFeatures.add')
+        cost = recorder.latency.get('MoveFeatures.add', 0.0)
+        input.timeline_item = _TimelineItem(lambda: cost, lambda: _expressions(*input.distances),
+                                            lambda: _items(input.entities))
+        recorder.timeline.append(input.timeline_item)
+        self._items.append(input)
+        return input
+
+    @property
+    def count(self):
+        return len(self._items)
+
+    def item(self, index):
+        return self._items[index]
+
+
+class Features(_Object):
+    def __init__(self, component):
+        self.extrudeFeatures = ExtrudeFeatures(component)
+        self.rectangularPatternFeatures = RectangularPatternFeatures(component)
+        self.moveFeatures = MoveFeatures(component)
+
+
+class Attribute(_Object):
+    def __init__(self, parent, groupName, name, value):
+        self.parent = parent
+        self.groupName = groupName
+        self.name = name
+        self.value = value
+
+
+class Attributes(_Object):
+    def __init__(self, parent):
+        self._parent = parent
+        self._items = []
+
+    def add(self, groupName, name, value):
+        # Like Fusion, adding an existing group and name replaces its value
+        recorder.record('Attributes.add')
+        attribute = self._find(groupName, name)
+        if attribute:
+            attribute.value = value
+        else:
+            attribute = Attribute(self._parent, groupName, name, value)
+            self._items.append(attribute)
+        return attribute
+
+    def itemByName(self, groupName, name):
+        recorder.record('Attributes.itemByName')
+        return self._find(groupName, name)
+
+    def _find(self, groupName, name):
+        return next((a for a in self._items if a.groupName == groupName and a.name == name), None)
+
+    @property
+    def count(self):
+        return len(self._items)
+
+
+class Occurrence(_Object):
+    def __init__(self, component, transform, occurrences):
+        self.component = component
+        self.transform = transform
+        self.attributes = Attributes(self)
+        self._occurrences = occurrences
+        component._references += 1
+
+    def deleteMe(self):
+        recorder.record('Occurrence.deleteMe')
+        if self not in self._occurrences._items:
+            raise FusionError('Occurrence was deleted')
+        self._occurrences._items.remove(self)
+        self.component._release()
+        return True
+
+
+class Occurrences(_Object):
+    def __init__(self):
+        self._items = []
+
+    def addNewComponent(self, transform):
+        recorder.record('Occurrences.addNewComponent')
+        occurrence = Occurrence(Component(), transform, self)
+        self._items.append(occurrence)
+        return occurrence
+
+    def addExistingComponent(self, component, transform):
+        recorder.record('Occurrences.addExistingComponent')
+        occurrence = Occurrence(component, transform, self)
+        self._items.append(occurrence)
+        return occurrence
+
+    @property
+    def count(self):
+        return len(self._items)
+
+    def item(self, index):
+        return self._items[index]
+
+    def __iter__(self):
+        return iter(list(self._items))
+
+
+class Component(_Object):
+    def __init__(self):
+        self.sketches = Sketches()
+        self.features = Features(self)
+        self.occurrences = Occurrences()
+        self.bRepBodies = BRepBodies()
+        self.attributes = Attributes(self)
+        self.xYConstructionPlane = object()
+        self.xConstructionAxis = object()
+        self.yConstructionAxis = object()
+        self._references = 0
+        recorder.components.append(self)
+
+    def _release(self):
+        # One occurrence less, without any the component and its children leave the design
+        self._references -= 1
+        if self._references > 0:
+            return
+        for occurrence in list(self.occurrences._items):
+            occurrence.component._release()
+        items = ([s.timeline_item for s in self.sketches._items] +
+                 [f.timeline_item for f in self.features.extrudeFeatures._items] +
+                 [p.timeline_item for p in self.features.rectangularPatternFeatures._items] +
+                 [m.timeline_item for m in self.features.moveFeatures._items])
+        removed = set(map(id, items))
+        recorder.timeline[:] = [item for item in recorder.timeline if id(item) not in removed]
+        if self in recorder.components:
+            recorder.components.remove(self)
+
+
+class UserParameter(_Object):
+    def __init__(self, name, expression, unit, comment):
+        self.name = name
+        self._expression = expression
+        self.unit = unit
+        self.comment = comment
+
+    @property
+    def expression(self):
+        return self._expression
+
+    @expression.setter
+    def expression(self, value):
+        # Like Fusion, an edit recomputes the features that depend on the parameter
+        recorder.record('UserParameter.expression')
+        self._expression = value
+        recorder.recompute(self.name)
+
+
+class UserParameters(_Object):
+    def __init__(self):
+        self._items = []
+
+    def add(self, name, value, units, comment):
+        recorder.record('UserParameters.add')
+        parameter = UserParameter(name, value.stringValue, units, comment)
+        self._items.append(parameter)
+        return parameter
+
+    def itemByName(self, name):
+        recorder.record('UserParameters.itemByName')
+        return next((p for p in self._items if p.name == name), None)
+
+    @property
+    def count(self):
+        return len(self._items)
+
+    def item(self, index):
+        return self._items[index]
+
+
+class Design(_Object):
+    def __init__(self):
+        self.rootComponent = Component()
+        self.userParameters = UserParameters()
+
+
+def install():
+    # Register the stand-in as the adsk package, returns the adsk module
+    adsk = types.ModuleType('adsk')
+    core = types.ModuleType('adsk.core')
+    fusion = types.ModuleType('adsk.fusion')
+    cam = types.ModuleType('adsk.cam')
+    for name in ('Application', 'UserInterface', 'Point3D', 'Vector3D', 'Matrix3D', 'ValueInput',
+                 'ObjectCollection', 'BoundingBox3D', 'DropDownStyles', 'CommandEventHandler',
+                 'CommandCreatedEventHandler', 'InputChangedEventHandler', 'ValidateInputsEventHandler'):
+        setattr(core, name, globals()[name])
+    # Types the script only casts to
+    for name in ('CommandEventArgs', 'CommandCreatedEventArgs', 'InputChangedEventArgs', 'ValidateInputsEventArgs',
+                 'DropDownCommandInput', 'TextBoxCommandInput', 'StringValueCommandInput', 'BoolValueCommandInput'):
+        setattr(core, name, _Object)
+    for name in ('Design', 'Component', 'DimensionOrientations', 'FeatureOperations', 'PatternDistanceType'):
+        setattr(fusion, name, globals()[name])
+    adsk.core = core
+    adsk.fusion = fusion
+    adsk.cam = cam
+    adsk.autoTerminate = lambda value: None
+    adsk.terminate = lambda: None
+    sys.modules.update({'adsk': adsk, 'adsk.core': core, 'adsk.fusion': fusion, 'adsk.cam': cam})
+    return adsk
+
+
+def load_script():
+    # Import GradientGenerator.py against the stand-in. The script is loaded as a module of a
+    # package named after its folder, like Fusion does, so its relative imports work.
+    install()
+    script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    package_name = '_fake_' + os.path.basename(script_dir)
+    if package_name not in sys.modules:
+        package = types.ModuleType(package_name)
+        package.__path__ = [script_dir]
+        sys.modules[package_name] = package
+    script = importlib.import_module(package_name + '.GradientGenerator')
+    script._app = Application.get()
+    script._ui = script._app.userInterface
+    return script
@@ -0,0 +1,355 @@
+# Hydraulic network and concentration solver for the gradient generator.
+# The channel network is derived from the same parameters as the layout: every stage has a
+# connecting channel split into segments between its feed and exit points, and every serpentine
+# channel joins an exit point of one stage to a feed point of the next. Inlets are driven with
+# equal flow rates, outlets are at zero pressure. Node pressures come from the sparse nodal system,
+# solved with conjugate gradients and a two level preconditioner: an exact solve along each
+# connecting channel (the nodes of a connecting channel form a tridiagonal block) plus a coarse
+# correction that couples the stages. The coarse space has piecewise linear hat functions along
+# every connecting channel, so pressure errors that vary slowly across the stages are removed in
+# one step and the iteration count stays flat as stages are added. Outlet concentrations follow
+# from complete mixing at every node in flow order.
+import math
+import operator
+import time
+from array import array
+from collections import namedtuple
+
+from . import layout
+
+WATER_VISCOSITY = 1.0e-3  # Pa s
+DEFAULT_INLET_FLOW = 1.0e-11  # m^3/s per inlet, 0.6 ul/min
+
+# Knots of the coarse correction: every COARSE_SPACING-th node of a connecting channel, at most
+# COARSE_KNOTS per channel so that the banded factorization of the coarse system stays cheap
+COARSE_SPACING = 8
+COARSE_KNOTS = 32
+
+FlowResult = namedtuple('FlowResult', ['outlet_concentrations', 'outlet_flows', 'inlet_pressure',
+                                       'segments', 'iterations', 'solve_time'])
+
+
+def channel_resistance(length: float, width: float, height: float, viscosity: float = WATER_VISCOSITY) -> float:
+    # Hydraulic resistance (Pa s/m^3) of a rectangular channel, all lengths in cm
+    w = max(width, height) / 100
+    h = min(width, height) / 100
+    return 12 * viscosity * (length / 100) / (w * h ** 3 * (1 - 0.63 * h / w))
+
+
+class Network:
+    # Nodes are numbered 0..node_count-1, edges are stored as parallel arrays
+    # chains lists the nodes of every connecting channel in order along the channel
+    __slots__ = ('node_count', 'edge_a', 'edge_b', 'resistance', 'inlets', 'outlets', 'chains')
+
+    def __init__(self):
+        self.node_count = 0
+        self.edge_a = array('i')
+        self.edge_b = array('i')
+        self.resistance = array('d')
+        self.inlets = []
+        self.outlets = []
+        self.chains = []
+
+    def add_node(self) -> int:
+        self.node_count += 1
+        return self.node_count - 1
+
+    def add_edge(self, a: int, b: int, resistance: float):
+        self.edge_a.append(a)
+        self.edge_b.append(b)
+        self.resistance.append(resistance)
+
+    def __len__(self):
+        return len(self.resistance)
+
+
+def build_network(input_num: int, output_num: int, curve_rad: float, curve_num: int,
+                  channel_width: float, channel_height: float, connect_width: float = 0.5,
+                  height: float = 0.5, resistor_width: float = 0.3,
+                  viscosity: float = WATER_VISCOSITY) -> Network:
+    # Same parameters (and defaults) as layout.grad_generator plus the channel height
+    network = Network()
+    serpentine = channel_resistance(layout.serpentine_length(height, curve_num, curve_rad, resistor_width),
+                                    channel_width, channel_height, viscosity)
+    segment = channel_resistance(connect_width / 2, channel_width, channel_height, viscosity)
+
+    # Feed points of the first connecting channel are the inlets
+    feeds = [network.add_node() for i in range(input_num)]
+    network.inlets = list(feeds)
+    for unit_num in range(input_num + 1, output_num + 1):
+        # Exit points interleaved with the feed points along the connecting channel
+        exits = [network.add_node() for i in range(unit_num)]
+        chain = [exits[0]]
+        for i, feed in enumerate(feeds):
+            network.add_edge(exits[i], feed, segment)
+            network.add_edge(feed, exits[i + 1], segment)
+            chain += [feed, exits[i + 1]]
+        network.chains.append(chain)
+        # Serpentines end at the feed points of the next stage
+        feeds = [network.add_node() for i in range(unit_num)]
+        for exit_node, feed in zip(exits, feeds):
+            network.add_edge(exit_node, feed, serpentine)
+    network.outlets = feeds
+    return network
+
+
+def solve(network: Network, inlet_concentrations=None, inlet_flow: float = DEFAULT_INLET_FLOW,
+          tolerance: float = 1e-9) -> FlowResult:
+    start = time.perf_counter()
+    inlet_num = len(network.inlets)
+    if inlet_concentrations is None:
+        # Linear ramp from 1 to 0 across the inlets
+        inlet_concentrations = [1 - i / (inlet_num - 1) if inlet_num > 1 else 1.0 for i in range(inlet_num)]
+
+    # Conductance matrix of the free (non-outlet) nodes as diagonal plus neighbour lists
+    fixed = set(network.outlets)
+    index = {}
+    for node in range(network.node_count):
+        if node not in fixed:
+            index[node] = len(index)
+    size = len(index)
+    diag = [0.0] * size
+    neighbours = [[] for i in range(size)]
+    for a, b, r in zip(network.edge_a, network.edge_b, network.resistance):
+        g = 1 / r
+        ia = index.get(a)
+        ib = index.get(b)
+        if ia is not None:
+            diag[ia] += g
+        if ib is not None:
+            diag[ib] += g
+        if ia is not None and ib is not None:
+            neighbours[ia].append((ib, g))
+            neighbours[ib].append((ia, g))
+
+    rhs = [0.0] * size
+    for node in network.inlets:
+        rhs[index[node]] += inlet_flow
+    chains = [[index[node] for node in chain if node in index] for chain in network.chains]
+    line = _chain_preconditioner(chains, diag, neighbours)
+    coarse = _coarse_correction(chains, diag, neighbours)
+    precondition = lambda r: coarse(r, line(r))
+    free_pressure, iterations = _conjugate_gradient(diag, neighbours, rhs, precondition, tolerance)
+
+    pressure = [0.0] * network.node_count
+    for node, i in index.items():
+        pressure[node] = free_pressure[i]
+
+    # Complete mixing at every node, visited from high to low pressure
+    inflow = [0.0] * network.node_count
+    solute = [0.0] * network.node_count
+    for node, c in zip(network.inlets, inlet_concentrations):
+        inflow[node] += inlet_flow
+        solute[node] += inlet_flow * c
+    downstream = [[] for i in range(network.node_count)]
+    for a, b, r in zip(network.edge_a, network.edge_b, network.resistance):
+        q = (pressure[a] - pressure[b]) / r
+        if q > 0:
+            downstream[a].append((b, q))
+        elif q < 0:
+            downstream[b].append((a, -q))
+    concentration = [0.0] * network.node_count
+    for node in sorted(range(network.node_count), key=pressure.__getitem__, reverse=True):
+        if inflow[node] > 0:
+            concentration[node] = solute[node] / inflow[node]
+        for target, q in downstream[node]:
+            inflow[target] += q
+            solute[target] += q * concentration[node]
+
+    return FlowResult([concentration[node] for node in network.outlets],
+                      [inflow[node] for node in network.outlets],
+                      max(pressure[node] for node in network.inlets) if network.inlets else 0.0,
+                      len(network), iterations, time.perf_counter() - start)
+
+
+def _chain_preconditioner(chains, diag, neighbours):
+    # Returns z = M^-1 r where M keeps the diagonal and the couplings along each chain.
+    # Every chain is a tridiagonal block, factored once here (Thomas algorithm).
+    size = len(diag)
+    blocks = []
+    covered = set()
+    for chain in chains:
+        if not chain:
+            continue
+        covered.update(chain)
+        lower = [0.0]
+        for a, b in zip(chain, chain[1:]):
+            lower.append(-sum(g for j, g in neighbours[b] if j == a))
+        pivots = [diag[chain[0]]]
+        factors = [0.0]
+        for k in range(1, len(chain)):
+            factors.append(lower[k] / pivots[k - 1])
+            pivots.append(diag[chain[k]] - factors[k] * lower[k])
+        blocks.append((chain, lower, pivots, factors))
+    single = [i for i in range(size) if i not in covered]
+
+    def precondition(r):
+        z = [0.0] * size
+        for i in single:
+            z[i] = r[i] / diag[i]
+        for chain, lower, pivots, factors in blocks:
+            n = len(chain)
+            y = [r[chain[0]]]
+            for k in range(1, n):
+                y.append(r[chain[k]] - factors[k] * y[k - 1])
+            x = y[n - 1] / pivots[n - 1]
+            z[chain[n - 1]] = x
+            for k in range(n - 2, -1, -1):
+                x = (y[k] - lower[k + 1] * x) / pivots[k]
+                z[chain[k]] = x
+        return z
+
+    return precondition
+
+
+def _coarse_correction(chains, diag, neighbours):
+    # Returns correct(r, z), which returns z + P Ac^-1 P^T r. The columns of P are hat
+    # functions along each chain, node i is weight[i] of coarse unknown low[i] plus 1 - weight[i]
+    # of high[i]. Ac = P^T A P is banded (stages only couple to their neighbours) and factored once.
+    size = len(diag)
+    low = [0] * size
+    high = [0] * size
+    weight = [1.0] * size
+    covered = [False] * size
+    coarse_size = 0
+    for chain in chains:
+        if not chain:
+            continue
+        pieces = min(-(-(len(chain) - 1) // COARSE_SPACING), COARSE_KNOTS - 1)
+        if pieces == 0:
+            low[chain[0]] = high[chain[0]] = coarse_size
+            covered[chain[0]] = True
+            coarse_size += 1
+            continue
+        knots = [round(t * (len(chain) - 1) / pieces) for t in range(pieces + 1)]
+        for t in range(pieces):
+            start, end = knots[t], knots[t + 1]
+            for k in range(start, end + 1):
+                i = chain[k]
+                low[i] = coarse_size + t
+                high[i] = coarse_size + t + 1
+                weight[i] = (end - k) / (end - start)
+                covered[i] = True
+        coarse_size += pieces + 1
+    for i in range(size):
+        if not covered[i]:
+            low[i] = high[i] = coarse_size
+            coarse_size += 1
+
+    # Ac = P^T (D - N) P, lower triangle
+    entries = {}
+
+    def add(a, b, value):
+        key = (a, b) if a >= b else (b, a)
+        entries[key] = entries.get(key, 0.0) + value
+
+    for i in range(size):
+        hat_i = ((low[i], weight[i]), (high[i], 1 - weight[i]))
+        for a, wa in hat_i:
+            for b, wb in hat_i:
+                if a >= b:
+                    add(a, b, diag[i] * wa * wb)
+            for j, g in neighbours[i]:
+                if j < i:
+                    # The pair (i, j) stands for (j, i) too, which adds the same to the diagonal
+                    for b, wb in ((low[j], weight[j]), (high[j], 1 - weight[j])):
+                        add(a, b, -g * wa * wb * (2 if a == b else 1))
+    solve = _banded_cholesky(entries, coarse_size)
+
+    def correct(r, z):
+        rc = [0.0] * coarse_size
+        for a, b, w, v in zip(low, high, weight, r):
+            rc[a] += w * v
+            rc[b] += v - w * v
+        y = solve(rc)
+        return [v + w * y[a] + (1 - w) * y[b] for v, a, b, w in zip(z, low, high, weight)]
+
+    return correct
+
+
+def _banded_cholesky(entries, size):
+    # Factor the symmetric positive definite matrix given by its lower triangle entries {(i, j): v},
+    # i >= j, as L L^T within its band. Returns a solve function.
+    width = max((i - j for i, j in entries), default=0)
+    first = [max(0, i - width) for i in range(size)]
+    rows = [[0.0] * (i - first[i] + 1) for i in range(size)]
+    for (i, j), v in entries.items():
+        rows[i][j - first[i]] += v
+    for i in range(size):
+        row, lo = rows[i], first[i]
+        for j in range(lo, i):
+            other, start = rows[j], max(lo, first[j])
+            dot = sum(map(operator.mul, row[start - lo:j - lo], other[start - first[j]:j - first[j]]))
+            row[j - lo] = (row[j - lo] - dot) / other[-1]
+        row[-1] = math.sqrt(row[-1] - sum(v * v for v in row[:-1]))
+
+    # Columns of L below the diagonal, for the backward substitution
+    columns = [[rows[k][i - first[k]] for k in range(i + 1, min(size, i + width + 1))] for i in range(size)]
+
+    def solve(b):
+        y = list(b)
+        for i in range(size):
+            row, lo = rows[i], first[i]
+            y[i] = (y[i] - sum(map(operator.mul, row[:-1], y[lo:i]))) / row[-1]
+        for i in range(size - 1, -1, -1):
+            column = columns[i]
+            y[i] = (y[i] - sum(map(operator.mul, column, y[i + 1:i + 1 + len(column)]))) / rows[i][-1]
+        return y
+
+    return solve
+
+
+def _conjugate_gradient(diag, neighbours, rhs, precondition, tolerance):
+    # Preconditioned conjugate gradients for the symmetric positive definite nodal system
+    size = len(rhs)
+    # Neighbour indices and conductances as separate lists, for map in the matrix product
+    indices = [[j for j, g in row] for row in neighbours]
+    conductances = [[g for j, g in row] for row in neighbours]
+    x = [0.0] * size
+    r = list(rhs)
+    z = precondition(r)
+    p = list(z)
+    rz = sum(map(operator.mul, r, z))
+    limit = tolerance * math.sqrt(sum(v * v for v in rhs))
+    iterations = 0
+    for iterations in range(1, 10 * size + 1):
+        ap = [d * v - sum(map(operator.mul, g, map(p.__getitem__, j)))
+              for d, v, j, g in zip(diag, p, indices, conductances)]
+        alpha = rz / sum(map(operator.mul, p, ap))
+        x = [v + alpha * d for v, d in zip(x, p)]
+        r = [v - alpha * d for v, d in zip(r, ap)]
+        if math.sqrt(sum(v * v for v in r)) <= limit:
+            break
+        z = precondition(r)
+        rz_next = sum(map(operator.mul, r, z))
+        beta = rz_next / rz
+        rz = rz_next
+        p = [v + beta * d for v, d in zip(z, p)]
+    return x, iterations
+
+
+def linearity_error(concentrations) -> float:
+    # Largest deviation of the outlet concentrations from a straight line between the first and last one
+    count = len(concentrations)
+    if count < 3:
+        return 0.0
+    first, last = concentrations[0], concentrations[-1]
+    return max(abs(c - (first + (last - first) * i / (count - 1))) for i, c in enumerate(concentrations))
+
+
+def report(result: FlowResult) -> str:
+    # Short multi line summary for the dialog
+    return '\n'.join([
+        'Outlet concentration: {}'.format(' '.join('{:.2f}'.format(c) for c in result.outlet_concentrations)),
+        'Deviation from linear: {:.1%}'.format(linearity_error(result.outlet_concentrations)),
+        'Inlet pressure: {}'.format(format_pressure(result.inlet_pressure)),
+        '{} segments solved in {:.1f} ms'.format(result.segments, result.solve_time * 1000),
+    ])
+
+
+def format_pressure(pressure: float) -> str:
+    # Three significant digits in Pa, kPa or MPa, whichever keeps the number below 1000
+    for unit, scale in (('Pa', 1.0), ('kPa', 1e3)):
+        if abs(pressure) < 999.5 * scale:
+            return '{:.3g} {}'.format(pressure / scale, unit)
+    return '{:.3g} MPa'.format(pressure / 1e6)
@@ -0,0 +1,64 @@
+# Plane geometry helpers shared by the exporters: chaining primitives into loops and polygons.
+from collections import defaultdict
+
+from . import arcs, layout
+
+# Points closer than this (cm) are treated as the same point when chaining
+POINT_RESOLUTION = 1e-9
+
+
+def _key(x: float, y: float):
+    return (round(x / POINT_RESOLUTION), round(y / POINT_RESOLUTION))
+
+
+def chain_loops(rows):
+    # Group primitive rows (kind, x0, y0, xm, ym, x1, y1, ...) into chains of connected primitives.
+    # Yields (closed, chain), chain being a list of (kind, x0, y0, xm, ym, x1, y1) oriented head to tail.
+    rows = [row[:7] for row in rows]
+    ends = defaultdict(list)
+    for i, row in enumerate(rows):
+        ends[_key(row[1], row[2])].append(i)
+        ends[_key(row[5], row[6])].append(i)
+    used = [False] * len(rows)
+    for first in range(len(rows)):
+        if used[first]:
+            continue
+        used[first] = True
+        chain = [rows[first]]
+        start = _key(rows[first][1], rows[first][2])
+        current = _key(rows[first][5], rows[first][6])
+        while current != start:
+            following = next((i for i in ends[current] if not used[i]), None)
+            if following is None:
+                break
+            used[following] = True
+            kind, x0, y0, xm, ym, x1, y1 = rows[following]
+            if _key(x0, y0) != current:
+                x0, y0, x1, y1 = x1, y1, x0, y0
+            chain.append((kind, x0, y0, xm, ym, x1, y1))
+            current = _key(x1, y1)
+        yield current == start, chain
+
+
+def chain_polygon(chain, tolerance: float):
+    # Vertices of a chain with arcs replaced by chords, the start point is not repeated at the end
+    points = [(chain[0][1], chain[0][2])]
+    for kind, x0, y0, xm, ym, x1, y1 in chain:
+        if kind == layout.ARC:
+            # The last tessellated point is the arc's end up to rounding, use the exact one
+            points.extend(arcs.Arc.from_points(x0, y0, xm, ym, x1, y1).tessellate(tolerance)[:-1])
+            points.append((x1, y1))
+        else:
+            points.append((x1, y1))
+    if len(points) > 1 and _key(*points[0]) == _key(*points[-1]):
+        points.pop()
+    return points
+
+
+def profile_loops(table: layout.PrimitiveTable):
+    # Chains of every (stage, profile) group of a table, see chain_loops
+    groups = defaultdict(list)
+    for row in table.rows():
+        groups[(row[7], row[8])].append(row)
+    for key in sorted(groups):
+        yield from chain_loops(groups[key])
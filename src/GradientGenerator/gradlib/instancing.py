@@ -0,0 +1,56 @@
+# Planning for the instanced build mode.
+# Every serpentine channel of every stage is the same geometry, only translated, so it can be
+# built once as a template component and placed as occurrences instead of being re-sketched,
+# extruded and patterned per stage.
+from collections import namedtuple
+
+from . import layout
+
+# Offset of one channel occurrence relative to the template origin
+Placement = namedtuple('Placement', ['unit_num', 'copy', 'dx', 'dy'])
+
+# Timeline cost of a build
+FeatureCount = namedtuple('FeatureCount', ['sketches', 'extrudes', 'patterns', 'occurrences'])
+
+
+def channel_template(stages) -> layout.PrimitiveTable:
+    # Serpentine channel of the first stage moved to the origin
+    stage = stages[0]
+    ox, oy = stage.origin
+    return stage.template.select(layout.CHANNEL_PROFILES).translated(-ox, -oy)
+
+
+def channel_placements(stages):
+    # One placement per serpentine channel of every stage
+    placements = []
+    for stage in stages:
+        ox, oy = stage.origin
+        for i in range(stage.copies):
+            placements.append(Placement(stage.unit_num, i, ox + i * stage.pitch, oy))
+    return placements
+
+
+def feature_count(stages, instanced: bool, template: bool = True) -> FeatureCount:
+    # Sketches, extrudes and patterns the build adds to the timeline, and occurrences it creates
+    # (the generator occurrence and one per stage are the same for both modes). template: whether
+    # an instanced build draws the channel template, an update reuses the one of its kept stages.
+    stage_num = len(stages)
+    if not stage_num:
+        return FeatureCount(0, 0, 0, 1)
+    if instanced:
+        # Template: one sketch with three extruded profiles, stages: connecting channel only
+        channels = sum(stage.copies for stage in stages)
+        drawn = 1 if template else 0
+        return FeatureCount(drawn + stage_num, drawn * len(layout.CHANNEL_PROFILES) + stage_num, 0,
+                            1 + stage_num + channels)
+    # Per stage: channel sketch with three extrudes, one pattern, connecting sketch and extrude
+    return FeatureCount(2 * stage_num, (len(layout.CHANNEL_PROFILES) + 1) * stage_num, stage_num,
+                        1 + stage_num)
+
+
+def features_saved(stages, template: bool = True) -> int:
+    # Timeline features the instanced mode saves over the pattern per stage mode
+    pattern = feature_count(stages, False)
+    instanced = feature_count(stages, True, template)
+    return (pattern.sketches + pattern.extrudes + pattern.patterns
+            - instanced.sketches - instanced.extrudes - instanced.patterns)
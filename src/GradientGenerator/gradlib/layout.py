@@ -0,0 +1,292 @@
+# Layout engine for the gradient generator.
+# Computes every line and three point arc of the generator without touching the Fusion API.
+# Coordinates are in cm (Fusion internal length unit), z is always 0.
+import math
+import struct
+from array import array
+from collections import namedtuple
+
+from . import arcs
+
+# Primitive type codes
+LINE = 0
+ARC = 1
+
+# Profile ids. Inlet, resistor and outlet are drawn in one sketch (profiles 0..2 of that sketch),
+# the connecting channel of a stage is drawn in its own sketch.
+PROFILE_INLET = 0
+PROFILE_RESISTOR = 1
+PROFILE_OUTLET = 2
+PROFILE_CONNECT = 3
+
+CHANNEL_PROFILES = (PROFILE_INLET, PROFILE_RESISTOR, PROFILE_OUTLET)
+
+# Marks the byte order of files holding PrimitiveTable data, read them with swap when it differs
+BYTEORDER = {'little': b'<', 'big': b'>'}
+
+
+class PrimitiveTable:
+    # Structure of arrays holding lines and three point arcs.
+    # Lines store their midpoint in xm/ym so every row has the same shape.
+    __slots__ = ('kind', 'x0', 'y0', 'xm', 'ym', 'x1', 'y1', 'stage', 'profile')
+
+    def __init__(self):
+        self.kind = array('b')
+        self.x0 = array('d')
+        self.y0 = array('d')
+        self.xm = array('d')
+        self.ym = array('d')
+        self.x1 = array('d')
+        self.y1 = array('d')
+        self.stage = array('i')
+        self.profile = array('b')
+
+    def __len__(self):
+        return len(self.kind)
+
+    def add_line(self, x0: float, y0: float, x1: float, y1: float, stage: int, profile: int):
+        self._append(LINE, x0, y0, (x0 + x1) / 2, (y0 + y1) / 2, x1, y1, stage, profile)
+
+    def add_arc(self, x0: float, y0: float, xm: float, ym: float, x1: float, y1: float,
+                stage: int, profile: int):
+        self._append(ARC, x0, y0, xm, ym, x1, y1, stage, profile)
+
+    def add_rectangle(self, x0: float, y0: float, x1: float, y1: float, stage: int, profile: int):
+        # Same four edges sketchLines.addTwoPointRectangle would create
+        self.add_line(x0, y0, x1, y0, stage, profile)
+        self.add_line(x1, y0, x1, y1, stage, profile)
+        self.add_line(x1, y1, x0, y1, stage, profile)
+        self.add_line(x0, y1, x0, y0, stage, profile)
+
+    def _append(self, kind, x0, y0, xm, ym, x1, y1, stage, profile):
+        self.kind.append(kind)
+        self.x0.append(x0)
+        self.y0.append(y0)
+        self.xm.append(xm)
+        self.ym.append(ym)
+        self.x1.append(x1)
+        self.y1.append(y1)
+        self.stage.append(stage)
+        self.profile.append(profile)
+
+    def extend(self, other, dx: float = 0.0, dy: float = 0.0):
+        # Append all rows of other, translated by (dx, dy)
+        self.kind.extend(other.kind)
+        self.stage.extend(other.stage)
+        self.profile.extend(other.profile)
+        if dx == 0 and dy == 0:
+            for name in ('x0', 'y0', 'xm', 'ym', 'x1', 'y1'):
+                getattr(self, name).extend(getattr(other, name))
+            return
+        for name in ('x0', 'xm', 'x1'):
+            getattr(self, name).extend(array('d', [v + dx for v in getattr(other, name)]))
+        for name in ('y0', 'ym', 'y1'):
+            getattr(self, name).extend(array('d', [v + dy for v in getattr(other, name)]))
+
+    def translated(self, dx: float, dy: float):
+        table = PrimitiveTable()
+        table.extend(self, dx, dy)
+        return table
+
+    def select(self, profiles):
+        # New table with only the rows whose profile id is in profiles
+        table = PrimitiveTable()
+        for row in self.rows():
+            if row[8] in profiles:
+                table._append(*row)
+        return table
+
+    def rows(self):
+        return zip(self.kind, self.x0, self.y0, self.xm, self.ym, self.x1, self.y1,
+                   self.stage, self.profile)
+
+    def write(self, f):
+        # Row count followed by the raw columns, in native byte order
+        f.write(struct.pack('<I', len(self)))
+        for name in self.__slots__:
+            f.write(getattr(self, name).tobytes())
+
+    @classmethod
+    def read(cls, f, swap: bool = False):
+        # Counterpart of write, swap when the file was written with the other byte order
+        table = cls()
+        data = f.read(4)
+        if len(data) != 4:
+            raise EOFError('Truncated primitive table')
+        rows, = struct.unpack('<I', data)
+        for name in cls.__slots__:
+            column = getattr(table, name)
+            data = f.read(rows * column.itemsize)
+            if len(data) != rows * column.itemsize:
+                raise EOFError('Truncated primitive table')
+            column.frombytes(data)
+            if swap:
+                column.byteswap()
+        return table
+
+    def bounds(self):
+        # (min_x, min_y, max_x, max_y) of all primitive points, arcs use their end and mid points
+        if not len(self):
+            return None
+        xs = (self.x0, self.xm, self.x1)
+        ys = (self.y0, self.ym, self.y1)
+        return (min(min(v) for v in xs), min(min(v) for v in ys),
+                max(max(v) for v in xs), max(max(v) for v in ys))
+
+
+# One stage of the ladder.
+# template holds one serpentine channel (inlet, resistor, outlet) starting at origin and
+# the connecting channel of the stage. The serpentine is repeated copies times with pitch along x.
+StageLayout = namedtuple('StageLayout', ['unit_num', 'template', 'origin', 'pitch', 'copies', 'next_origin'])
+
+
+def resistor_part(table: PrimitiveTable, x: float, y: float,
+                  channel_width: float, curve_rad: float, resistor_width: float,
+                  stage: int, profile: int = PROFILE_RESISTOR):
+    # One turn of the serpentine: right turn followed by a left turn.
+    # Returns the origin of the next turn.
+    cw = channel_width
+    r = curve_rad
+    rw = resistor_width
+
+    right = x + rw / 2
+    table.add_line(x - cw / 2, y, right, y, stage, profile)
+    table.add_line(x - cw / 2, y + cw, right, y + cw, stage, profile)
+
+    # -- Outer and inner arc of the right turn
+    table.add_arc(right, y, right + r + cw / 2, y + cw / 2 + r, right, y + r * 2 + cw, stage, profile)
+    table.add_arc(right, y + cw, right + r - cw / 2, y + cw / 2 + r, right, y + r * 2, stage, profile)
+
+    left = right - rw
+    y = y + r * 2
+    table.add_line(left, y + cw, right, y + cw, stage, profile)
+    table.add_line(right, y, left, y, stage, profile)
+
+    # -- Outer and inner arc of the left turn
+    top = y + cw
+    table.add_arc(left, top - cw, left - r - cw / 2, top + r - cw / 2, left, top + r * 2, stage, profile)
+    table.add_arc(left, top, left - r + cw / 2, top + r - cw / 2, left, top + r * 2 - cw, stage, profile)
+
+    y = top + r * 2 - cw
+    end = left + rw / 2 - cw / 2
+    table.add_line(left, y + cw, end, y + cw, stage, profile)
+    table.add_line(end, y, left, y, stage, profile)
+
+    return left + rw / 2, y
+
+
+def single_grad(table: PrimitiveTable, x: float, y: float,
+                height: float, channel_width: float, curve_num: int,
+                curve_rad: float, resistor_width: float, stage: int):
+    # One serpentine channel: straight inlet, curve_num resistor turns, straight outlet
+    cw = channel_width
+    straight_len = (height - (curve_rad * 4 * curve_num)) / 2
+    table.add_rectangle(x - cw / 2, y, x + cw / 2, y + straight_len, stage, PROFILE_INLET)
+
+    rx, ry = x, y + straight_len
+    table.add_line(x - cw / 2, ry, x - cw / 2, ry + cw, stage, PROFILE_RESISTOR)
+    for i in range(0, curve_num):
+        rx, ry = resistor_part(table, rx, ry, cw, curve_rad, resistor_width, stage)
+    table.add_line(rx - cw / 2, ry, rx - cw / 2, ry + cw, stage, PROFILE_RESISTOR)
+
+    table.add_rectangle(rx - cw / 2, ry, rx + cw / 2, ry + straight_len, stage, PROFILE_OUTLET)
+    return table
+
+
+def grad_stage(unit_num: int, x: float, y: float,
+               connect_width: float, height: float,
+               channel_width: float, curve_num: int,
+               curve_rad: float, resistor_width: float) -> StageLayout:
+    # Stage with unit_num serpentine channels fed by one connecting channel
+    table = PrimitiveTable()
+    left = x - (unit_num - 1) * connect_width / 2
+    single_grad(table, left, y, height, channel_width, curve_num, curve_rad, resistor_width, unit_num)
+
+    right = x + (unit_num - 1) * connect_width / 2
+    table.add_rectangle(left, y, right, y + channel_width, unit_num, PROFILE_CONNECT)
+    return StageLayout(unit_num, table, (left, y), connect_width, unit_num, (x, y + height))
+
+
+def grad_generator(input_num: int, output_num: int, curve_rad: float, curve_num: int,
+                   channel_width: float, connect_width: float = 0.5, height: float = 0.5,
+                   resistor_width: float = 0.3, x: float = 0.0, y: float = 0.0, cache=None):
+    # Layout of every stage between input_num and output_num channels.
+    # With a cache (see cache.GeometryCache) stages are computed at the origin once and translated.
+    params = (connect_width, height, channel_width, curve_num, curve_rad, resistor_width)
+    stages = []
+    for unit_num in range(input_num + 1, output_num + 1):
+        if cache is None:
+            stage = grad_stage(unit_num, x, y, *params)
+        else:
+            stage = cache.stage(params, unit_num, lambda: grad_stage(unit_num, 0.0, 0.0, *params))
+            stage = move_stage(stage, x, y)
+        stages.append(stage)
+        x, y = stage.next_origin
+    return stages
+
+
+def move_stage(stage: StageLayout, dx: float, dy: float) -> StageLayout:
+    # Copy of stage translated by (dx, dy)
+    if dx == 0 and dy == 0:
+        return stage
+    return stage._replace(template=stage.template.translated(dx, dy),
+                          origin=(stage.origin[0] + dx, stage.origin[1] + dy),
+                          next_origin=(stage.next_origin[0] + dx, stage.next_origin[1] + dy))
+
+
+def check_params(input_num: int, output_num: int, curve_rad: float, curve_num: int,
+                 channel_width: float, connect_width: float = 0.5, height: float = 0.5,
+                 resistor_width: float = 0.3):
+    # List of reasons why grad_generator cannot produce a valid layout, empty if it can
+    errors = []
+    if input_num < 1:
+        errors.append('Need at least one input')
+    if output_num <= input_num:
+        errors.append('Need more outputs than inputs')
+    # Without a turn the resistor profile has no area, there is nothing to extrude or export
+    if curve_num < 1:
+        errors.append('Need at least one resistor structure')
+    if min(channel_width, connect_width, height, resistor_width) <= 0:
+        errors.append('Widths and distances must be positive')
+    if curve_rad * 2 <= channel_width:
+        errors.append('Resistor radius must be larger than half the channel width')
+    # The straights at both ends of the serpentine must be at least as long as the channel is wide,
+    # shorter ones let the turns overlap the connecting channels
+    if curve_rad * 4 * curve_num + 2 * channel_width > height:
+        errors.append('Resistor structures ({:.0f} um) and their straights need a stage height of at least '
+                      '{:.0f} um ({:.0f} um)'.format(curve_rad * 4 * curve_num * 10000,
+                                                     (curve_rad * 4 * curve_num + 2 * channel_width) * 10000,
+                                                     height * 10000))
+    return errors
+
+
+def expand_stage(stage: StageLayout, table: PrimitiveTable = None) -> PrimitiveTable:
+    # Append every copy of the stage's serpentine plus its connecting channel to table
+    if table is None:
+        table = PrimitiveTable()
+    channel = stage.template.select(CHANNEL_PROFILES)
+    for i in range(stage.copies):
+        table.extend(channel, i * stage.pitch, 0.0)
+    table.extend(stage.template.select((PROFILE_CONNECT,)))
+    return table
+
+
+def generator_table(stages) -> PrimitiveTable:
+    # Full primitive table of a generator, all serpentine copies included
+    table = PrimitiveTable()
+    for stage in stages:
+        expand_stage(stage, table)
+    return table
+
+
+def serpentine_length(height: float, curve_num: int, curve_rad: float, resistor_width: float) -> float:
+    # Centerline length of one serpentine channel: both straights plus curve_num turns,
+    # each turn being two half circles of radius curve_rad and 2 * resistor_width of straight run
+    straight_len = (height - (curve_rad * 4 * curve_num)) / 2
+    return 2 * straight_len + curve_num * (2 * resistor_width + 2 * arcs.arc_length(curve_rad, math.pi))
+
+
+def channel_length(stages, height: float, curve_num: int, curve_rad: float, resistor_width: float) -> float:
+    # Centerline length of all serpentine and connecting channels of a generator
+    serpentine = serpentine_length(height, curve_num, curve_rad, resistor_width)
+    return sum(stage.copies * serpentine + (stage.copies - 1) * stage.pitch for stage in stages)
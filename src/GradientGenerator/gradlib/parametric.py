@@ -0,0 +1,74 @@
+# User parameters of a parametric build.
+# The parametric build mode stores the generator parameters as Fusion user parameters and drives
+# what can follow them without changing the sketch topology by expressions: the extrude distances
+# (channel height), the pattern spacing of the serpentine channels and the length of the connecting
+# channel (ladder width). Those two can be edited in Fusion and only recompute the timeline.
+# A stage stays centred on its build position after a ladder width edit: its channels are moved
+# by centre_shift, which is zero at the ladder width it was built with.
+# The serpentine geometry is not constrained, so the other parameters drive nothing. They are
+# created for reference, labelled as informational, and an edit needs a rebuild from the dialog.
+
+# Every parametric generator has its own set of user parameters, gg1_channel_width, gg2_... by
+# the number of the generator, so a build never reshapes an earlier generator. The number is kept
+# on the generator occurrence (see rebuild.PARAMETERS) and reused when the generator is updated.
+
+# GradParams field, unit, comment
+USER_PARAMETERS = [
+    ('channel_width', 'um', 'Width of the channel'),
+    ('channel_height', 'um', 'Height of the channel'),
+    ('resistor_radius', 'um', 'Radius of resistor structure'),
+    ('resistor_num', '', 'Number of resistor structure'),
+    ('ladder_distance', 'um', 'Distance between ladder steps'),
+    ('ladder_width', 'um', 'Width of ladder'),
+]
+
+# Parameters whose edits only recompute the timeline
+EDITABLE = ('channel_height', 'ladder_width')
+
+EXTRUDE_DISTANCE = 'channel_height'
+PATTERN_SPACING = 'ladder_width'
+
+INFORMATIONAL = 'informational, rebuild from the dialog to apply'
+
+
+def parameter_name(field: str, generator: int) -> str:
+    # User parameter of field for generator number generator
+    return 'gg{}_{}'.format(generator, field)
+
+
+def free_generator(exists) -> int:
+    # Lowest generator number none of whose parameters exist, exists(name) tells if one does.
+    # Numbers of deleted generators stay taken while their parameters are left in the design.
+    generator = 1
+    while any(exists(parameter_name(field, generator)) for field, unit, comment in USER_PARAMETERS):
+        generator += 1
+    return generator
+
+
+def user_parameters(params, generator: int):
+    # (name, expression, unit, comment) of every user parameter of generator for a GradParams
+    for field, unit, comment in USER_PARAMETERS:
+        value = getattr(params, field)
+        if unit:
+            # repr keeps every digit of the value
+            expression = '{!r} {}'.format(value, unit)
+        else:
+            expression = '{:d}'.format(value)
+        if field in EDITABLE:
+            comment = '{} (generator {})'.format(comment, generator)
+        else:
+            comment = '{} (generator {}, {})'.format(comment, generator, INFORMATIONAL)
+        yield parameter_name(field, generator), expression, unit, comment
+
+
+def connect_length(unit_num: int, generator: int) -> str:
+    # Length of the connecting channel of a stage, from its first to its last serpentine channel
+    return '({} - 1) * {}'.format(unit_num, parameter_name(PATTERN_SPACING, generator))
+
+
+def centre_shift(unit_num: int, ladder_width: float, generator: int) -> str:
+    # x translation of a stage built with ladder_width (um) that keeps it centred when the pattern
+    # spacing changes. The connecting channel starts at the first channel, so its left end follows
+    # -(unit_num - 1) * spacing / 2 from the centre.
+    return '-({} - 1) * ({} - {!r} um) / 2'.format(unit_num, parameter_name(PATTERN_SPACING, generator),
+                                                   ladder_width)
@@ -0,0 +1,146 @@
+# Parameters of one gradient generator.
+# GradParams holds the dialog values in dialog units (um, counts), is immutable and hashable, and
+# converts to the cm the layout works in. It drives the dialog, the layout (and so the geometry
+# cache key), batch sweeps, exports and wafer deduplication. The fields are plain numbers, so the
+# hash is the same in every process and run.
+import json
+
+from . import layout
+
+UM_PER_CM = 10000
+
+# name, dialog label, unit ('' for counts), default, min, max
+FIELDS = (
+    ('input_num', 'Number of inputs', '', 2, 1, 64),
+    ('output_num', 'Number of outputs', '', 5, 2, 256),
+    ('channel_width', 'Width of the channel (um)', 'um', 200, 1, 100000),
+    ('channel_height', 'Height of the channel (um)', 'um', 200, 1, 100000),
+    ('resistor_width', 'Width of resistor structure (um)', 'um', 3000, 1, 100000),
+    ('resistor_num', 'Number of resistor structure', '', 2, 1, 100),
+    ('resistor_radius', 'Radius of resistor structure (um)', 'um', 200, 1, 100000),
+    ('ladder_distance', 'Distance between ladder steps (um)', 'um', 5000, 1, 100000),
+    ('ladder_width', 'Width of ladder (um)', 'um', 5000, 1, 100000),
+)
+NAMES = tuple(f[0] for f in FIELDS)
+_FIELDS = {f[0]: f for f in FIELDS}
+
+
+class GradParams:
+    __slots__ = NAMES
+
+    def __init__(self, **values):
+        # Missing values take the defaults, raises ValueError for unknown names and bad values
+        unknown = set(values) - set(NAMES)
+        if unknown:
+            raise ValueError('Unknown parameter(s): {}'.format(', '.join(sorted(unknown))))
+        for name, label, unit, default, low, high in FIELDS:
+            object.__setattr__(self, name, _convert(name, values.get(name, default)))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('GradParams is immutable, use replace()')
+
+    def __delattr__(self, name):
+        raise AttributeError('GradParams is immutable')
+
+    def key(self) -> tuple:
+        return tuple(getattr(self, name) for name in NAMES)
+
+    def __eq__(self, other):
+        return isinstance(other, GradParams) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return 'GradParams({})'.format(', '.join('{}={!r}'.format(n, getattr(self, n)) for n in NAMES))
+
+    def __reduce__(self):
+        return (_from_key, (self.key(),))
+
+    def replace(self, **changes) -> 'GradParams':
+        values = self.as_dict()
+        values.update(changes)
+        return GradParams(**values)
+
+    # Lengths in cm
+
+    @property
+    def channel_width_cm(self) -> float:
+        return self.channel_width / UM_PER_CM
+
+    @property
+    def channel_height_cm(self) -> float:
+        return self.channel_height / UM_PER_CM
+
+    @property
+    def resistor_width_cm(self) -> float:
+        return self.resistor_width / UM_PER_CM
+
+    @property
+    def resistor_radius_cm(self) -> float:
+        return self.resistor_radius / UM_PER_CM
+
+    @property
+    def ladder_distance_cm(self) -> float:
+        return self.ladder_distance / UM_PER_CM
+
+    @property
+    def ladder_width_cm(self) -> float:
+        return self.ladder_width / UM_PER_CM
+
+    def layout_args(self) -> tuple:
+        # Positional arguments of layout.grad_generator, layout.check_params and preview.generator_outline
+        return (self.input_num, self.output_num, self.resistor_radius_cm, self.resistor_num, self.channel_width_cm,
+                self.ladder_width_cm, self.ladder_distance_cm, self.resistor_width_cm)
+
+    def stages(self, cache=None):
+        return layout.grad_generator(*self.layout_args(), cache=cache)
+
+    def check(self):
+        # Reasons these parameters cannot be built, empty if they can
+        errors = []
+        for name, label, unit, default, low, high in FIELDS:
+            value = getattr(self, name)
+            if not low <= value <= high:
+                errors.append('{} must be between {} and {}'.format(_short(label), low, high))
+        return errors + layout.check_params(*self.layout_args())
+
+    # Serialization
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in NAMES}
+
+    def to_json(self) -> str:
+        return json.dumps(self.as_dict(), sort_keys=True)
+
+    @classmethod
+    def from_dict(cls, values: dict, defaults: 'GradParams' = None) -> 'GradParams':
+        # Parameters from a dict of dialog values (numbers or strings), missing ones from defaults
+        if defaults is None:
+            return cls(**values)
+        return defaults.replace(**values)
+
+    @classmethod
+    def from_json(cls, text: str, defaults: 'GradParams' = None) -> 'GradParams':
+        return cls.from_dict(json.loads(text), defaults)
+
+
+def _convert(name: str, value):
+    label, unit = _FIELDS[name][1], _FIELDS[name][2]
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError('{} must be a number'.format(_short(label)))
+    if number.is_integer():
+        return int(number)
+    if not unit:
+        raise ValueError('{} must be a whole number'.format(_short(label)))
+    return number
+
+
+def _short(label: str) -> str:
+    return label.split(' (')[0]
+
+
+def _from_key(key: tuple) -> GradParams:
+    return GradParams(**dict(zip(NAMES, key)))
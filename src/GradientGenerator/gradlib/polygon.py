@@ -0,0 +1,234 @@
+# Boolean union of channel polygons.
+# Arcs are tessellated to a tolerance, every polygon is snapped to an integer grid, edges are split
+# at all their intersections (found with a sweep over x), and every resulting edge piece is kept if
+# the winding number changes between zero and non-zero across it. The kept pieces are chained into
+# loops: outer boundaries counter clockwise, holes clockwise.
+from collections import defaultdict
+import math
+
+from . import geometry, layout
+
+# Grid the polygons are snapped to (cm), 1 nm
+GRID = 1e-7
+DEFAULT_TOLERANCE = 5e-5  # cm, 0.5 um chord error for tessellated arcs
+
+
+def signed_area(loop) -> float:
+    # Positive for counter clockwise loops
+    return sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(loop, loop[1:] + loop[:1])) / 2
+
+
+def table_polygons(table: layout.PrimitiveTable, tolerance: float = DEFAULT_TOLERANCE):
+    # One polygon per closed profile of the table, open chains are skipped
+    for closed, chain in geometry.profile_loops(table):
+        if closed:
+            yield geometry.chain_polygon(chain, tolerance)
+
+
+def union(polygons, grid: float = GRID):
+    # Union of simple polygons given as lists of (x, y) in cm. Returns a list of loops in cm.
+    edges = []
+    for polygon in polygons:
+        points = _snap(polygon, grid)
+        if len(points) < 3:
+            continue
+        if _area2(points) < 0:
+            points.reverse()
+        for a, b in zip(points, points[1:] + points[:1]):
+            if a != b:
+                edges.append((a, b))
+
+    # Net direction count of every split edge piece, keyed low point first
+    pieces = defaultdict(int)
+    for a, b in _split(edges):
+        if a < b:
+            pieces[(a, b)] += 1
+        else:
+            pieces[(b, a)] -= 1
+
+    index = _WindingIndex([(a, b, count) for (a, b), count in pieces.items() if count])
+    boundary = []
+    for (a, b), count in pieces.items():
+        # Winding on the right of a->b, the left side adds count
+        right = index.winding(*_offset(a, b, -0.25))
+        left = right + count
+        if (left > 0) != (right > 0):
+            boundary.append((a, b) if left > 0 else (b, a))
+    return [[(x * grid, y * grid) for x, y in loop] for loop in _chain(boundary)]
+
+
+def stage_outline(stage: layout.StageLayout, tolerance: float = DEFAULT_TOLERANCE):
+    # Merged channel region of a stage: every serpentine copy plus the connecting channel
+    return union(table_polygons(layout.expand_stage(stage), tolerance))
+
+
+def outline_table(loops, stage: int = 0) -> layout.PrimitiveTable:
+    # Lines of the loops as a primitive table, ready for emit.SketchEmitter
+    table = layout.PrimitiveTable()
+    for loop in loops:
+        for (x0, y0), (x1, y1) in zip(loop, loop[1:] + loop[:1]):
+            table.add_line(x0, y0, x1, y1, stage, layout.PROFILE_RESISTOR)
+    return table
+
+
+def outer_bounds(loops):
+    # (min x, min y, max x, max y) of every counter clockwise loop, the regions to extrude
+    return [(min(x for x, y in loop), min(y for x, y in loop), max(x for x, y in loop), max(y for x, y in loop))
+            for loop in loops if signed_area(loop) > 0]
+
+
+def _snap(polygon, grid):
+    points = []
+    for x, y in polygon:
+        point = (int(round(x / grid)), int(round(y / grid)))
+        if not points or points[-1] != point:
+            points.append(point)
+    while len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    return points
+
+
+def _area2(points) -> int:
+    return sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(points, points[1:] + points[:1]))
+
+
+def _cross(o, a, b) -> int:
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+
+def _on_segment(p, a, b) -> bool:
+    # p collinear with a-b and strictly between the end points
+    return (min(a[0], b[0]) <= p[0] <= max(a[0], b[0]) and min(a[1], b[1]) <= p[1] <= max(a[1], b[1])
+            and p != a and p != b)
+
+
+def _split(edges):
+    # Split edges at all intersections and touching end points, sweeping over x
+    cuts = [[] for i in edges]
+    order = sorted(range(len(edges)), key=lambda i: min(edges[i][0][0], edges[i][1][0]))
+    active = []
+    for i in order:
+        a, b = edges[i]
+        min_x = min(a[0], b[0])
+        min_y, max_y = min(a[1], b[1]), max(a[1], b[1])
+        active = [j for j in active if max(edges[j][0][0], edges[j][1][0]) >= min_x]
+        for j in active:
+            c, d = edges[j]
+            if max(c[1], d[1]) < min_y or min(c[1], d[1]) > max_y:
+                continue
+            d1 = _cross(a, b, c)
+            d2 = _cross(a, b, d)
+            d3 = _cross(c, d, a)
+            d4 = _cross(c, d, b)
+            if d1 == 0 and d2 == 0:
+                # Collinear, cut each at the other's end points
+                for p in (c, d):
+                    if _on_segment(p, a, b):
+                        cuts[i].append(p)
+                for p in (a, b):
+                    if _on_segment(p, c, d):
+                        cuts[j].append(p)
+                continue
+            if (d1 > 0) == (d2 > 0) and d1 != 0 and d2 != 0:
+                continue
+            if (d3 > 0) == (d4 > 0) and d3 != 0 and d4 != 0 or d3 == d4:
+                continue
+            t = d3 / (d3 - d4)
+            p = (int(round(a[0] + (b[0] - a[0]) * t)), int(round(a[1] + (b[1] - a[1]) * t)))
+            if p != a and p != b:
+                cuts[i].append(p)
+            if p != c and p != d:
+                cuts[j].append(p)
+        active.append(i)
+
+    for (a, b), points in zip(edges, cuts):
+        if not points:
+            yield a, b
+            continue
+        dx, dy = b[0] - a[0], b[1] - a[1]
+        points = sorted(set(points), key=lambda p: (p[0] - a[0]) * dx + (p[1] - a[1]) * dy)
+        start = a
+        for p in points + [b]:
+            if p != start:
+                yield start, p
+                start = p
+
+
+def _offset(a, b, distance):
+    # Midpoint of a-b moved distance grid units to the left (negative: right)
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    length = math.hypot(dx, dy)
+    return ((a[0] + b[0]) / 2 - dy / length * distance, (a[1] + b[1]) / 2 + dx / length * distance)
+
+
+class _WindingIndex:
+    # Edges bucketed by y so a horizontal ray only visits the edges of its row
+    def __init__(self, edges):
+        self._edges = [e for e in edges if e[0][1] != e[1][1]]
+        ys = [p[1] for a, b, count in self._edges for p in (a, b)] or [0]
+        self._y0 = min(ys)
+        rows = max(1, int(math.sqrt(len(self._edges))))
+        self._height = max(1, (max(ys) - self._y0) / rows)
+        self._rows = defaultdict(list)
+        for edge in self._edges:
+            low = min(edge[0][1], edge[1][1])
+            high = max(edge[0][1], edge[1][1])
+            for row in range(self._row(low), self._row(high) + 1):
+                self._rows[row].append(edge)
+
+    def _row(self, y):
+        return int((y - self._y0) // self._height)
+
+    def winding(self, px: float, py: float) -> int:
+        # Winding number at (px, py), counter clockwise edges count +1
+        winding = 0
+        for a, b, count in self._rows.get(self._row(py), ()):
+            if (a[1] <= py) != (b[1] <= py):
+                x = a[0] + (py - a[1]) * (b[0] - a[0]) / (b[1] - a[1])
+                if x > px:
+                    # Upward crossing to the right of the point is counter clockwise
+                    winding += count if b[1] > a[1] else -count
+        return winding
+
+
+def _chain(edges):
+    # Chain directed edges into loops, taking the sharpest right turn where loops touch
+    outgoing = defaultdict(list)
+    for a, b in edges:
+        outgoing[a].append(b)
+    loops = []
+    for start in sorted(outgoing):
+        while outgoing[start]:
+            loop = [start]
+            previous, current = start, outgoing[start].pop()
+            while current != start:
+                loop.append(current)
+                candidates = outgoing[current]
+                if not candidates:
+                    break
+                k = _right_most(previous, current, candidates)
+                previous, current = current, candidates.pop(k)
+            loops.append(_simplify(loop))
+    return [loop for loop in loops if len(loop) >= 3]
+
+
+def _right_most(previous, current, candidates):
+    if len(candidates) == 1:
+        return 0
+    dx, dy = current[0] - previous[0], current[1] - previous[1]
+
+    def turn(k):
+        ex, ey = candidates[k][0] - current[0], candidates[k][1] - current[1]
+        return math.atan2(dx * ey - dy * ex, dx * ex + dy * ey)
+
+    return min(range(len(candidates)), key=turn)
+
+
+def _simplify(loop):
+    # Drop vertices in the middle of straight runs
+    result = []
+    count = len(loop)
+    for i, p in enumerate(loop):
+        if _cross(loop[i - 1], p, loop[(i + 1) % count]) != 0:
+            result.append(p)
+    return result
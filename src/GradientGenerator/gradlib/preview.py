@@ -0,0 +1,83 @@
+# Lightweight outline of a generator for the command preview.
+# Every serpentine is reduced to its centerline (arcs replaced by two chords) and every connecting
+# channel to a single line, so a preview sketch only needs a few lines per channel. Stage outlines
+# are computed at the origin and memoized, so an edit only computes the stages that changed.
+import time
+from functools import lru_cache
+
+from . import layout
+
+
+def generator_outline(input_num: int, output_num: int, curve_rad: float, curve_num: int,
+                      channel_width: float, connect_width: float = 0.5, height: float = 0.5,
+                      resistor_width: float = 0.3) -> layout.PrimitiveTable:
+    # Same parameters as layout.grad_generator, lines only
+    table = layout.PrimitiveTable()
+    params = (connect_width, height, channel_width, curve_num, curve_rad, resistor_width)
+    y = 0.0
+    for unit_num in range(input_num + 1, output_num + 1):
+        table.extend(stage_outline(unit_num, *params), 0.0, y)
+        y += height
+    return table
+
+
+@lru_cache(maxsize=256)
+def stage_outline(unit_num: int, connect_width: float, height: float, channel_width: float,
+                  curve_num: int, curve_rad: float, resistor_width: float) -> layout.PrimitiveTable:
+    # Outline of one stage with its connecting channel at y = 0. Treat the result as read only.
+    channel = layout.PrimitiveTable()
+    points = serpentine_centerline(0.0, 0.0, height, channel_width, curve_num, curve_rad, resistor_width)
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        channel.add_line(x0, y0, x1, y1, unit_num, layout.PROFILE_RESISTOR)
+
+    table = layout.PrimitiveTable()
+    left = -(unit_num - 1) * connect_width / 2
+    for i in range(unit_num):
+        table.extend(channel, left + i * connect_width, 0.0)
+    middle = channel_width / 2
+    table.add_line(left, middle, -left, middle, unit_num, layout.PROFILE_CONNECT)
+    return table
+
+
+def serpentine_centerline(x: float, y: float, height: float, channel_width: float, curve_num: int,
+                          curve_rad: float, resistor_width: float):
+    # Points along the centerline of the serpentine starting at (x, y), see layout.single_grad
+    r = curve_rad
+    half = resistor_width / 2
+    straight_len = (height - (curve_rad * 4 * curve_num)) / 2
+    yc = y + straight_len + channel_width / 2
+    points = [(x, y), (x, yc)]
+    for i in range(curve_num):
+        points += [(x + half, yc), (x + half + r, yc + r), (x + half, yc + 2 * r),
+                   (x - half, yc + 2 * r), (x - half - r, yc + 3 * r), (x - half, yc + 4 * r),
+                   (x, yc + 4 * r)]
+        yc += 4 * r
+    points.append((x, y + height))
+    return points
+
+
+class Debouncer:
+    # Accepts a call only when interval seconds passed since the last accepted one.
+    # Rejected calls leave pending set until the next accepted call or flush().
+    def __init__(self, interval: float = 0.05, clock=time.perf_counter):
+        self.interval = interval
+        self.pending = False
+        self._clock = clock
+        self._last = None
+
+    def ready(self) -> bool:
+        now = self._clock()
+        if self._last is not None and now - self._last < self.interval:
+            self.pending = True
+            return False
+        self._last = now
+        self.pending = False
+        return True
+
+    def flush(self) -> bool:
+        # True if a rejected call is waiting to be handled
+        pending = self.pending
+        self.pending = False
+        if pending:
+            self._last = self._clock()
+        return pending
@@ -0,0 +1,132 @@
+# Span timer and counters for the build.
+# Spans are timed by name, a span opened with a unit_num also becomes the current stage, so spans
+# and counters inside it are booked on that stage. NULL has the same interface and does nothing,
+# it is what the script uses while profiling is switched off.
+import json
+import time
+from collections import defaultdict
+
+
+class _Span:
+    __slots__ = ('_profiler', '_name', '_unit_num', '_outer', '_start')
+
+    def __init__(self, profiler, name: str, unit_num):
+        self._profiler = profiler
+        self._name = name
+        self._unit_num = unit_num
+
+    def __enter__(self):
+        profiler = self._profiler
+        self._outer = profiler.unit_num
+        if self._unit_num is not None:
+            profiler.unit_num = self._unit_num
+        self._start = profiler._clock()
+        return self
+
+    def __exit__(self, *exc):
+        profiler = self._profiler
+        seconds = profiler._clock() - self._start
+        entry = profiler.spans[(profiler.unit_num, self._name)]
+        entry[0] += 1
+        entry[1] += seconds
+        profiler.unit_num = self._outer
+        return False
+
+
+class Profiler:
+    enabled = True
+
+    def __init__(self, clock=time.perf_counter):
+        self._clock = clock
+        self._start = clock()
+        self.unit_num = None
+        # (unit_num, name) -> [count, seconds] and (unit_num, name) -> count
+        self.spans = defaultdict(lambda: [0, 0.0])
+        self.counters = defaultdict(int)
+
+    def span(self, name: str, unit_num: int = None) -> _Span:
+        return _Span(self, name, unit_num)
+
+    def count(self, name: str, n: int = 1):
+        self.counters[(self.unit_num, name)] += n
+
+    def elapsed(self) -> float:
+        return self._clock() - self._start
+
+    def stages(self):
+        # unit_num of every stage with spans or counters, in build order
+        return sorted({k[0] for k in list(self.spans) + list(self.counters) if k[0] is not None})
+
+    def totals(self):
+        # name -> [count, seconds] over all stages
+        totals = defaultdict(lambda: [0, 0.0])
+        for (unit_num, name), (count, seconds) in self.spans.items():
+            totals[name][0] += count
+            totals[name][1] += seconds
+        return dict(totals)
+
+    def counter_totals(self):
+        totals = defaultdict(int)
+        for (unit_num, name), n in self.counters.items():
+            totals[name] += n
+        return dict(totals)
+
+    def as_dict(self) -> dict:
+        def stage(unit_num):
+            return {
+                'spans': {name: {'count': c, 'ms': s * 1000} for (u, name), (c, s) in self.spans.items() if u == unit_num},
+                'counters': {name: n for (u, name), n in self.counters.items() if u == unit_num},
+            }
+
+        return {
+            'elapsed_ms': self.elapsed() * 1000,
+            'spans': {name: {'count': c, 'ms': s * 1000} for name, (c, s) in self.totals().items()},
+            'counters': self.counter_totals(),
+            'build': stage(None),
+            'stages': {str(unit_num): stage(unit_num) for unit_num in self.stages()},
+        }
+
+    def write_json(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=1)
+
+    def report(self) -> str:
+        # Text table: totals per span, then one line per stage with its slowest spans
+        lines = ['Build profile, {:.0f} ms'.format(self.elapsed() * 1000)]
+        for name, (count, seconds) in sorted(self.totals().items(), key=lambda item: -item[1][1]):
+            lines.append('  {:<12} {:>9.1f} ms  {:>6}x'.format(name, seconds * 1000, count))
+        counters = self.counter_totals()
+        if counters:
+            lines.append('  ' + ', '.join('{} {}'.format(name, n) for name, n in sorted(counters.items())))
+        for unit_num in self.stages():
+            spans = sorted(((name, s) for (u, name), (c, s) in self.spans.items() if u == unit_num and name != 'stage'),
+                           key=lambda item: -item[1])
+            total = self.spans.get((unit_num, 'stage'), (0, 0.0))[1]
+            lines.append('  stage {:>3}: {:>8.1f} ms  {}'.format(
+                unit_num, total * 1000, ', '.join('{} {:.1f}'.format(name, s * 1000) for name, s in spans)))
+        return '\n'.join(lines)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _NullProfiler:
+    enabled = False
+    unit_num = None
+    _span = _NullSpan()
+
+    def span(self, name: str, unit_num: int = None) -> _NullSpan:
+        return self._span
+
+    def count(self, name: str, n: int = 1):
+        pass
+
+
+NULL = _NullProfiler()
@@ -0,0 +1,61 @@
+# Incremental rebuild of a generator.
+# Every stage occurrence the script builds carries an attribute (GROUP, STAGE) with the spec of
+# the stage: the parameters that shape it, its position and the build mode, as JSON. A rebuild
+# compares those with the specs of the new layout, keeps the stages whose spec did not change,
+# deletes the others and only builds the missing ones. Stages do not depend on output_num and
+# input_num only moves them, so going from 8 to 9 outputs builds one stage.
+import json
+from collections import defaultdict, namedtuple
+
+from . import layout, params
+
+GROUP = 'GradGenerator'
+GENERATOR = 'generator'
+STAGE = 'stage'
+# Component attribute of the serpentine channel template of an instanced generator, updates place
+# the template of a kept stage instead of drawing another one. Its value is not used.
+TEMPLATE = 'template'
+# Number of the user parameters of a parametric generator, see parametric.free_generator
+PARAMETERS = 'parameters'
+
+# Parameters a stage depends on, input_num and output_num only decide which stages exist and where
+STAGE_FIELDS = tuple(name for name in params.NAMES if name not in ('input_num', 'output_num'))
+
+# keep: (item, index) of existing stages that match the stage at index of the new layout
+# delete: existing items that match no new stage
+# build: indices of the new stages that have no existing match
+StageDiff = namedtuple('StageDiff', ['keep', 'delete', 'build'])
+
+
+def stage_spec(values: params.GradParams, stage: layout.StageLayout, build_mode: str) -> str:
+    # Attribute value of a stage, equal for stages that would be built the same way
+    spec = {name: getattr(values, name) for name in STAGE_FIELDS}
+    spec['unit_num'] = stage.unit_num
+    # Position in um, rounded so that the same stage gives the same text whatever the float noise
+    spec['origin'] = [round(v * params.UM_PER_CM, 3) + 0.0 for v in stage.origin]
+    spec['mode'] = build_mode
+    return json.dumps(spec, sort_keys=True)
+
+
+def generator_spec(values: params.GradParams, build_mode: str) -> str:
+    # Attribute value of a generator occurrence
+    spec = values.as_dict()
+    spec['mode'] = build_mode
+    return json.dumps(spec, sort_keys=True)
+
+
+def diff_stages(existing, wanted) -> StageDiff:
+    # existing: (item, spec) of the tagged stages, items are opaque (occurrences in Fusion).
+    # wanted: specs of the new layout in build order. A spec found twice in existing keeps one.
+    available = defaultdict(list)
+    for item, spec in existing:
+        available[spec].append(item)
+    keep = []
+    build = []
+    for index, spec in enumerate(wanted):
+        if available[spec]:
+            keep.append((available[spec].pop(0), index))
+        else:
+            build.append(index)
+    delete = [item for items in available.values() for item in items]
+    return StageDiff(keep, delete, build)
@@ -0,0 +1,143 @@
+# Arrays of gradient generators, e.g. a wafer with chips of different output_num.
+# Chips with the same parameters share one design: it is computed and built once, every other chip
+# is a placement of it. Layouts of the distinct designs can be computed in a process pool.
+#
+# A wafer file (JSON) is either a list of chips, each an object with the dialog parameters (um)
+# and its position "x", "y" (um), or a grid:
+#   {"columns": 10, "rows": 10, "pitch_x": 20000, "pitch_y": 20000,
+#    "defaults": {"input_num": 2}, "chips": [{"output_num": 5}, {"output_num": 8}]}
+# where the chips fill the grid row by row, starting again at the first one when the list runs out.
+# Parameters missing from a chip come from "defaults" and then from the dialog.
+#
+# Usage, from the GradientGenerator directory:
+#   python -m gradlib.wafer wafer.json mask.gds
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from . import export, layout, params
+
+
+# spec is the GradParams of the chip, x and y in cm
+Chip = namedtuple('Chip', ['spec', 'x', 'y'])
+
+
+def read_wafer(path: str, defaults: params.GradParams = None):
+    # Chips of a wafer file, see above. defaults are the dialog parameters, GradParams() if omitted.
+    with open(path) as f:
+        data = json.load(f)
+    return list(wafer_chips(data, defaults))
+
+
+def wafer_chips(data, defaults: params.GradParams = None):
+    base = defaults if defaults is not None else params.GradParams()
+    if isinstance(data, list):
+        for chip in data:
+            chip = dict(chip)
+            x, y = chip.pop('x', 0), chip.pop('y', 0)
+            yield Chip(params.GradParams.from_dict(chip, base), float(x) / params.UM_PER_CM,
+                       float(y) / params.UM_PER_CM)
+        return
+    base = params.GradParams.from_dict(data.get('defaults', {}), base)
+    columns = int(data.get('columns', 1))
+    rows = int(data.get('rows', 1))
+    pitch_x = float(data.get('pitch_x', data.get('pitch', 0))) / params.UM_PER_CM
+    pitch_y = float(data.get('pitch_y', data.get('pitch', 0))) / params.UM_PER_CM
+    chips = data.get('chips') or [{}]
+    for (row, column), chip in zip(itertools.product(range(rows), range(columns)), itertools.cycle(chips)):
+        yield Chip(params.GradParams.from_dict(chip, base), column * pitch_x, row * pitch_y)
+
+
+def unique_specs(chips):
+    # spec -> [(x, y), ...] in order of first appearance
+    specs = OrderedDict()
+    for chip in chips:
+        specs.setdefault(chip.spec, []).append((chip.x, chip.y))
+    return specs
+
+
+def check_specs(specs) -> list:
+    # Reasons the distinct chips of unique_specs cannot be built, one line per failing design
+    errors = []
+    for spec, positions in specs.items():
+        reasons = spec.check()
+        if reasons:
+            x, y = positions[0]
+            errors.append('{} chip(s) like the one at ({:.0f}, {:.0f}) um: {}'.format(
+                len(positions), x * params.UM_PER_CM, y * params.UM_PER_CM, '; '.join(reasons)))
+    return errors
+
+
+def compute_stages(spec: params.GradParams):
+    # Layout of one spec, runs in a worker process
+    return spec.stages()
+
+
+def compute_layouts(specs, workers: int = None, executor=None) -> dict:
+    # spec -> list of StageLayout for every distinct spec. Runs in a process pool if there is more
+    # than one spec and workers is not 1 (pass executor to reuse a pool).
+    specs = list(specs)
+    if executor is None and (workers == 1 or len(specs) < 2):
+        return {spec: compute_stages(spec) for spec in specs}
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1)
+    try:
+        return dict(zip(specs, executor.map(compute_stages, specs)))
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+
+def design_name(index: int) -> str:
+    return 'GG{:03d}'.format(index)
+
+
+def mask(chips, workers: int = None):
+    # Designs and placements of a wafer for export.export
+    specs = unique_specs(chips)
+    layouts = compute_layouts(specs, workers)
+    designs = OrderedDict()
+    placements = []
+    for index, (spec, positions) in enumerate(specs.items()):
+        name = design_name(index)
+        designs[name] = layout.generator_table(layouts[spec])
+        placements += [(name, x, y) for x, y in positions]
+    return designs, placements
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export a wafer of gradient generators as DXF, SVG or GDSII.')
+    parser.add_argument('wafer', help='wafer file (JSON), see gradlib/wafer.py')
+    parser.add_argument('out', help='output file (.dxf, .svg or .gds)')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--tolerance', type=float, default=export.DEFAULT_TOLERANCE, help='arc chord tolerance (um), GDSII only')
+    parser.add_argument('--layer', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    chips = read_wafer(args.wafer)
+    errors = check_specs(unique_specs(chips))
+    if errors:
+        print('\n'.join(errors))
+        sys.exit(1)
+    designs, placements = mask(chips, args.workers)
+    view_box = None
+    if designs:
+        bounds = {name: table.bounds() for name, table in designs.items()}
+        boxes = [(bounds[name][0] + x, bounds[name][1] + y, bounds[name][2] + x, bounds[name][3] + y)
+                 for name, x, y in placements if bounds[name]]
+        if boxes:
+            view_box = (min(b[0] for b in boxes), min(b[1] for b in boxes),
+                        max(b[2] for b in boxes), max(b[3] for b in boxes))
+    export.export(args.out, designs, placements, args.tolerance, args.layer, view_box)
+    print('{} chips, {} designs in {:.2f} s -> {}'.format(len(chips), len(designs), time.perf_counter() - start, args.out))
+
+
+if __name__ == '__main__':
+    main()
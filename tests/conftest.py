@@ -0,0 +1,6 @@
+# The script folder is what Fusion loads, so gradlib is imported from there, like the
+# "python -m gradlib.X" commands run from the GradientGenerator directory.
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 'GradientGenerator'))
@@ -0,0 +1,36 @@
+# Geometry cache persistence: entries survive a save and load, files of other layout code do not.
+import pytest
+
+from gradlib import cache, params
+
+
+def filled_cache(path):
+    geometry_cache = cache.GeometryCache(path=str(path))
+    params.GradParams(output_num=6).stages(cache=geometry_cache)
+    return geometry_cache
+
+
+def test_save_and_load(tmp_path):
+    path = tmp_path / 'geometry_cache.bin'
+    saved = filled_cache(path)
+    saved.save()
+    loaded = cache.GeometryCache(path=str(path))
+    assert loaded.load() == len(saved) == 4
+    stages = params.GradParams(output_num=6).stages(cache=loaded)
+    assert loaded.stats.hits == 4 and loaded.stats.misses == 0
+    for stage, computed in zip(stages, params.GradParams(output_num=6).stages()):
+        assert [v for row in stage.template.rows() for v in row] == \
+               pytest.approx([v for row in computed.template.rows() for v in row])
+
+
+def test_load_ignores_other_layout_version(tmp_path, monkeypatch):
+    path = tmp_path / 'geometry_cache.bin'
+    monkeypatch.setattr(cache, 'LAYOUT_VERSION', b'\0' * 8)
+    filled_cache(path).save()
+    monkeypatch.undo()
+    loaded = cache.GeometryCache(path=str(path))
+    assert loaded.load() == 0
+    assert len(loaded) == 0
+    # The next save replaces the outdated file
+    filled_cache(path).save()
+    assert cache.GeometryCache(path=str(path)).load() == 4
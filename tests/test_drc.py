@@ -0,0 +1,62 @@
+# Design rule check of known layouts, and the exit status CI relies on.
+import json
+
+import pytest
+
+from gradlib import drc, params
+
+
+def violations(**values):
+    variant = params.GradParams(**values)
+    assert variant.check() == []
+    return drc.check(variant.stages())
+
+
+def rules(found):
+    return {v.rule for v in found}
+
+
+def test_defaults_pass():
+    assert violations() == []
+
+
+def test_empty_layout_passes():
+    assert drc.check([]) == []
+
+
+def test_serpentines_closer_than_their_width_overlap():
+    # Serpentine turns of neighbouring channels are wider than a 3300 um ladder
+    assert drc.OVERLAP in rules(violations(ladder_width=3300))
+
+
+def test_short_straights_leave_thin_walls():
+    # 2100 um stages leave 50 um straights beyond the channel width, 50 um walls to the connecting channels
+    found = violations(ladder_distance=2100)
+    assert rules(found) == {drc.SPACING}
+    assert min(v.value for v in found) == pytest.approx(50)
+    assert all(v.limit == drc.MIN_SPACING for v in found)
+
+
+def test_straights_as_long_as_the_channel_width_touch():
+    assert drc.OVERLAP in rules(violations(ladder_distance=2000))
+
+
+def test_relaxed_spacing_accepts_thin_walls():
+    variant = params.GradParams(ladder_distance=2100)
+    assert drc.check(variant.stages(), min_spacing=40) == []
+
+
+def test_main_exit_status(tmp_path, capsys):
+    ok = tmp_path / 'ok.json'
+    ok.write_text(json.dumps({}))
+    drc.main([str(ok)])
+    assert '0 violations' in capsys.readouterr().out
+
+    bad = tmp_path / 'bad.json'
+    bad.write_text(json.dumps({'ladder_width': 3300}))
+    with pytest.raises(SystemExit) as exit_info:
+        drc.main([str(ok), str(bad), '--json', str(tmp_path / 'report.json')])
+    assert exit_info.value.code == 1
+    report = json.loads((tmp_path / 'report.json').read_text())
+    assert report[str(ok)] == []
+    assert drc.OVERLAP in {v['rule'] for v in report[str(bad)]}
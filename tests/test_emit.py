@@ -0,0 +1,64 @@
+# SketchEmitter against the recording stand-in of the Fusion API: a sketch is solved once however
+# many curves it gets, and curves meeting at a point share one sketch point.
+from gradlib import emit, fake_adsk, geometry, layout
+
+
+def stage_template():
+    return layout.grad_stage(4, 0.0, 0.0, 0.5, 0.5, 0.02, 2, 0.02, 0.3).template
+
+
+def distinct_points(table):
+    scale = 1 / geometry.POINT_RESOLUTION
+    return {(round(x * scale), round(y * scale))
+            for row in table.rows() for x, y in ((row[1], row[2]), (row[5], row[6]))}
+
+
+def test_emit_solves_once_and_shares_points():
+    recorder = fake_adsk.reset()
+    table = stage_template()
+    sketch = fake_adsk.Sketch()
+    emitter = emit.SketchEmitter(fake_adsk.Point3D.create)
+    emitter.emit(sketch, table)
+
+    assert sketch.recomputes == 1
+    assert recorder.calls['Sketch.compute'] == 1
+    assert not sketch.isComputeDeferred
+    assert sketch.sketchCurves.count == len(table)
+    assert len(sketch.sketchPoints) == len(distinct_points(table))
+    # The emitter statistics agree with what the stand-in recorded
+    assert emitter.stats.as_dict() == {
+        'recomputes': recorder.calls['Sketch.compute'],
+        'sketches': 1,
+        'points': len(sketch.sketchPoints),
+        'curves': recorder.calls['SketchLines.addByTwoPoints'] + recorder.calls['SketchArcs.addByThreePoints'],
+    }
+
+
+def test_emit_leaves_deferred_sketch_unsolved():
+    fake_adsk.reset()
+    sketch = fake_adsk.Sketch()
+    sketch.isComputeDeferred = True
+    emit.SketchEmitter(fake_adsk.Point3D.create).emit(sketch, stage_template())
+    assert sketch.recomputes == 0
+    assert sketch.isComputeDeferred
+
+
+def test_emit_grouped_solves_each_sketch_once():
+    recorder = fake_adsk.reset()
+    table = stage_template()
+    sketches = fake_adsk.Sketches()
+    groups = emit.SketchEmitter(fake_adsk.Point3D.create).emit_grouped(lambda: sketches.add(None), table)
+
+    assert sorted(groups) == sorted(set(emit.SKETCH_OF_PROFILE.values()))
+    assert [sketch.recomputes for sketch in groups.values()] == [1] * len(groups)
+    assert recorder.calls['Sketch.compute'] == len(groups)
+    assert sum(sketch.sketchCurves.count for sketch in groups.values()) == len(table)
+    for key, sketch in groups.items():
+        profiles = tuple(p for p, k in emit.SKETCH_OF_PROFILE.items() if k == key)
+        assert len(sketch.sketchPoints) == len(distinct_points(table.select(profiles)))
+    # Inlet, resistor and outlet are closed regions of the channel sketch, the connecting channel
+    # is a single rectangle of its own
+    channel = groups[emit.SKETCH_OF_PROFILE[layout.PROFILE_RESISTOR]]
+    connect = groups[emit.SKETCH_OF_PROFILE[layout.PROFILE_CONNECT]]
+    assert channel.profiles.count == len(layout.CHANNEL_PROFILES)
+    assert connect.profiles.count == 1
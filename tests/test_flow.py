@@ -0,0 +1,73 @@
+# Network solve of gradlib.flow: exact pressures on small networks and an iteration count that
+# does not grow with the number of stages.
+import pytest
+
+from gradlib import flow, params
+
+
+def network(**values):
+    v = params.GradParams(**values)
+    return flow.build_network(v.input_num, v.output_num, v.resistor_radius_cm, v.resistor_num,
+                              v.channel_width_cm, v.channel_height_cm, v.ladder_width_cm,
+                              v.ladder_distance_cm, v.resistor_width_cm)
+
+
+def test_banded_cholesky_solves():
+    # Tridiagonal plus a coupling two rows apart
+    entries = {(0, 0): 4.0, (1, 1): 5.0, (2, 2): 6.0, (3, 3): 7.0,
+               (1, 0): -1.0, (2, 1): -2.0, (3, 2): -1.0, (2, 0): 0.5}
+    solve = flow._banded_cholesky(entries, 4)
+    x = [1.0, -2.0, 0.5, 3.0]
+    b = [0.0] * 4
+    for (i, j), v in entries.items():
+        b[i] += v * x[j]
+        if i != j:
+            b[j] += v * x[i]
+    assert solve(b) == pytest.approx(x)
+
+
+def test_flow_is_conserved():
+    net = network(output_num=9)
+    result = flow.solve(net)
+    assert sum(result.outlet_flows) == pytest.approx(len(net.inlets) * flow.DEFAULT_INLET_FLOW, rel=1e-6)
+    # Symmetric network, equal inlet flows: mirrored outlets carry the same flow
+    assert result.outlet_flows == pytest.approx(result.outlet_flows[::-1], rel=1e-6)
+    assert result.outlet_concentrations[0] == pytest.approx(1)
+    assert result.outlet_concentrations[-1] == pytest.approx(0)
+
+
+def dense_pressures(net):
+    # Nodal equations solved by Gaussian elimination, outlets at zero pressure
+    free = [node for node in range(net.node_count) if node not in set(net.outlets)]
+    index = {node: i for i, node in enumerate(free)}
+    size = len(free)
+    matrix = [[0.0] * (size + 1) for i in range(size)]
+    for a, b, r in zip(net.edge_a, net.edge_b, net.resistance):
+        for p, q in ((a, b), (b, a)):
+            if p in index:
+                matrix[index[p]][index[p]] += 1 / r
+                if q in index:
+                    matrix[index[p]][index[q]] -= 1 / r
+    for node in net.inlets:
+        matrix[index[node]][size] += flow.DEFAULT_INLET_FLOW
+    for k in range(size):
+        for i in range(k + 1, size):
+            f = matrix[i][k] / matrix[k][k]
+            if f:
+                matrix[i] = [v - f * w for v, w in zip(matrix[i], matrix[k])]
+    pressure = [0.0] * size
+    for i in range(size - 1, -1, -1):
+        pressure[i] = (matrix[i][size] - sum(matrix[i][j] * pressure[j] for j in range(i + 1, size))) / matrix[i][i]
+    return {node: pressure[index[node]] for node in free}
+
+
+def test_inlet_pressure_matches_dense_solve():
+    net = network(output_num=12)
+    pressures = dense_pressures(net)
+    assert flow.solve(net).inlet_pressure == pytest.approx(max(pressures[node] for node in net.inlets), rel=1e-7)
+
+
+def test_iterations_do_not_grow_with_stages():
+    iterations = [flow.solve(network(output_num=n)).iterations for n in (8, 24, 48)]
+    assert max(iterations) <= 30
+    assert iterations[-1] - iterations[0] <= 8
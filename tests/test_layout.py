@@ -0,0 +1,116 @@
+# Layout coordinates against the drawing code of the original script.
+# baseline_resistor_part and baseline_stage are gen_resistor_part and the connecting channel of
+# draw_grad_stage from the first version of GradientGenerator.py, with the Fusion calls replaced by
+# tuples, so the layout engine has to reproduce them point for point.
+import pytest
+
+from gradlib import layout, params
+
+
+def baseline_resistor_part(x, y, channel_width, curve_rad, resistor_width):
+    # (curves, new origin) where curves are ('line', start, end) or ('arc', start, mid, end)
+    curves = []
+    top_left = (x - channel_width / 2, y)
+    top_right = (x + resistor_width / 2, y)
+    bottom_left = (x - channel_width / 2, y + channel_width)
+    bottom_right = (x + resistor_width / 2, y + channel_width)
+    curves.append(('line', top_left, top_right))
+    curves.append(('line', bottom_left, bottom_right))
+
+    # -- Outer and inner arc
+    curves.append(('arc', (bottom_right[0], top_left[1]),
+                   (bottom_right[0] + curve_rad + channel_width / 2, top_left[1] + channel_width / 2 + curve_rad),
+                   (bottom_right[0], top_left[1] + curve_rad * 2 + channel_width)))
+    curve_end = (bottom_right[0], top_left[1] + curve_rad * 2)
+    curves.append(('arc', (bottom_right[0], top_left[1] + channel_width),
+                   (bottom_right[0] + curve_rad - channel_width / 2, top_left[1] + channel_width / 2 + curve_rad),
+                   curve_end))
+
+    bottom_left = (curve_end[0] - resistor_width, curve_end[1])
+    top_left = (curve_end[0] - resistor_width, curve_end[1] + channel_width)
+    top_right = (curve_end[0], curve_end[1] + channel_width)
+    curves.append(('line', top_left, top_right))
+    curves.append(('line', curve_end, bottom_left))
+
+    # -- Outer and inner arc
+    curves.append(('arc', (top_left[0], top_left[1] - channel_width),
+                   (top_left[0] - curve_rad - channel_width / 2, top_left[1] + curve_rad - channel_width / 2),
+                   (top_left[0], top_left[1] + curve_rad * 2)))
+    curve_end = (top_left[0], top_left[1] + curve_rad * 2 - channel_width)
+    curves.append(('arc', top_left,
+                   (top_left[0] - curve_rad + channel_width / 2, top_left[1] + curve_rad - channel_width / 2),
+                   curve_end))
+
+    bottom_right = (curve_end[0] + resistor_width / 2 - channel_width / 2, curve_end[1])
+    bottom_left = curve_end
+    top_right = (curve_end[0] + resistor_width / 2 - channel_width / 2, curve_end[1] + channel_width)
+    top_left = (curve_end[0], curve_end[1] + channel_width)
+    curves.append(('line', top_left, top_right))
+    curves.append(('line', bottom_right, bottom_left))
+    return curves, (curve_end[0] + resistor_width / 2, curve_end[1])
+
+
+def baseline_stage(x, y, unit_num, connect_width, channel_width):
+    # (serpentine origin, connecting channel corners, next origin) of a stage at (x, y)
+    left_end = (x - (unit_num - 1) * connect_width / 2, y)
+    right_end = (x + (unit_num - 1) * connect_width / 2, y + channel_width)
+    return left_end, (left_end, right_end), (x, y + 0.5)
+
+
+def curve_of(row):
+    kind, x0, y0, xm, ym, x1, y1 = row[:7]
+    if kind == layout.ARC:
+        return ('arc', (x0, y0), (xm, ym), (x1, y1))
+    return ('line', (x0, y0), (x1, y1))
+
+
+def flat(curve):
+    return [curve[0]] + [v for point in curve[1:] for v in point]
+
+
+@pytest.mark.parametrize('channel_width, curve_rad, resistor_width', [
+    (0.02, 0.02, 0.3),
+    (0.01, 0.05, 0.2),
+    (0.05, 0.03, 0.45),
+])
+def test_resistor_part_matches_baseline(channel_width, curve_rad, resistor_width):
+    table = layout.PrimitiveTable()
+    x, y = 0.125, -0.25
+    # Chained turns also check the origin each turn hands on to the next one
+    for turn in range(3):
+        expected, origin = baseline_resistor_part(x, y, channel_width, curve_rad, resistor_width)
+        start = len(table)
+        x, y = layout.resistor_part(table, x, y, channel_width, curve_rad, resistor_width, 7)
+        rows = list(table.rows())[start:]
+        assert [flat(curve_of(row)) for row in rows] == [pytest.approx(flat(c), abs=1e-12) for c in expected]
+        assert all(row[7] == 7 and row[8] == layout.PROFILE_RESISTOR for row in rows)
+        assert (x, y) == pytest.approx(origin, abs=1e-12)
+
+
+def test_stage_positions_match_baseline():
+    stages = layout.grad_generator(2, 6, 0.02, 2, 0.02)
+    x, y = 0.0, 0.0
+    for stage in stages:
+        serpentine, connect, next_origin = baseline_stage(x, y, stage.unit_num, 0.5, 0.02)
+        assert stage.origin == pytest.approx(serpentine)
+        assert stage.pitch == 0.5
+        assert stage.copies == stage.unit_num
+        bounds = stage.template.select((layout.PROFILE_CONNECT,)).bounds()
+        assert bounds == pytest.approx(connect[0] + connect[1])
+        assert stage.next_origin == pytest.approx(next_origin)
+        x, y = stage.next_origin
+    assert [stage.unit_num for stage in stages] == [3, 4, 5, 6]
+
+
+@pytest.mark.parametrize('values, valid', [
+    ({}, True),
+    ({'resistor_num': 5}, True),
+    # Straights of 100 um, shorter than the 200 um channel
+    ({'resistor_num': 6}, False),
+    # No turn, the resistor profile would have no area
+    ({'resistor_num': 0}, False),
+    ({'resistor_radius': 100}, False),
+    ({'output_num': 2}, False),
+])
+def test_check_params(values, valid):
+    assert (not params.GradParams(**values).check()) == valid
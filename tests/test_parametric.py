@@ -0,0 +1,47 @@
+# User parameters of the parametric build mode, and the stage moves that keep it centred.
+import pytest
+
+from gradlib import fake_adsk, parametric, params
+
+
+def evaluate(expression: str, ladder_width: float) -> float:
+    # Value in um of an expression of gg1_ladder_width
+    return eval(expression.replace(parametric.parameter_name('ladder_width', 1), repr(ladder_width))
+                .replace(' um', ''))
+
+
+def test_user_parameters_keep_every_digit():
+    values = params.GradParams(channel_height=123.4567, ladder_width=5000.125)
+    expressions = {name: expression for name, expression, unit, comment in parametric.user_parameters(values, 2)}
+    assert expressions['gg2_channel_height'] == '123.4567 um'
+    assert expressions['gg2_ladder_width'] == '5000.125 um'
+    assert expressions['gg2_resistor_num'] == '2'
+
+
+def test_user_parameters_that_drive_nothing_are_informational():
+    for name, expression, unit, comment in parametric.user_parameters(params.GradParams(), 1):
+        field = name[len('gg1_'):]
+        assert (parametric.INFORMATIONAL in comment) == (field not in parametric.EDITABLE)
+
+
+@pytest.mark.parametrize('unit_num', [2, 3, 8])
+def test_centre_shift_keeps_stage_centred(unit_num):
+    built, edited = 5000, 6200
+    shift = parametric.centre_shift(unit_num, built, 1)
+    assert evaluate(shift, built) == 0
+    # Left end of the connecting channel after the edit, relative to the stage centre
+    left = -(unit_num - 1) * built / 2 + evaluate(shift, edited)
+    assert left == pytest.approx(-(unit_num - 1) * edited / 2)
+
+
+def test_parametric_stages_move_with_the_ladder_width():
+    script = fake_adsk.load_script()
+    recorder = fake_adsk.reset()
+    design = fake_adsk.Design()
+    script.draw_grad_generator(design, params.GradParams(output_num=5), script.BUILD_PARAMETRIC)
+    generator = script.find_generator(design)
+    stages = [occ.component for occ, spec in script.stage_occurrences(generator.component)]
+    assert [comp.features.moveFeatures.count for comp in stages] == [1] * len(stages)
+    moves = [comp.features.moveFeatures.item(0).timeline_item for comp in stages]
+    assert all(parametric.parameter_name('ladder_width', 1) in ''.join(item.expressions()) for item in moves)
+    assert recorder.recompute(parametric.parameter_name('ladder_width', 1)) > 0
@@ -0,0 +1,68 @@
+# Union of channel polygons: overlaps, junctions, holes and a whole stage outline.
+import pytest
+
+from gradlib import layout, params, polygon
+
+
+def rect(x0, y0, x1, y1):
+    return [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+
+
+def areas(loops):
+    return sorted(polygon.signed_area(loop) for loop in loops)
+
+
+def test_overlapping_rectangles():
+    loops = polygon.union([rect(0, 0, 2, 1), rect(1, 0.5, 3, 2)])
+    assert len(loops) == 1
+    assert len(loops[0]) == 8
+    assert areas(loops) == [pytest.approx(2 + 3 - 0.5)]
+
+
+def test_clockwise_and_duplicate_polygons():
+    square = rect(0, 0, 1, 1)
+    assert areas(polygon.union([square[::-1], square])) == [pytest.approx(1)]
+
+
+def test_disjoint_rectangles_stay_apart():
+    loops = polygon.union([rect(0, 0, 1, 1), rect(2, 0, 3, 1)])
+    assert areas(loops) == [pytest.approx(1), pytest.approx(1)]
+
+
+def test_t_junction():
+    # Feed channel abutting the middle of a connecting channel, the shared edge disappears
+    loops = polygon.union([rect(-1, 0, 1, 0.2), rect(-0.1, 0.2, 0.1, 1)])
+    assert len(loops) == 1
+    assert len(loops[0]) == 8
+    assert areas(loops) == [pytest.approx(0.4 + 0.16)]
+    assert polygon.outer_bounds(loops) == [pytest.approx((-1, 0, 1, 1))]
+
+
+def test_region_with_hole():
+    # Four channels around a square: an outer loop counter clockwise and a hole clockwise
+    frame = [rect(0, 0, 3, 1), rect(2, 0, 3, 3), rect(0, 2, 3, 3), rect(0, 0, 1, 3)]
+    loops = polygon.union(frame)
+    assert areas(loops) == [pytest.approx(-1), pytest.approx(9)]
+    assert sum(areas(loops)) == pytest.approx(8)
+    assert len(polygon.outer_bounds(loops)) == 1
+
+
+@pytest.mark.parametrize('index', [0, 1, 2])
+def test_stage_outline(index):
+    variant = params.GradParams()
+    stage = variant.stages()[index]
+    loops = polygon.stage_outline(stage)
+    assert len(loops) == 1
+    # The serpentine copies only overlap the connecting channel where their feeds join it:
+    # half a feed at either end, a whole one for every copy in between. Snapping to the grid moves
+    # the area by well under a part per million.
+    pieces = sum(abs(polygon.signed_area(p)) for p in polygon.table_polygons(layout.expand_stage(stage)))
+    width = variant.channel_width / params.UM_PER_CM
+    overlap = 2 * width * width / 2 + (stage.unit_num - 2) * width * width
+    assert polygon.signed_area(loops[0]) == pytest.approx(pieces - overlap, rel=1e-6)
+
+
+def test_outline_table_lines():
+    loops = polygon.union([rect(0, 0, 2, 1), rect(1, 0.5, 3, 2)])
+    table = polygon.outline_table(loops, stage=3)
+    assert len(table) == 8
@@ -0,0 +1,93 @@
+# Stage diffing of gradlib.rebuild, and updates of a generator built on the fake Fusion API.
+import pytest
+
+from gradlib import fake_adsk, params, rebuild
+
+
+def test_diff_stages_keeps_matching_specs():
+    diff = rebuild.diff_stages([('a', 's1'), ('b', 's2'), ('c', 's3')], ['s1', 's3', 's4'])
+    assert diff.keep == [('a', 0), ('c', 1)]
+    assert diff.delete == ['b']
+    assert diff.build == [2]
+
+
+def test_diff_stages_keeps_one_of_duplicates():
+    diff = rebuild.diff_stages([('a', 's1'), ('b', 's1')], ['s1'])
+    assert diff.keep == [('a', 0)]
+    assert diff.delete == ['b']
+    assert diff.build == []
+
+
+def test_diff_stages_without_existing_stages_builds_all():
+    diff = rebuild.diff_stages([], ['s1', 's2'])
+    assert diff == rebuild.StageDiff([], [], [0, 1])
+
+
+def test_stage_spec_ignores_output_num():
+    values = params.GradParams(output_num=8)
+    stages = values.stages()
+    more = values.replace(output_num=9).stages()
+    assert [rebuild.stage_spec(values, s, 'mode') for s in stages] == \
+           [rebuild.stage_spec(values, s, 'mode') for s in more[:-1]]
+    # Parameters that shape a stage and the build mode are part of its spec
+    assert rebuild.stage_spec(values.replace(channel_width=150), stages[0], 'mode') != \
+           rebuild.stage_spec(values, stages[0], 'mode')
+    assert rebuild.stage_spec(values, stages[0], 'other') != rebuild.stage_spec(values, stages[0], 'mode')
+
+
+@pytest.fixture(scope='module')
+def script():
+    return fake_adsk.load_script()
+
+
+def stage_specs(script, generator):
+    return sorted(spec for occ, spec in script.stage_occurrences(generator.component))
+
+
+@pytest.mark.parametrize('mode', ['BUILD_PATTERN', 'BUILD_MERGED', 'BUILD_PARAMETRIC', 'BUILD_INSTANCED'])
+def test_rebuild_to_one_more_output_builds_one_stage(script, mode):
+    build_mode = getattr(script, mode)
+    recorder = fake_adsk.reset()
+    design = fake_adsk.Design()
+    values = params.GradParams(output_num=8)
+    script.draw_grad_generator(design, values, build_mode)
+    generator = script.find_generator(design)
+    before = recorder.calls.copy()
+    components = len(recorder.components)
+
+    updated = script.draw_grad_generator(design, values.replace(output_num=9), build_mode, generator)
+
+    assert updated is generator
+    assert design.rootComponent.occurrences.count == 1
+    assert recorder.calls['Occurrences.addNewComponent'] - before['Occurrences.addNewComponent'] == 1
+    assert recorder.calls['Occurrence.deleteMe'] == 0
+    # Only the new stage, an instanced update places the template of the kept stages
+    assert len(recorder.components) == components + 1
+    # Same stages as a generator built with 9 outputs from scratch
+    fresh = fake_adsk.Design()
+    script.draw_grad_generator(fresh, values.replace(output_num=9), build_mode)
+    assert stage_specs(script, generator) == stage_specs(script, script.find_generator(fresh))
+    assert len(stage_specs(script, generator)) == 7
+
+
+def test_rebuild_with_other_channel_width_replaces_every_stage(script):
+    recorder = fake_adsk.reset()
+    design = fake_adsk.Design()
+    values = params.GradParams(output_num=5)
+    script.draw_grad_generator(design, values, script.BUILD_PATTERN)
+    generator = script.find_generator(design)
+    script.draw_grad_generator(design, values.replace(channel_width=150), script.BUILD_PATTERN, generator)
+    assert recorder.calls['Occurrence.deleteMe'] == 3
+    assert generator.component.occurrences.count == 3
+
+
+def test_rebuild_to_one_output_less_only_deletes(script):
+    recorder = fake_adsk.reset()
+    design = fake_adsk.Design()
+    values = params.GradParams(output_num=9)
+    script.draw_grad_generator(design, values, script.BUILD_PATTERN)
+    before = recorder.calls['Occurrences.addNewComponent']
+    script.draw_grad_generator(design, values.replace(output_num=8), script.BUILD_PATTERN,
+                               script.find_generator(design))
+    assert recorder.calls['Occurrences.addNewComponent'] == before
+    assert recorder.calls['Occurrence.deleteMe'] == 1